@@ -1,18 +1,39 @@
 import os
 import re
+import functools
 import socket
-import struct
 import NetTask
 import time
 import threading
 import subprocess
 import sys
+
+if __name__ == "__main__":
+    # AlertFlow e execute_tasks importam NMS_AGENT: registar este módulo sob esse nome
+    # garante que partilham o mesmo canal fiável (números de sequência e retransmissões).
+    sys.modules["NMS_AGENT"] = sys.modules[__name__]
+
 import AlertFlow
 import execute_tasks
+from alert_channel import AlertChannel
+from result_batcher import ResultBatcher
+from probe_scheduler import ProbeScheduler
+from job_scheduler import JobScheduler
+from hardware_sampler import HardwareSampler
+import probe_engine
 
-n_s = 0
 MAX_ATTEMPTS = 5 
-array_n_s = []  
+RETRY_TIMEOUT = 2
+WINDOW_SIZE = 64
+BANDWIDTH_TIMEOUT_MARGIN = 30
+COMPRESSION = True
+canal = None
+canal_alertas = None
+batcher = None
+tarefas = {}
+agenda = JobScheduler()
+sondas = ProbeScheduler(agenda, probe_engine.medir)
+amostrador = HardwareSampler(agenda)
 
 udp_host = '127.0.0.1'  
 udp_port = 65433        
@@ -23,7 +44,8 @@ tcp_port = 65432
 
 def send_via_socket(udp_socket, host, port, data):
     """
-    Envia uma mensagem via socket UDP.
+    Envia o resultado de uma task ao servidor. O resultado é agrupado com os das restantes
+    threads de medição e enviado num lote (opcode 1).
 
     Parâmetros:
     ----------
@@ -41,22 +63,36 @@ def send_via_socket(udp_socket, host, port, data):
     None
     """
 
-    global n_s, array_n_s
-    n_s += 1
-    message = NetTask.criar_protocolo_udp(n_s, "001", data)
-    array_n_s.append([n_s, message, time.time(), 0])
-    udp_socket.sendto(message, (host, port))
+    batcher.adicionar(data)
+
+
+def enviar_lote(lote):
+    """
+    Envia um lote de resultados ao servidor pelo canal fiável.
+
+    Parâmetros:
+    ----------
+    lote : bytes
+        O lote criado por `NetTask.criar_lote_resultados`.
+
+    Retorno:
+    -------
+    None
+    """
+
+    canal.enviar_mensagem((udp_host, udp_port), NetTask.OP_RESULTADO, lote)
 
 def set_limits(ns, task, udp_socket, host, port):
     """
     Define os limites de monitoramento para um dispositivo.
+    Se a task já estiver em execução, a sua configuração é atualizada no lugar e os seus jobs são reagendados.
 
     Parâmetros:
     ----------
     ns : int
         Número de sequência do pacote.
-    task : str
-        Dados da tarefa no formato `"{FREQUENCY}-{CPU}-{M_CPU}-{RAM}-{M_RAM}-{INTERFACES}-{M_IS}-{M_PL}-{M_JI}-{tasks}"`.
+    task : memoryview
+        Dados da mensagem de task, descodificados com `NetTask.descodificar_task`.
     udp_socket : socket
         Socket UDP para enviar mensagens.
     host : str
@@ -69,52 +105,33 @@ def set_limits(ns, task, udp_socket, host, port):
     None
     """
 
-    FREQUENCY, = struct.unpack("!I", task[:4])
-    M_CPU, = struct.unpack("!f", task[4:8])
-    M_RAM, = struct.unpack("!f", task[8:12])
-    INTERFACES_LEN, = struct.unpack("!I", task[12:16])
-    INTERFACES = task[16:16+INTERFACES_LEN].decode('utf-8')
-    M_IS, = struct.unpack("!I", task[16+INTERFACES_LEN:20+INTERFACES_LEN])
-    M_PL, = struct.unpack("!f", task[20+INTERFACES_LEN:24+INTERFACES_LEN])
-    M_JI, = struct.unpack("!f", task[24+INTERFACES_LEN:28+INTERFACES_LEN])
-    LEN_LATENCY, = struct.unpack("!I", task[28+INTERFACES_LEN:32+INTERFACES_LEN])
-    latency = task[32+INTERFACES_LEN:32+INTERFACES_LEN+LEN_LATENCY].decode('utf-8')
-    LEN_BANDWIDTH, = struct.unpack("!I", task[32+INTERFACES_LEN+LEN_LATENCY:36+INTERFACES_LEN+LEN_LATENCY])
-    bandwidth = task[36+INTERFACES_LEN+LEN_LATENCY:36+INTERFACES_LEN+LEN_LATENCY+LEN_BANDWIDTH].decode('utf-8')
-    LEN_JITTER, = struct.unpack("!I", task[36+INTERFACES_LEN+LEN_LATENCY+LEN_BANDWIDTH:40+INTERFACES_LEN+LEN_LATENCY+LEN_BANDWIDTH])
-    jitter = task[40+INTERFACES_LEN+LEN_LATENCY+LEN_BANDWIDTH:40+INTERFACES_LEN+LEN_LATENCY+LEN_BANDWIDTH+LEN_JITTER].decode('utf-8')
-    LEN_PACKET_LOSS, = struct.unpack("!I", task[40+INTERFACES_LEN+LEN_LATENCY+LEN_BANDWIDTH+LEN_JITTER:44+INTERFACES_LEN+LEN_LATENCY+LEN_BANDWIDTH+LEN_JITTER])
-    packet_loss = task[44+INTERFACES_LEN+LEN_LATENCY+LEN_BANDWIDTH+LEN_JITTER:44+INTERFACES_LEN+LEN_LATENCY+LEN_BANDWIDTH+LEN_JITTER+LEN_PACKET_LOSS].decode('utf-8')
-
-    thread = threading.Thread(target=execute_tasks.execute_ping, args=(ns, latency, udp_socket, host, port))
-    thread.daemon = True
-    thread.start()
-
-    thread = threading.Thread(target=execute_tasks.execute_packet_loss, args=(ns, packet_loss, udp_socket, host, port))
-    thread.daemon = True
-    thread.start()
+    config = NetTask.descodificar_task(task)
 
-    thread = threading.Thread(target=execute_tasks.execute_jitter, args=(ns, jitter, udp_socket, host, port))
-    thread.daemon = True
-    thread.start()
+    tarefa = tarefas.get(config.task_id)
+    if tarefa is not None:
+        tarefa["ns"] = ns
+        tarefa["config"] = config
+        agendar_task(tarefa, udp_socket, host, port)
+        print(f"Task {config.task_id} atualizada.")
+        return
 
-    thread = threading.Thread(target=execute_tasks.execute_bandwidth, args=(ns, bandwidth, udp_socket, host, port))
-    thread.daemon = True
-    thread.start()
+    tarefa = {"ns": ns, "config": config, "sondas": [], "ciclos": 0, "medicoes_servidor": [],
+              "alertas": {}}
+    tarefas[config.task_id] = tarefa
+    agendar_task(tarefa, udp_socket, host, port)
 
 
-    thread = threading.Thread(target=AlertFlow.control_hardware, args=(FREQUENCY, M_CPU, M_RAM, INTERFACES, M_IS, M_PL, M_JI))
-    thread.daemon = True
-    thread.start()
-
-
-
-def resend_unacknowledged_packets(udp_socket, host, port):
+def agendar_task(tarefa, udp_socket, host, port):
     """
-    Reenvia pacotes que não receberam ACK após 2 segundos.
+    Agenda as medições de uma task: latência, perda de pacotes, jitter e o ping ao servidor do
+    AlertFlow no `ProbeScheduler`, e o iperf e a verificação de hardware no `JobScheduler`.
+    As subscrições anteriores da task são substituídas e os seus jobs reagendados com a
+    configuração atual (ex: após uma atualização).
 
     Parâmetros:
     ----------
+    tarefa : dict
+        A task em execução.
     udp_socket : socket
         Socket UDP para enviar mensagens.
     host : str
@@ -127,28 +144,80 @@ def resend_unacknowledged_packets(udp_socket, host, port):
     None
     """
 
-    global array_n_s
-    current_time = time.time()
+    for subscricao in tarefa["sondas"]:
+        sondas.cancelar(subscricao)
+    tarefa["sondas"] = []
+
+    config = tarefa["config"]
+    for ping_config, consumidor in ((config.latency, execute_tasks.publicar_latencia),
+                                    (config.packet_loss, execute_tasks.publicar_perda),
+                                    (config.jitter, execute_tasks.publicar_jitter)):
+        destination, packet_count, frequency = ping_config.split(":")
+        callback = functools.partial(consumidor, tarefa, udp_socket, host, port)
+        tarefa["sondas"].append(sondas.subscrever(destination, int(packet_count), int(frequency), callback))
+    tarefa["sondas"].append(sondas.subscrever(tcp_host, config.frequency, config.frequency,
+                                              tarefa["medicoes_servidor"].append))
+
+    _, _, duration, _, frequency = config.bandwidth.split(":")
+    agenda.agendar((config.task_id, "bandwidth"),
+                   functools.partial(execute_tasks.execute_bandwidth, tarefa, udp_socket, host, port),
+                   periodo=int(frequency), timeout=max(int(frequency), int(duration)) + BANDWIDTH_TIMEOUT_MARGIN)
+    agenda.agendar((config.task_id, "hardware"), functools.partial(AlertFlow.control_hardware, tarefa),
+                   periodo=config.frequency)
+
+
+def remove_task(task_id):
+    """
+    Termina as medições de uma task removida da configuração do servidor (opcode 3).
 
-    for packet_info in array_n_s:
-        packet_n_s, message, timestamp, attempts = packet_info
+    Parâmetros:
+    ----------
+    task_id : str
+        O identificador da task.
+
+    Retorno:
+    -------
+    None
+    """
+
+    tarefa = tarefas.pop(task_id, None)
+    if tarefa is None:
+        return
+
+    agenda.cancelar_task(task_id)
+    for subscricao in tarefa["sondas"]:
+        sondas.cancelar(subscricao)
+    print(f"Task {task_id} removida.")
 
-        if current_time - timestamp > 2 and attempts < MAX_ATTEMPTS:
-            udp_socket.sendto(message, (host, port))
-            
-            packet_info[2] = current_time
-            packet_info[3] += 1
 
-        if attempts >= MAX_ATTEMPTS:
-            n_s, opcao, dados = NetTask.interpretar_protocolo_udp(message)
-            if opcao == 0: 
-                print("Conexão não estabelecida. Programa Encerrado")
-                os._exit(0)
-            elif opcao == 5: 
-                print("Conexão perdida. Programa Encerrado")
-                os._exit(0)
-            print(f"Pacote {packet_n_s} não recebeu confirmação após {MAX_ATTEMPTS} tentativas. Removendo.")
-            array_n_s.remove(packet_info)
+
+def pacote_descartado(chave, message, addr):
+    """
+    Chamada pelo canal fiável quando um pacote esgota as tentativas.
+    Sem confirmação do registo ou do keep-alive o agente é encerrado.
+
+    Parâmetros:
+    ----------
+    chave : tuple
+        A chave (peer, n_s) do pacote.
+    message : bytes
+        O pacote descartado.
+    addr : tuple
+        O endereço do servidor.
+
+    Retorno:
+    -------
+    None
+    """
+
+    packet_n_s, opcao, dados = NetTask.interpretar_protocolo_udp(message)
+    if opcao == NetTask.OP_REGISTO: 
+        print("Conexão não estabelecida. Programa Encerrado")
+        os._exit(0)
+    elif opcao == NetTask.OP_KEEP_ALIVE: 
+        print("Conexão perdida. Programa Encerrado")
+        os._exit(0)
+    print(f"Pacote {packet_n_s} não recebeu confirmação após {MAX_ATTEMPTS} tentativas. Removendo.")
 
 
 def send_keep_alive(udp_socket, host, port):
@@ -169,16 +238,7 @@ def send_keep_alive(udp_socket, host, port):
     None
     """
 
-    global n_s
-    n_s += 1
-    message = NetTask.criar_protocolo_udp(n_s, "101", "")
-
-    array_n_s.append([n_s, message, time.time(), 0]) 
-
-    if len(array_n_s) > 10:
-        array_n_s.pop(0)
-
-    udp_socket.sendto(message, (host, port))
+    canal.enviar_mensagem((host, port), NetTask.OP_KEEP_ALIVE, "")
 
 
 def monitor_user_input(terminate_event):
@@ -215,13 +275,29 @@ def udp_client():
     None
     """
 
-    global n_s, array_n_s, udp_host, udp_port
+    global canal, canal_alertas, batcher, udp_host, udp_port
+
+    canal_alertas = AlertChannel(tcp_host, tcp_port)
+    canal_alertas.iniciar()
 
+    server = (udp_host, udp_port)
     udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    n_s += 1 
-    message = NetTask.criar_protocolo_udp(n_s, "000", "") 
-    array_n_s.append([n_s, message, time.time(), 0])
-    udp_socket.sendto(message, (udp_host, udp_port))
+    canal = NetTask.CanalFiavel(udp_socket.sendto, RETRY_TIMEOUT, MAX_ATTEMPTS, pacote_descartado, WINDOW_SIZE)
+    canal.iniciar()
+
+    batcher = ResultBatcher(enviar_lote)
+    batcher.iniciar()
+
+    agenda.iniciar()
+    amostrador.iniciar()
+
+    try:
+        probe_engine.EchoResponder().iniciar()
+    except OSError as e:
+        print(f"Respondedor de eco não iniciado: {e}")
+
+    # anuncia as capacidades; só comprime os resultados depois de o servidor as aceitar
+    canal.enviar_mensagem(server, NetTask.OP_REGISTO, NetTask.CAPACIDADES if COMPRESSION else "")
     last_keep_alive_time = time.time()
 
     print("NMS_CLIENT Iniciado (UDP e TCP)")
@@ -231,6 +307,10 @@ def udp_client():
     input_thread = threading.Thread(target=monitor_user_input, args=(terminate_event,))
     input_thread.start()
 
+    udp_socket.settimeout(0.5)
+    buffers = NetTask.BufferPool(NetTask.tamanho_rececao(udp_host))
+    buffer = buffers.obter()
+
     while not terminate_event.is_set():
         current_time = time.time()
 
@@ -238,75 +318,87 @@ def udp_client():
             send_keep_alive(udp_socket, udp_host, udp_port)
             last_keep_alive_time = current_time
 
-        resend_unacknowledged_packets(udp_socket, udp_host, udp_port)
-        udp_socket.settimeout(0.5)
-
         try:
-            while True:
-                data = b''
-                chunk, addr = udp_socket.recvfrom(1024) 
-                data += chunk
-
-                if b'\0' in data:
-                    break
+            # os handlers descodificam os dados de imediato: o mesmo buffer serve todos os datagramas
+            data, addr = NetTask.receber_datagrama(udp_socket, buffer)
+            if data is None:
+                continue
 
             n_s_response, opcao, dados = NetTask.interpretar_protocolo_udp(data)
+            if opcao == NetTask.OP_FRAGMENTO:
+                data = canal.remontar(server, data)
+                if data is None:
+                    continue
+                n_s_response, opcao, dados = NetTask.interpretar_protocolo_udp(data)
+
+            if opcao == NetTask.OP_ACK:
+                canal.processar_ack(server, n_s_response, dados)
+
+            elif opcao == NetTask.OP_SALTAR:
+                canal.processar_salto(server, n_s_response)
 
-            if opcao == 4:
-                for packet_info in array_n_s:
-                    if packet_info[0] == int(n_s_response):
-                        array_n_s.remove(packet_info)
-                        break
+            elif opcao == NetTask.OP_REGISTO:
+                if canal.receber(server, n_s_response, opcao):
+                    if NetTask.interpretar_capacidades(dados) & NetTask.CAP_ZLIB:
+                        canal.ativar_compressao(server)
 
-            elif opcao == 2:
-                response = NetTask.criar_protocolo_udp(int(n_s_response), "100", "")
-                udp_socket.sendto(response, (udp_host, udp_port))
-                set_limits(n_s, dados, udp_socket, udp_host, udp_port)           
+            elif opcao == NetTask.OP_TASK:
+                if canal.receber(server, n_s_response, opcao):
+                    set_limits(n_s_response, dados, udp_socket, udp_host, udp_port)           
+
+            elif opcao == NetTask.OP_REMOVER_TASK:
+                if canal.receber(server, n_s_response, opcao):
+                    remove_task(str(dados, 'utf-8'))
 
         except socket.timeout:
             continue
+        except ValueError as e:
+            print(f"Mensagem inválida do servidor: {e}")
     
-    response = NetTask.criar_protocolo_udp(n_s, "111", "")
-    udp_socket.sendto(response, (udp_host, udp_port))
-
-    data = b''
-    while True:
-        chunk, addr = udp_socket.recvfrom(1024)
-        data += chunk
+    batcher.esvaziar()
+    canal.enviar_mensagem(server, NetTask.OP_FIM, "")
+    deadline = time.time() + RETRY_TIMEOUT * (MAX_ATTEMPTS + 1)
 
-        if b'\0' in data:
-            break
+    while canal.pendentes(server) > 0 and time.time() < deadline:
+        try:
+            data, addr = NetTask.receber_datagrama(udp_socket, buffer)
+        except socket.timeout:
+            continue
+        if data is None:
+            continue
 
-        n_s_response, opcao, dados = NetTask.interpretar_protocolo_udp(data)
+        try:
+            n_s_response, opcao, dados = NetTask.interpretar_protocolo_udp(data)
+        except ValueError as e:
+            print(f"Mensagem inválida do servidor: {e}")
+            continue
+        if opcao == NetTask.OP_ACK:
+            canal.processar_ack(server, n_s_response, dados)
     
-    if opcao == 4 and int(n_s_response) == n_s:
+    if canal.pendentes(server) == 0:
         print("Conexão UDP encerrada com sucesso.")
     else:
         print("Erro ao encerrar conexão UDP.")
 
+    buffers.devolver(buffer)
     udp_socket.close()
+    canal_alertas.esvaziar(RETRY_TIMEOUT)
     terminate_event.set()
 
 
 
 def tcp_send(message):
     """
-    Gerencia a comunicação TCP com o servidor, enviando uma mensagem especificada.
+    Envia uma mensagem ao servidor pela conexão TCP persistente de alertas.
+    A mensagem é colocada em fila e enviada em lote pela thread do canal.
 
     Parâmetros:
     ----------
     message : str
         A mensagem a ser enviada ao servidor.
     """
-    
-    global tcp_host, tcp_port
-
-    try:
-        with socket.create_connection((tcp_host, tcp_port)) as tcp_socket:
-                tcp_socket.sendall(message.encode())
 
-    except Exception as e:
-        print(f"Erro na comunicação TCP: {e}")
+    canal_alertas.enviar(message)
 
 
 
@@ -1,81 +1,194 @@
 import json
+import socket
 import struct
+import sys
+import threading
+import time
+import itertools
+import zlib
+from functools import lru_cache
+from collections import OrderedDict, deque, namedtuple
+from retransmission import RetransmissionScheduler
 
-def criar_protocolo_udp(n_s, opcao, dados):
+OP_REGISTO = 0
+OP_RESULTADO = 1
+OP_TASK = 2
+OP_REMOVER_TASK = 3
+OP_ACK = 4
+OP_KEEP_ALIVE = 5
+OP_FRAGMENTO = 6
+OP_FIM = 7
+OP_SALTAR = 8
+
+WINDOW_SIZE = 64
+ACK_EVERY = 16
+ACK_DELAY = 0.2
+SACK_BITS = WINDOW_SIZE
+OPCODES_ACK_IMEDIATO = (OP_REGISTO, OP_KEEP_ALIVE, OP_FIM)
+TCP_MAX_MESSAGE = 1024 * 1024
+MTU = 1500
+UDP_MAX_DATAGRAM = MTU - 28
+UDP_MAX_PAYLOAD = UDP_MAX_DATAGRAM - 6
+UDP_MAX_SIZE = 65507
+RECV_BUFFERS = 4
+REASSEMBLY_TIMEOUT = 5.0
+REASSEMBLY_MAX_PENDING = 16
+REASSEMBLY_MAX_BYTES = 1024 * 1024
+IP_MTU = getattr(socket, "IP_MTU", 14)
+FLAG_COMPRIMIDO = 0x80
+CAP_ZLIB = 0x01
+CAPACIDADES = CAP_ZLIB
+OPCODES_COMPRIMIVEIS = (OP_RESULTADO, OP_TASK, OP_REMOVER_TASK)
+COMPRESSION_THRESHOLD = 64
+COMPRESSION_LEVEL = 6
+COMPRESSION_MEMLEVEL = 4
+COMPRESSION_WBITS = -zlib.MAX_WBITS
+
+CABECALHO = struct.Struct("!IB")
+NUMERO_SEQUENCIA = struct.Struct("!I")
+CABECALHO_VAZIO = struct.Struct("!IBx")
+CABECALHO_REGISTO = struct.Struct("!IBBx")
+ACK = struct.Struct("!IBQx")
+SACK = struct.Struct("!Q")
+TASK_LIMITES_HW = struct.Struct("!IffI")
+TASK_LIMITES_REDE = struct.Struct("!IffI")
+COMPRIMENTO = struct.Struct("!I")
+LOTE_COMPRIMENTO = struct.Struct("!H")
+FRAGMENTO = struct.Struct("!HH")
+
+ConfigTask = namedtuple("ConfigTask", [
+    "frequency", "m_cpu", "m_ram", "interfaces", "m_is", "m_pl", "m_ji",
+    "latency", "bandwidth", "jitter", "packet_loss", "task_id",
+])
+
+@lru_cache(maxsize=1024)
+def _estrutura_texto(tamanho):
+    return struct.Struct(f"!IB{tamanho}sx")
+
+
+@lru_cache(maxsize=256)
+def _estrutura_task(interfaces, latency, bandwidth, jitter, packet_loss, task_id):
+    return struct.Struct(f"!IBIffI{interfaces}sIffI{latency}sI{bandwidth}sI{jitter}sI{packet_loss}sI{task_id}sx")
+
+
+def _ler_texto(vista, pos):
+    tamanho, = COMPRIMENTO.unpack_from(vista, pos)
+    pos += COMPRIMENTO.size
+    return str(vista[pos:pos + tamanho], 'utf-8'), pos + tamanho
+
+
+def criar_protocolo_udp(n_s, opcao, dados, comprimir=False):
     """
     Cria uma mensagem de protocolo para uma conexão UDP.
 
+    Cada formato de mensagem é codificado por um `struct.Struct` pré-compilado (em cache
+    pelos comprimentos dos campos variáveis), numa única chamada e sem concatenações.
+
     Parâmetros:
     ----------
     n_s : int
         O número de sequência da mensagem, usado para identificar a ordem das mensagens.
-    opcao : str
-        O código ou a identificação da operação a ser realizada (ex: "GET", "POST", etc.).
-    dados : str
-        Os dados ou informações a serem transmitidos na mensagem.
+    opcao : int
+        O opcode da mensagem (`OP_REGISTO`, `OP_RESULTADO`, `OP_TASK`, `OP_REMOVER_TASK`, `OP_KEEP_ALIVE` ou `OP_FIM`).
+    dados : ConfigTask, bytes, str ou int
+        A configuração da task (`OP_TASK`), os dados do resultado (`OP_RESULTADO`), o task_id a remover
+        (`OP_REMOVER_TASK`), as capacidades anunciadas (`OP_REGISTO`, ex: `CAPACIDADES`), ou ignorado
+        nos restantes opcodes.
+    comprimir : bool, opcional
+        Se True, os dados são comprimidos com `comprimir_mensagem`.
 
     Retorno:
     -------
-    str
-        A mensagem formatada no padrão `"{n_s}|{opcao}|{dados}"`
+    bytes
+        A mensagem: `n_s` (4 bytes), opcode (1 byte), dados e o terminador `\0`.
     """
 
-    if (opcao == "000" or opcao == "101" or opcao == "100" or opcao == "111"):
-    
-        opcao_inteiro = int(opcao, 2)
-        protocolo = struct.pack('!IB', n_s, opcao_inteiro)
-        protocolo += b'\0'
-    
-    elif opcao == "010":
-        opcao_inteiro = int(opcao, 2)
-        
-        FREQUENCY, M_CPU, M_RAM, INTERFACES, M_IS, M_PL, M_JI, tasks = dados.split("-")
-        
-        latency, bandwidth, jitter, packet_loss = tasks.split("?")
-        
-        FREQUENCY = int(FREQUENCY)  
-        M_CPU = float(M_CPU)        
-        M_RAM = float(M_RAM)        
-        M_IS = int(M_IS)            
-        M_PL = float(M_PL)          
-        M_JI = float(M_JI)          
-        
-        INTERFACES = INTERFACES.strip("[]").replace("'", "").replace(" ", "")
+    if opcao == OP_TASK:
+        mensagem = codificar_task(n_s, dados)
+    elif opcao == OP_RESULTADO or opcao == OP_REMOVER_TASK:
+        if isinstance(dados, str):
+            dados = dados.encode('utf-8')
+        mensagem = _estrutura_texto(len(dados)).pack(n_s, opcao, dados)
+    elif opcao == OP_REGISTO and dados:
+        return CABECALHO_REGISTO.pack(n_s, opcao, dados)
+    else:
+        return CABECALHO_VAZIO.pack(n_s, opcao)
 
-        interfaces_len = len(INTERFACES)
-    
-        protocolo = struct.pack("!IBI", n_s, opcao_inteiro, FREQUENCY)
-        protocolo += struct.pack("!f", M_CPU)
-        protocolo += struct.pack("!f", M_RAM)
-        
-        
-        protocolo += struct.pack("!I", interfaces_len)
-        
-        protocolo += INTERFACES.encode('utf-8')
-        
-        protocolo += struct.pack("!I", M_IS)
-        protocolo += struct.pack("!f", M_PL)
-        protocolo += struct.pack("!f", M_JI)
+    return comprimir_mensagem(mensagem) if comprimir else mensagem
 
 
-        protocolo += struct.pack("!I", len(latency))
-        protocolo += latency.encode('utf-8')
-        protocolo += struct.pack("!I", len(bandwidth))
-        protocolo += bandwidth.encode('utf-8')
-        protocolo += struct.pack("!I", len(jitter))
-        protocolo += jitter.encode('utf-8')
-        protocolo += struct.pack("!I", len(packet_loss))
-        protocolo += packet_loss.encode('utf-8')
+def codificar_task(n_s, config):
+    """
+    Codifica uma mensagem de task (`OP_TASK`).
+
+    Parâmetros:
+    ----------
+    n_s : int
+        O número de sequência da mensagem.
+    config : ConfigTask
+        A configuração da task.
+
+    Retorno:
+    -------
+    bytes
+        A mensagem codificada.
+    """
+
+    interfaces = config.interfaces.encode('utf-8')
+    latency = config.latency.encode('utf-8')
+    bandwidth = config.bandwidth.encode('utf-8')
+    jitter = config.jitter.encode('utf-8')
+    packet_loss = config.packet_loss.encode('utf-8')
+    task_id = config.task_id.encode('utf-8')
+
+    estrutura = _estrutura_task(len(interfaces), len(latency), len(bandwidth), len(jitter), len(packet_loss), len(task_id))
+    return estrutura.pack(
+        n_s, OP_TASK, config.frequency, config.m_cpu, config.m_ram, len(interfaces), interfaces,
+        config.m_is, config.m_pl, config.m_ji, len(latency), latency, len(bandwidth), bandwidth,
+        len(jitter), jitter, len(packet_loss), packet_loss, len(task_id), task_id,
+    )
 
-        protocolo += b'\0'
 
-    elif opcao == "001":
-        opcao_inteiro = int(opcao, 2)
-        protocolo = struct.pack('!IB', n_s, opcao_inteiro)
-        protocolo += dados.encode('utf-8')
-        protocolo += b'\0'
+def descodificar_task(dados):
+    """
+    Descodifica os dados de uma mensagem de task (`OP_TASK`), sem copiar o datagrama.
 
-    return protocolo
+    Parâmetros:
+    ----------
+    dados : bytes ou memoryview
+        Os dados da mensagem, tal como devolvidos por `interpretar_protocolo_udp`.
+
+    Retorno:
+    -------
+    ConfigTask
+        A configuração da task.
+
+    Exceções:
+    --------
+    ValueError
+        Se os dados estiverem truncados ou mal formados.
+    """
+
+    vista = memoryview(dados)
+    try:
+        frequency, m_cpu, m_ram, tamanho = TASK_LIMITES_HW.unpack_from(vista, 0)
+        pos = TASK_LIMITES_HW.size
+        interfaces = str(vista[pos:pos + tamanho], 'utf-8')
+        pos += tamanho
+        m_is, m_pl, m_ji, tamanho = TASK_LIMITES_REDE.unpack_from(vista, pos)
+        pos += TASK_LIMITES_REDE.size
+        latency = str(vista[pos:pos + tamanho], 'utf-8')
+        pos += tamanho
+        bandwidth, pos = _ler_texto(vista, pos)
+        jitter, pos = _ler_texto(vista, pos)
+        packet_loss, pos = _ler_texto(vista, pos)
+        task_id, pos = _ler_texto(vista, pos)
+    except struct.error as e:
+        raise ValueError(f"Task mal formada: {e}") from e
+    if pos > len(vista):
+        raise ValueError("Task truncada.")
+
+    return ConfigTask(frequency, m_cpu, m_ram, interfaces, m_is, m_pl, m_ji, latency, bandwidth, jitter, packet_loss, task_id)
 
 
 def interpretar_protocolo_udp(mensagem):
@@ -84,21 +197,188 @@ def interpretar_protocolo_udp(mensagem):
 
     Parâmetros:
     ----------
-    mensagem : str
+    mensagem : bytes, bytearray ou memoryview
         A mensagem recebida.
 
     Retorno:
     -------
     tuple
-        Uma tupla contendo o número de sequência, a opção e os dados da mensagem.
+        Uma tupla contendo o número de sequência, o opcode e os dados da mensagem. Os dados são
+        uma `memoryview` sobre a mensagem original, sem o terminador `\0`. As mensagens comprimidas
+        são descomprimidas e devolvidas com o opcode original.
+
+    Exceções:
+    --------
+    ValueError
+        Se a mensagem for mais curta do que o cabeçalho, ou se os dados comprimidos forem inválidos
+        ou excederem `REASSEMBLY_MAX_BYTES` descomprimidos.
     """
-    
-    n_s, = struct.unpack("!I", mensagem[:4])
-    opcao, = struct.unpack("!B", mensagem[4:5])
-    dados = mensagem[5:]
+
+    if len(mensagem) < CABECALHO.size:
+        raise ValueError(f"Mensagem com {len(mensagem)} bytes, mais curta do que o cabeçalho.")
+    n_s, opcao = CABECALHO.unpack_from(mensagem)
+    if len(mensagem) > CABECALHO.size and mensagem[-1] == 0:
+        dados = memoryview(mensagem)[CABECALHO.size:-1]
+    else:
+        dados = memoryview(mensagem)[CABECALHO.size:]
+
+    if opcao & FLAG_COMPRIMIDO:
+        return n_s, opcao & ~FLAG_COMPRIMIDO, memoryview(_descomprimir(dados))
     return n_s, opcao, dados
 
 
+@lru_cache(maxsize=1)
+def dicionario_compressao():
+    """
+    Devolve o dicionário pré-definido do zlib, construído a partir de mensagens típicas do NetTask.
+
+    O dicionário tem o corpo de uma task codificada e um lote com os resultados mais comuns dos
+    agentes, pelo que mesmo um lote pequeno encontra quase todo o seu texto em referências para
+    trás. Ambos os lados têm de usar o mesmo dicionário: alterá-lo exige uma nova capacidade (ex: `CAP_ZLIB` v2).
+
+    Parâmetros:
+    ----------
+    None
+
+    Retorno:
+    -------
+    bytes
+        O dicionário.
+    """
+
+    task = codificar_task(0, ConfigTask(
+        frequency=5, m_cpu=80.0, m_ram=90.0, interfaces="eth0,eth1,eth2", m_is=2000, m_pl=5.0, m_ji=100.0,
+        latency="8.8.8.8:5:30", bandwidth="client:192.168.1.1:10:TCP:30",
+        jitter="8.8.4.4:10:15", packet_loss="8.8.4.4:10:20", task_id="task-1",
+    ))
+    # as sequências mais frequentes ficam no fim, onde as distâncias são menores
+    resultados = criar_lote_resultados([
+        "1€Falha ao obter latência para 8.8.8.8\n",
+        "1€Falha ao calcular jitter para 8.8.4.4 (dados insuficientes).\n",
+        "1€Throughput de 10.0.0.1 para 192.168.1.1: 94.1 Mbits/sec\n",
+        "1€Perda de pacotes para 8.8.4.4: 0%\n",
+        "1€Jitter para 8.8.4.4: 0.25 ms\n",
+        "1€Latência média para 8.8.8.8: 12.34 ms\n",
+    ])
+    return task[CABECALHO.size:-1] + resultados
+
+
+def comprimir_mensagem(mensagem):
+    """
+    Comprime os dados de uma mensagem com zlib (deflate sem cabeçalho) e o dicionário pré-definido.
+
+    Só são comprimidos os opcodes de `OPCODES_COMPRIMIVEIS` com pelo menos `COMPRESSION_THRESHOLD`
+    bytes de dados, e só quando o resultado fica mais pequeno. A mensagem comprimida mantém o
+    cabeçalho e o terminador `\0`, com o bit `FLAG_COMPRIMIDO` ativo no opcode, pelo que o número de
+    sequência continua a poder ser preenchido com `NUMERO_SEQUENCIA.pack_into`.
+
+    Parâmetros:
+    ----------
+    mensagem : bytes ou bytearray
+        A mensagem codificada (ex: por `criar_protocolo_udp`).
+
+    Retorno:
+    -------
+    bytes ou bytearray
+        A mensagem comprimida, ou a original se não compensar comprimi-la.
+    """
+
+    n_s, opcao = CABECALHO.unpack_from(mensagem)
+    if opcao not in OPCODES_COMPRIMIVEIS or len(mensagem) - CABECALHO.size - 1 < COMPRESSION_THRESHOLD:
+        return mensagem
+
+    compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, COMPRESSION_WBITS, COMPRESSION_MEMLEVEL,
+                                  zdict=dicionario_compressao())
+    dados = compressor.compress(memoryview(mensagem)[CABECALHO.size:-1]) + compressor.flush()
+    if len(dados) >= len(mensagem) - CABECALHO.size - 1:
+        return mensagem
+    return _estrutura_texto(len(dados)).pack(n_s, opcao | FLAG_COMPRIMIDO, dados)
+
+
+def _descomprimir(dados):
+    descompressor = zlib.decompressobj(COMPRESSION_WBITS, zdict=dicionario_compressao())
+    try:
+        resultado = descompressor.decompress(dados, REASSEMBLY_MAX_BYTES)
+    except zlib.error as e:
+        raise ValueError(f"Dados comprimidos inválidos: {e}") from e
+    if not descompressor.eof or descompressor.unconsumed_tail:
+        raise ValueError("Dados comprimidos incompletos ou demasiado grandes.")
+    return resultado
+
+
+def interpretar_capacidades(dados):
+    """
+    Lê as capacidades anunciadas num registo (opcode 0).
+
+    Parâmetros:
+    ----------
+    dados : bytes ou memoryview
+        Os dados do registo.
+
+    Retorno:
+    -------
+    int
+        O bitmap de capacidades (ex: `CAP_ZLIB`), 0 se o agente não anunciou nenhuma.
+    """
+
+    return dados[0] if len(dados) else 0
+
+
+def criar_mensagem_tcp(mensagem):
+    """
+    Cria uma mensagem TCP (AlertFlow) com prefixo de comprimento.
+
+    Parâmetros:
+    ----------
+    mensagem : str
+        O texto da mensagem.
+
+    Retorno:
+    -------
+    bytes
+        O comprimento da mensagem em 4 bytes (big-endian) seguido da mensagem em UTF-8.
+    """
+
+    dados = mensagem.encode('utf-8')
+    return struct.pack("!I", len(dados)) + dados
+
+
+def extrair_mensagens_tcp(buffer):
+    """
+    Extrai as mensagens completas de um buffer de receção TCP, removendo-as do buffer.
+
+    Parâmetros:
+    ----------
+    buffer : bytearray
+        Os bytes recebidos e ainda não interpretados.
+
+    Retorno:
+    -------
+    list
+        As mensagens completas, em bytes. Os bytes de uma mensagem incompleta ficam no buffer.
+
+    Exceções:
+    --------
+    ValueError
+        Se o comprimento anunciado exceder `TCP_MAX_MESSAGE`.
+    """
+
+    mensagens = []
+    inicio = 0
+
+    while len(buffer) - inicio >= 4:
+        tamanho, = struct.unpack_from("!I", buffer, inicio)
+        if tamanho > TCP_MAX_MESSAGE:
+            raise ValueError(f"Mensagem TCP demasiado grande: {tamanho} bytes.")
+        if len(buffer) - inicio - 4 < tamanho:
+            break
+        mensagens.append(bytes(buffer[inicio + 4:inicio + 4 + tamanho]))
+        inicio += 4 + tamanho
+
+    del buffer[:inicio]
+    return mensagens
+
+
 def preparar_tasks(json_file_path):
     """
     Prepara os dados de tarefas de monitoramento para serem enviados ao servidor.
@@ -110,7 +390,7 @@ def preparar_tasks(json_file_path):
     Retorno:
     -------
     list
-        Uma lista de strings contendo os protocolos de tarefas de monitoramento.
+        Uma lista de tuplos (device_id, task_id, ConfigTask) com as tarefas de monitoramento.
     """
     
     with open(json_file_path, 'r') as file:
@@ -132,30 +412,853 @@ def preparar_tasks(json_file_path):
             latency = link_metrics["latency"]["ping"]
             alertflow_conditions = link_metrics["alertflow_conditions"]
 
-            device_protocol = f"{device_id};{task_id};{frequency}-"
-            
-            if device_metrics["cpu_usage"]:
-                device_protocol += f"{alertflow_conditions['cpu_usage']}-"
-            else:
-                device_protocol += "0-"
-            
-            if device_metrics["ram_usage"]:
-                device_protocol += f"{alertflow_conditions['ram_usage']}-"
-            else:
-                device_protocol += "0-"
-
-            device_protocol += f"{device_metrics['interface_stats']}-"
-            device_protocol += f"{alertflow_conditions['interface_stats']}-"
-            device_protocol += f"{alertflow_conditions['packet_loss']}-"
-            device_protocol += f"{alertflow_conditions['jitter']}-"
-            device_protocol += f"{latency['destination']}:{latency['packet_count']}:{latency['frequency']}?"
-            device_protocol += f"{bandwidth['mode']}:{bandwidth['server_address']}:{bandwidth['duration']}:{bandwidth['transport_type']}:{bandwidth['frequency']}?"
-            device_protocol += f"{jitter['destination']}:{jitter['packet_count']}:{jitter['frequency']}?"
-            device_protocol += f"{packet_loss['destination']}:{packet_loss['packet_count']}:{packet_loss['frequency']}"
-
-            
-            protocols.append(device_protocol)
+            config = ConfigTask(
+                frequency=int(frequency),
+                m_cpu=float(alertflow_conditions['cpu_usage']) if device_metrics["cpu_usage"] else 0.0,
+                m_ram=float(alertflow_conditions['ram_usage']) if device_metrics["ram_usage"] else 0.0,
+                interfaces=",".join(device_metrics['interface_stats']),
+                m_is=int(alertflow_conditions['interface_stats']),
+                m_pl=float(alertflow_conditions['packet_loss']),
+                m_ji=float(alertflow_conditions['jitter']),
+                latency=f"{latency['destination']}:{latency['packet_count']}:{latency['frequency']}",
+                bandwidth=f"{bandwidth['mode']}:{bandwidth['server_address']}:{bandwidth['duration']}:{bandwidth['transport_type']}:{bandwidth['frequency']}",
+                jitter=f"{jitter['destination']}:{jitter['packet_count']}:{jitter['frequency']}",
+                packet_loss=f"{packet_loss['destination']}:{packet_loss['packet_count']}:{packet_loss['frequency']}",
+                task_id=task_id,
+            )
+
+            protocols.append((device_id, task_id, config))
 
     return protocols
 
 
+def compilar_catalogo(tasks):
+    """
+    Compila as tarefas devolvidas por `preparar_tasks` num catálogo indexado por dispositivo,
+    com as mensagens de task já codificadas, e também já comprimidas para os agentes que negociaram
+    compressão. Só o número de sequência é preenchido no envio.
+
+    Parâmetros:
+    ----------
+    tasks : list
+        Os tuplos (device_id, task_id, ConfigTask) devolvidos por `preparar_tasks`.
+
+    Retorno:
+    -------
+    dict
+        Um dicionário device_id -> lista de tuplos (task_id, mensagem de task com n_s a 0,
+        a mesma mensagem passada por `comprimir_mensagem`).
+    """
+
+    catalogo = {}
+    for device_id, task_id, config in tasks:
+        template = codificar_task(0, config)
+        catalogo.setdefault(device_id, []).append((task_id, template, comprimir_mensagem(template)))
+    return catalogo
+
+
+def comparar_tasks(antigas, novas):
+    """
+    Compara dois conjuntos de tarefas devolvidos por `preparar_tasks`, por (device_id, task_id).
+
+    Parâmetros:
+    ----------
+    antigas : list
+        As tarefas atualmente carregadas.
+    novas : list
+        As tarefas lidas de novo do ficheiro de configuração.
+
+    Retorno:
+    -------
+    tuple
+        Uma lista de tuplos (device_id, task_id, ConfigTask) com as tarefas novas ou alteradas,
+        e uma lista de tuplos (device_id, task_id) com as tarefas removidas.
+    """
+
+    anteriores = {(device_id, task_id): config for device_id, task_id, config in antigas}
+    atuais = {(device_id, task_id): config for device_id, task_id, config in novas}
+
+    alteradas = [(device_id, task_id, config) for (device_id, task_id), config in atuais.items()
+                 if anteriores.get((device_id, task_id)) != config]
+    removidas = [chave for chave in anteriores if chave not in atuais]
+
+    return alteradas, removidas
+
+
+def criar_lote_resultados(resultados):
+    """
+    Agrupa vários resultados de tasks nos dados de uma única mensagem (`OP_RESULTADO`).
+
+    Parâmetros:
+    ----------
+    resultados : list
+        Os resultados, cada um no formato `"{ns}€{texto}"`.
+
+    Retorno:
+    -------
+    bytes
+        O número de resultados em 2 bytes, seguido de cada resultado em UTF-8 precedido do seu comprimento em 2 bytes.
+    """
+
+    codificados = [resultado.encode('utf-8') for resultado in resultados]
+    lote = bytearray(LOTE_COMPRIMENTO.size * (len(codificados) + 1) + sum(len(dados) for dados in codificados))
+
+    LOTE_COMPRIMENTO.pack_into(lote, 0, len(codificados))
+    pos = LOTE_COMPRIMENTO.size
+    for dados in codificados:
+        LOTE_COMPRIMENTO.pack_into(lote, pos, len(dados))
+        pos += LOTE_COMPRIMENTO.size
+        lote[pos:pos + len(dados)] = dados
+        pos += len(dados)
+
+    return bytes(lote)
+
+
+def tamanho_no_lote(resultado):
+    """
+    Devolve o número de bytes que um resultado ocupa dentro de um lote.
+
+    Parâmetros:
+    ----------
+    resultado : str
+        O resultado.
+
+    Retorno:
+    -------
+    int
+    """
+
+    return LOTE_COMPRIMENTO.size + len(resultado.encode('utf-8'))
+
+
+def interpretar_lote_resultados(dados):
+    """
+    Extrai os resultados de um lote criado por `criar_lote_resultados`.
+
+    Parâmetros:
+    ----------
+    dados : bytes ou memoryview
+        Os dados da mensagem (opcode 1).
+
+    Retorno:
+    -------
+    list
+        Os resultados, em str.
+
+    Exceções:
+    --------
+    ValueError
+        Se o lote estiver truncado ou mal formado.
+    """
+
+    vista = memoryview(dados)
+    try:
+        quantidade, = LOTE_COMPRIMENTO.unpack_from(vista, 0)
+        resultados = []
+        pos = LOTE_COMPRIMENTO.size
+
+        for _ in range(quantidade):
+            tamanho, = LOTE_COMPRIMENTO.unpack_from(vista, pos)
+            pos += LOTE_COMPRIMENTO.size
+            if pos + tamanho > len(vista):
+                raise ValueError("Lote de resultados truncado.")
+            resultados.append(str(vista[pos:pos + tamanho], 'utf-8'))
+            pos += tamanho
+    except struct.error as e:
+        raise ValueError(f"Lote de resultados mal formado: {e}") from e
+
+    return resultados
+
+
+def criar_ack(cumulativo, sack):
+    """
+    Cria uma mensagem de ACK (opcode 4) com confirmação cumulativa e seletiva.
+
+    Parâmetros:
+    ----------
+    cumulativo : int
+        O maior número de sequência até ao qual todas as mensagens foram recebidas.
+    sack : int
+        Bitmap de `SACK_BITS` bits: o bit i indica que a mensagem `cumulativo + 2 + i` foi recebida.
+
+    Retorno:
+    -------
+    bytes
+        A mensagem de ACK.
+    """
+
+    return ACK.pack(cumulativo, OP_ACK, sack)
+
+
+def interpretar_ack(dados):
+    """
+    Extrai o bitmap SACK dos dados de uma mensagem de ACK.
+
+    Parâmetros:
+    ----------
+    dados : bytes ou memoryview
+        Os dados da mensagem de ACK (sem o cabeçalho).
+
+    Retorno:
+    -------
+    int
+        O bitmap SACK, ou 0 se a mensagem não o incluir.
+    """
+
+    if len(dados) < SACK.size:
+        return 0
+    sack, = SACK.unpack_from(dados, 0)
+    return sack
+
+
+def criar_salto(base):
+    """
+    Cria uma mensagem de salto (opcode 8), que indica ao recetor que o emissor desistiu de todas
+    as mensagens abaixo de `base` que ainda não foram recebidas.
+
+    Parâmetros:
+    ----------
+    base : int
+        O menor número de sequência que o emissor ainda tem por confirmar (ou o próximo a enviar).
+
+    Retorno:
+    -------
+    bytes
+        A mensagem de salto.
+    """
+
+    return CABECALHO_VAZIO.pack(base, OP_SALTAR)
+
+
+def tamanho_rececao(host):
+    """
+    Devolve o tamanho dos buffers de receção: o maior datagrama que cabe no MTU do caminho até
+    `host` (lido com IP_MTU, em Linux) ou, se o sistema não o indicar, `UDP_MAX_DATAGRAM`.
+
+    Parâmetros:
+    ----------
+    host : str
+        O endereço do peer (no servidor, o próprio endereço de escuta).
+
+    Retorno:
+    -------
+    int
+        O tamanho, em bytes.
+    """
+
+    if not sys.platform.startswith("linux"):
+        return UDP_MAX_DATAGRAM
+
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.connect((host, 9))
+            mtu = sock.getsockopt(socket.IPPROTO_IP, IP_MTU)
+    except OSError:
+        return UDP_MAX_DATAGRAM
+    return min(max(mtu - 28, UDP_MAX_DATAGRAM), UDP_MAX_SIZE)
+
+
+class BufferPool:
+    """
+    Conjunto de buffers de receção pré-alocados, para receber datagramas com `recvfrom_into`
+    sem criar objetos bytes por datagrama. Se o conjunto estiver vazio é criado um buffer novo,
+    que só é guardado na devolução se houver espaço para ele.
+
+    Cada buffer tem um byte a mais do que o maior datagrama aceite (`tamanho`), o que permite
+    a `receber_datagrama` detetar os datagramas truncados.
+    """
+
+    def __init__(self, tamanho, quantidade=RECV_BUFFERS):
+        self.tamanho = tamanho
+        self.quantidade = quantidade
+        self.livres = deque(bytearray(tamanho + 1) for _ in range(quantidade))
+
+    def obter(self):
+        """
+        Retira um buffer do conjunto.
+
+        Parâmetros:
+        ----------
+        None
+
+        Retorno:
+        -------
+        bytearray
+        """
+
+        try:
+            return self.livres.pop()
+        except IndexError:
+            return bytearray(self.tamanho + 1)
+
+    def devolver(self, buffer):
+        """
+        Devolve um buffer ao conjunto. Nenhuma memoryview sobre o buffer pode continuar em uso.
+
+        Parâmetros:
+        ----------
+        buffer : bytearray
+            O buffer obtido com `obter`.
+
+        Retorno:
+        -------
+        None
+        """
+
+        if len(self.livres) < self.quantidade:
+            self.livres.append(buffer)
+
+
+def receber_datagrama(sock, buffer):
+    """
+    Recebe um datagrama diretamente para um buffer pré-alocado.
+
+    Parâmetros:
+    ----------
+    sock : socket
+        O socket UDP.
+    buffer : bytearray
+        O buffer de receção, de um `BufferPool`.
+
+    Retorno:
+    -------
+    tuple
+        Uma memoryview sobre os bytes recebidos (ou None se o datagrama não coube no buffer e
+        foi truncado) e o endereço de origem.
+    """
+
+    tamanho, addr = sock.recvfrom_into(buffer)
+    if tamanho == len(buffer):
+        print(f"Datagrama de {addr[0]} descartado: excede o buffer de receção ({len(buffer)} bytes).")
+        return None, addr
+    return memoryview(buffer)[:tamanho], addr
+
+
+class Fragmentador:
+    """
+    Envolve a função de envio de um socket UDP: as mensagens maiores do que `tamanho_maximo`
+    são partidas em fragmentos (opcode 6), cada um com o identificador da mensagem no lugar do
+    número de sequência, seguido do índice do fragmento e do número total de fragmentos.
+    As mensagens que cabem num datagrama são enviadas sem alterações.
+    """
+
+    def __init__(self, enviar, tamanho_maximo=UDP_MAX_DATAGRAM):
+        self.enviar = enviar
+        self.tamanho_maximo = tamanho_maximo
+        self.tamanho_parte = tamanho_maximo - CABECALHO.size - FRAGMENTO.size
+        self.identificadores = itertools.count()
+
+    def __call__(self, mensagem, addr):
+        """
+        Envia uma mensagem, fragmentando-a se necessário.
+
+        Parâmetros:
+        ----------
+        mensagem : bytes
+            A mensagem completa.
+        addr : tuple
+            O endereço (ip, porta) de destino.
+
+        Retorno:
+        -------
+        None
+
+        Exceções:
+        --------
+        ValueError
+            Se a mensagem precisar de mais fragmentos do que o formato permite.
+        """
+
+        if len(mensagem) <= self.tamanho_maximo:
+            self.enviar(mensagem, addr)
+            return
+
+        total = -(-len(mensagem) // self.tamanho_parte)
+        if total > 0xFFFF:
+            raise ValueError(f"Mensagem demasiado grande para fragmentar: {len(mensagem)} bytes")
+
+        identificador = next(self.identificadores) & 0xFFFFFFFF
+        vista = memoryview(mensagem)
+        for indice in range(total):
+            parte = vista[indice * self.tamanho_parte:(indice + 1) * self.tamanho_parte]
+            fragmento = bytearray(CABECALHO.size + FRAGMENTO.size + len(parte))
+            CABECALHO.pack_into(fragmento, 0, identificador, OP_FRAGMENTO)
+            FRAGMENTO.pack_into(fragmento, CABECALHO.size, indice, total)
+            fragmento[CABECALHO.size + FRAGMENTO.size:] = parte
+            self.enviar(fragmento, addr)
+
+
+class FragmentReassembler:
+    """
+    Buffers de remontagem das mensagens fragmentadas, por peer.
+
+    Os fragmentos de uma mensagem são guardados até chegarem todos; uma mensagem incompleta é
+    descartada `timeout` segundos após o primeiro fragmento (a retransmissão do canal fiável
+    volta a enviá-la por inteiro). Cada peer pode ter no máximo `max_pendentes` mensagens
+    incompletas, e nenhuma mensagem pode exceder `max_bytes`, o que limita a memória que um
+    peer consegue ocupar.
+    """
+
+    def __init__(self, timeout=REASSEMBLY_TIMEOUT, max_pendentes=REASSEMBLY_MAX_PENDING,
+                 max_bytes=REASSEMBLY_MAX_BYTES):
+        self.timeout = timeout
+        self.max_pendentes = max_pendentes
+        self.max_bytes = max_bytes
+        self.pendentes = OrderedDict()
+        self.por_peer = {}
+        self.lock = threading.Lock()
+
+    def receber(self, peer, datagrama):
+        """
+        Guarda um fragmento e devolve a mensagem completa, se este for o último que faltava.
+
+        Parâmetros:
+        ----------
+        peer : tuple
+            O endereço (ip, porta) do peer.
+        datagrama : bytes ou memoryview
+            O datagrama do fragmento (opcode 6). Os dados são copiados, pelo que o buffer de
+            receção pode ser reutilizado.
+
+        Retorno:
+        -------
+        bytes or None
+            A mensagem remontada, ou None se ainda faltarem fragmentos (ou o fragmento for inválido).
+        """
+
+        if len(datagrama) < CABECALHO.size + FRAGMENTO.size:
+            return None
+        identificador, _ = CABECALHO.unpack_from(datagrama)
+        indice, total = FRAGMENTO.unpack_from(datagrama, CABECALHO.size)
+        parte = bytes(datagrama[CABECALHO.size + FRAGMENTO.size:])
+        if total == 0 or indice >= total:
+            return None
+
+        agora = time.monotonic()
+        chave = (peer, identificador)
+
+        with self.lock:
+            self._expirar(agora)
+
+            mensagem = self.pendentes.get(chave)
+            if mensagem is None:
+                if self.por_peer.get(peer, 0) >= self.max_pendentes:
+                    self._descartar(next(c for c in self.pendentes if c[0] == peer))
+                mensagem = self.pendentes[chave] = {"prazo": agora + self.timeout, "total": total,
+                                                    "partes": {}, "bytes": 0}
+                self.por_peer[peer] = self.por_peer.get(peer, 0) + 1
+
+            if mensagem["total"] != total or indice in mensagem["partes"]:
+                return None
+
+            mensagem["partes"][indice] = parte
+            mensagem["bytes"] += len(parte)
+            if mensagem["bytes"] > self.max_bytes:
+                print(f"Mensagem fragmentada de {peer[0]} descartada: excede {self.max_bytes} bytes.")
+                self._descartar(chave)
+                return None
+
+            if len(mensagem["partes"]) < total:
+                return None
+
+            self._descartar(chave)
+
+        return b"".join(mensagem["partes"][i] for i in range(total))
+
+    def _descartar(self, chave):
+        del self.pendentes[chave]
+        peer = chave[0]
+        self.por_peer[peer] -= 1
+        if self.por_peer[peer] == 0:
+            del self.por_peer[peer]
+
+    def _expirar(self, agora):
+        # os prazos são fixados no primeiro fragmento, pelo que a ordem de inserção é a ordem dos prazos
+        while self.pendentes:
+            chave, mensagem = next(iter(self.pendentes.items()))
+            if mensagem["prazo"] > agora:
+                break
+            self._descartar(chave)
+
+
+class CanalFiavel:
+    """
+    Camada de entrega fiável sobre UDP com janela deslizante por peer.
+
+    Cada peer tem o seu espaço de números de sequência em cada sentido. O emissor mantém até
+    `window_size` mensagens em voo e guarda as restantes numa fila, em vez de as descartar.
+    O recetor confirma com ACKs cumulativos e um bitmap SACK; as mensagens de dados são
+    confirmadas em conjunto (a cada `ack_every` mensagens ou após `ack_delay` segundos) e as
+    mensagens de controlo (registo, keep-alive, fim de conexão) de imediato. Duplicados são
+    confirmados mas não entregues. As mensagens são entregues pela ordem de chegada.
+
+    Quando o emissor desiste de uma mensagem, envia um salto (`OP_SALTAR`) com o menor número de
+    sequência que ainda tem por confirmar; quem recebe entrega-o a `processar_salto`, que avança o
+    ACK cumulativo para lá das mensagens abandonadas. O salto é repetido sempre que chega um ACK
+    parado numa mensagem abandonada, pelo que a perda do próprio salto não bloqueia a janela.
+
+    As mensagens maiores do que um datagrama são fragmentadas no envio (`Fragmentador`); quem
+    recebe entrega os fragmentos a `remontar` e trata a mensagem remontada como qualquer outra.
+    Para os peers que negociaram compressão no registo (`ativar_compressao`), os dados das
+    mensagens são comprimidos antes de serem fragmentados (`comprimir_mensagem`).
+    """
+
+    def __init__(self, enviar, retry_timeout, max_attempts, on_give_up=None,
+                 window_size=WINDOW_SIZE, ack_every=ACK_EVERY, ack_delay=ACK_DELAY):
+        self.enviar = Fragmentador(enviar)
+        self.remontagem = FragmentReassembler()
+        self.on_give_up = on_give_up
+        self.window_size = window_size
+        self.ack_every = ack_every
+        self.ack_delay = ack_delay
+
+        self.retransmissor = RetransmissionScheduler(self.enviar, retry_timeout, max_attempts, self._desistir)
+        self.envio = {}
+        self.rececao = {}
+        self.comprimidos = set()
+        self.lock = threading.Lock()
+
+    def iniciar(self):
+        """
+        Inicia a thread de retransmissão do canal.
+
+        Parâmetros:
+        ----------
+        None
+
+        Retorno:
+        -------
+        None
+        """
+
+        self.retransmissor.iniciar()
+
+    def remontar(self, peer, datagrama):
+        """
+        Entrega um fragmento (opcode 6) recebido de um peer ao seu buffer de remontagem.
+
+        Parâmetros:
+        ----------
+        peer : tuple
+            O endereço (ip, porta) do peer.
+        datagrama : bytes ou memoryview
+            O datagrama recebido.
+
+        Retorno:
+        -------
+        bytes or None
+            A mensagem completa, a interpretar com `interpretar_protocolo_udp`, ou None se ainda faltarem fragmentos.
+        """
+
+        return self.remontagem.receber(peer, datagrama)
+
+    def ativar_compressao(self, peer):
+        """
+        Passa a comprimir as mensagens enviadas a um peer, depois de este ter anunciado `CAP_ZLIB`.
+
+        Parâmetros:
+        ----------
+        peer : tuple
+            O endereço (ip, porta) do peer.
+
+        Retorno:
+        -------
+        None
+        """
+
+        self.comprimidos.add(peer)
+
+    def enviar_mensagem(self, peer, opcao, dados):
+        """
+        Envia uma mensagem de forma fiável, ou coloca-a em fila se a janela do peer estiver cheia.
+
+        Parâmetros:
+        ----------
+        peer : tuple
+            O endereço (ip, porta) do peer.
+        opcao : int
+            O opcode da mensagem (ex: `OP_RESULTADO`).
+        dados : ConfigTask, bytes ou str
+            Os dados da mensagem (ver `criar_protocolo_udp`).
+
+        Retorno:
+        -------
+        int
+            O número de sequência atribuído à mensagem.
+        """
+
+        return self.enviar_template(peer, criar_protocolo_udp(0, opcao, dados))
+
+    def enviar_template(self, peer, template, comprimido=None):
+        """
+        Envia de forma fiável uma mensagem já codificada, preenchendo apenas o seu número de sequência.
+
+        Parâmetros:
+        ----------
+        peer : tuple
+            O endereço (ip, porta) do peer.
+        template : bytes
+            A mensagem codificada (ex: de `compilar_catalogo`), com qualquer número de sequência.
+        comprimido : bytes, opcional
+            O `template` já passado por `comprimir_mensagem`, usado para os peers com compressão
+            em vez de o comprimir a cada envio.
+
+        Retorno:
+        -------
+        int
+            O número de sequência atribuído à mensagem.
+        """
+
+        if peer in self.comprimidos:
+            template = comprimido if comprimido is not None else comprimir_mensagem(template)
+        mensagem = bytearray(template)
+
+        with self.lock:
+            estado = self._estado_envio(peer)
+            n_s = estado["proximo"]
+            estado["proximo"] += 1
+            NUMERO_SEQUENCIA.pack_into(mensagem, 0, n_s)
+            estado["fila"].append((n_s, mensagem))
+            prontas = self._libertar_janela(peer, estado)
+
+        self._transmitir(peer, prontas)
+        return n_s
+
+    def processar_ack(self, peer, cumulativo, dados):
+        """
+        Processa um ACK recebido, libertando as mensagens confirmadas e avançando a janela.
+
+        Parâmetros:
+        ----------
+        peer : tuple
+            O endereço (ip, porta) do peer.
+        cumulativo : int
+            O número de sequência cumulativo do ACK.
+        dados : bytes
+            Os dados do ACK, com o bitmap SACK.
+
+        Retorno:
+        -------
+        None
+        """
+
+        sack = interpretar_ack(dados)
+
+        with self.lock:
+            estado = self.envio.get(peer)
+            if estado is None:
+                return
+
+            for n_s in list(estado["em_voo"]):
+                deslocamento = n_s - cumulativo - 2
+                if n_s <= cumulativo or (0 <= deslocamento < SACK_BITS and sack >> deslocamento & 1):
+                    estado["em_voo"].discard(n_s)
+                    self.retransmissor.confirmar((peer, n_s))
+
+            prontas = self._libertar_janela(peer, estado)
+            # o recetor está parado numa mensagem da qual já desistimos
+            base = self._base(estado)
+            salto = criar_salto(base) if cumulativo + 1 < base else None
+
+        self._transmitir(peer, prontas)
+        if salto is not None:
+            self.enviar(salto, peer)
+
+    def processar_salto(self, peer, base):
+        """
+        Processa um salto (opcode 8): as mensagens abaixo de `base` ainda não recebidas foram
+        abandonadas pelo emissor, pelo que o ACK cumulativo avança para lá delas.
+
+        Parâmetros:
+        ----------
+        peer : tuple
+            O endereço (ip, porta) do peer.
+        base : int
+            O menor número de sequência que o emissor ainda tem por confirmar.
+
+        Retorno:
+        -------
+        None
+        """
+
+        with self.lock:
+            estado = self.rececao.get(peer)
+            if estado is None or base - 1 <= estado["cumulativo"]:
+                return
+
+            estado["cumulativo"] = base - 1
+            estado["fora_de_ordem"] = {n_s for n_s in estado["fora_de_ordem"] if n_s > estado["cumulativo"]}
+            while estado["cumulativo"] + 1 in estado["fora_de_ordem"]:
+                estado["cumulativo"] += 1
+                estado["fora_de_ordem"].discard(estado["cumulativo"])
+            ack = self._criar_ack(estado)
+
+        self.enviar(ack, peer)
+
+    def receber(self, peer, n_s, opcao):
+        """
+        Regista a receção de uma mensagem e agenda a sua confirmação.
+
+        Parâmetros:
+        ----------
+        peer : tuple
+            O endereço (ip, porta) do peer.
+        n_s : int
+            O número de sequência da mensagem.
+        opcao : int
+            O opcode da mensagem.
+
+        Retorno:
+        -------
+        bool
+            True se a mensagem é nova e deve ser entregue, False se é duplicada.
+        """
+
+        ack = None
+        agendar = False
+
+        with self.lock:
+            estado = self.rececao.get(peer)
+            if estado is None:
+                estado = {"cumulativo": n_s - 1, "fora_de_ordem": set(), "por_confirmar": 0, "timer": False}
+                self.rececao[peer] = estado
+
+            nova = n_s > estado["cumulativo"] and n_s not in estado["fora_de_ordem"]
+            if nova:
+                if n_s == estado["cumulativo"] + 1:
+                    estado["cumulativo"] = n_s
+                    while estado["cumulativo"] + 1 in estado["fora_de_ordem"]:
+                        estado["cumulativo"] += 1
+                        estado["fora_de_ordem"].discard(estado["cumulativo"])
+                else:
+                    estado["fora_de_ordem"].add(n_s)
+                estado["por_confirmar"] += 1
+
+            imediato = (not nova or opcao in OPCODES_ACK_IMEDIATO or estado["fora_de_ordem"]
+                        or estado["por_confirmar"] >= self.ack_every)
+            if imediato:
+                ack = self._criar_ack(estado)
+            elif not estado["timer"]:
+                estado["timer"] = True
+                agendar = True
+
+        if ack is not None:
+            self.enviar(ack, peer)
+        if agendar:
+            self.retransmissor.chamar_depois(self.ack_delay, self._ack_atrasado, peer)
+
+        return nova
+
+    def reiniciar_peer(self, peer):
+        """
+        Descarta o estado de um peer (ex: quando o agente se regista de novo).
+
+        Parâmetros:
+        ----------
+        peer : tuple
+            O endereço (ip, porta) do peer.
+
+        Retorno:
+        -------
+        None
+        """
+
+        with self.lock:
+            estado = self.envio.pop(peer, None)
+            self.rececao.pop(peer, None)
+            self.comprimidos.discard(peer)
+            if estado is not None:
+                for n_s in estado["em_voo"]:
+                    self.retransmissor.confirmar((peer, n_s))
+
+    def pendentes(self, peer):
+        """
+        Devolve o número de mensagens por confirmar (em voo ou em fila) para um peer.
+
+        Parâmetros:
+        ----------
+        peer : tuple
+            O endereço (ip, porta) do peer.
+
+        Retorno:
+        -------
+        int
+        """
+
+        with self.lock:
+            estado = self.envio.get(peer)
+            if estado is None:
+                return 0
+            return len(estado["em_voo"]) + len(estado["fila"])
+
+    def _estado_envio(self, peer):
+        estado = self.envio.get(peer)
+        if estado is None:
+            estado = {"proximo": 1, "em_voo": set(), "fila": deque()}
+            self.envio[peer] = estado
+        return estado
+
+    def _base(self, estado):
+        if estado["em_voo"]:
+            return min(estado["em_voo"])
+        if estado["fila"]:
+            return estado["fila"][0][0]
+        return estado["proximo"]
+
+    def _libertar_janela(self, peer, estado):
+        base = min(estado["em_voo"]) if estado["em_voo"] else None
+        prontas = []
+        while estado["fila"]:
+            n_s, mensagem = estado["fila"][0]
+            if base is not None and n_s >= base + self.window_size:
+                break
+            estado["fila"].popleft()
+            estado["em_voo"].add(n_s)
+            if base is None:
+                base = n_s
+            self.retransmissor.agendar((peer, n_s), mensagem, peer)
+            prontas.append(mensagem)
+        return prontas
+
+    def _transmitir(self, peer, mensagens):
+        for mensagem in mensagens:
+            self.enviar(mensagem, peer)
+
+    def _criar_ack(self, estado):
+        cumulativo = estado["cumulativo"]
+        sack = 0
+        for n_s in estado["fora_de_ordem"]:
+            deslocamento = n_s - cumulativo - 2
+            if 0 <= deslocamento < SACK_BITS:
+                sack |= 1 << deslocamento
+        estado["por_confirmar"] = 0
+        return criar_ack(cumulativo, sack)
+
+    def _ack_atrasado(self, peer):
+        with self.lock:
+            estado = self.rececao.get(peer)
+            if estado is None:
+                return
+            estado["timer"] = False
+            if estado["por_confirmar"] == 0:
+                return
+            ack = self._criar_ack(estado)
+
+        self.enviar(ack, peer)
+
+    def _desistir(self, chave, mensagem, addr):
+        peer, n_s = chave
+        with self.lock:
+            estado = self.envio.get(peer)
+            prontas = []
+            salto = None
+            if estado is not None and n_s in estado["em_voo"]:
+                estado["em_voo"].discard(n_s)
+                prontas = self._libertar_janela(peer, estado)
+                salto = criar_salto(self._base(estado))
+
+        self._transmitir(peer, prontas)
+        if salto is not None:
+            self.enviar(salto, peer)
+        if self.on_give_up is not None:
+            self.on_give_up(chave, mensagem, addr)
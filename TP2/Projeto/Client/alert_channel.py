@@ -0,0 +1,150 @@
+import queue
+import socket
+import threading
+import time
+
+import NetTask
+
+ALERT_QUEUE_SIZE = 1000
+ALERT_BATCH_SIZE = 64
+ALERT_FLUSH_INTERVAL = 0.05
+RECONNECT_MIN = 0.5
+RECONNECT_MAX = 30
+
+
+class AlertChannel:
+    """
+    Conexão TCP persistente para o envio de alertas ao servidor.
+
+    Os alertas são colocados numa fila e enviados por uma thread dedicada, que os agrupa em
+    lotes: o primeiro alerta espera até `flush_interval` segundos pelos seguintes, e o lote
+    é escrito com um único `sendall`. A conexão é reaberta automaticamente, com espera
+    exponencial, quando falha; o lote em curso é reenviado na nova conexão.
+    """
+
+    def __init__(self, host, port, max_fila=ALERT_QUEUE_SIZE, max_lote=ALERT_BATCH_SIZE,
+                 flush_interval=ALERT_FLUSH_INTERVAL):
+        self.host = host
+        self.port = port
+        self.max_lote = max_lote
+        self.flush_interval = flush_interval
+
+        self.fila = queue.Queue(maxsize=max_fila)
+        self.sock = None
+        self.espera = RECONNECT_MIN
+        self.a_enviar = 0
+        self.vazia = threading.Condition()
+        self.thread = None
+
+    def iniciar(self):
+        """
+        Inicia a thread de envio.
+
+        Parâmetros:
+        ----------
+        None
+
+        Retorno:
+        -------
+        None
+        """
+
+        self.thread = threading.Thread(target=self._ciclo, daemon=True)
+        self.thread.start()
+
+    def enviar(self, mensagem):
+        """
+        Coloca um alerta na fila de envio. Se a fila estiver cheia, o alerta mais antigo é descartado.
+
+        Parâmetros:
+        ----------
+        mensagem : str
+            O alerta a enviar.
+
+        Retorno:
+        -------
+        None
+        """
+
+        with self.vazia:
+            self.a_enviar += 1
+
+        while True:
+            try:
+                self.fila.put_nowait(NetTask.criar_mensagem_tcp(mensagem))
+                return
+            except queue.Full:
+                try:
+                    self.fila.get_nowait()
+                    self._concluir(1)
+                    print("Fila de alertas cheia. Alerta mais antigo descartado.")
+                except queue.Empty:
+                    pass
+
+    def esvaziar(self, timeout):
+        """
+        Aguarda até que todos os alertas em fila tenham sido enviados.
+
+        Parâmetros:
+        ----------
+        timeout : float
+            O tempo máximo de espera, em segundos.
+
+        Retorno:
+        -------
+        bool
+            True se a fila ficou vazia, False se o tempo esgotou.
+        """
+
+        with self.vazia:
+            return self.vazia.wait_for(lambda: self.a_enviar == 0, timeout)
+
+    def _concluir(self, quantidade):
+        with self.vazia:
+            self.a_enviar -= quantidade
+            if self.a_enviar == 0:
+                self.vazia.notify_all()
+
+    def _recolher_lote(self):
+        lote = [self.fila.get()]
+        limite = time.monotonic() + self.flush_interval
+
+        while len(lote) < self.max_lote:
+            restante = limite - time.monotonic()
+            try:
+                if restante > 0:
+                    lote.append(self.fila.get(timeout=restante))
+                else:
+                    lote.append(self.fila.get_nowait())
+            except queue.Empty:
+                break
+
+        return lote
+
+    def _ligar(self):
+        while self.sock is None:
+            try:
+                self.sock = socket.create_connection((self.host, self.port))
+                self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.espera = RECONNECT_MIN
+            except OSError as e:
+                print(f"Erro na comunicação TCP: {e}. Nova tentativa em {self.espera:.1f} s.")
+                time.sleep(self.espera)
+                self.espera = min(self.espera * 2, RECONNECT_MAX)
+
+    def _ciclo(self):
+        while True:
+            lote = self._recolher_lote()
+            dados = b''.join(lote)
+
+            while True:
+                self._ligar()
+                try:
+                    self.sock.sendall(dados)
+                    break
+                except OSError as e:
+                    print(f"Conexão TCP perdida: {e}. A reconectar...")
+                    self.sock.close()
+                    self.sock = None
+
+            self._concluir(len(lote))
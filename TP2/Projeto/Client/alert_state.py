@@ -0,0 +1,97 @@
+import time
+
+ALERT_CLEAR_FRACTION = 0.9
+ALERT_HOLD_TIME = 10
+ALERT_REPEAT_INTERVAL = 300
+
+NORMAL = "normal"
+A_SUBIR = "a subir"
+ATIVO = "ativo"
+A_DESCER = "a descer"
+
+
+class AlertState:
+    """
+    Máquina de estados de um alerta do AlertFlow, com histerese: `normal -> a subir -> ativo -> a descer -> normal`.
+
+    O alerta dispara quando o valor fica acima do limite durante pelo menos `espera` segundos e
+    só recupera quando fica abaixo de `fracao_limpeza` do limite durante outros `espera` segundos,
+    pelo que um valor a oscilar em torno do limite não gera alertas repetidos. Enquanto o alerta
+    está ativo, as verificações são agregadas: a cada `repeticao` segundos é enviado um resumo com
+    a duração e o pico, em vez de um alerta por verificação. O início e a recuperação são sempre enviados.
+    """
+
+    def __init__(self, nome, unidade="", fracao_limpeza=ALERT_CLEAR_FRACTION, espera=ALERT_HOLD_TIME,
+                 repeticao=ALERT_REPEAT_INTERVAL):
+        self.nome = nome
+        self.unidade = unidade
+        self.fracao_limpeza = fracao_limpeza
+        self.espera = espera
+        self.repeticao = repeticao
+
+        self.estado = NORMAL
+        self.desde = None
+        self.ativo_desde = None
+        self.ultimo_envio = None
+        self.pico = None
+        self.verificacoes = 0
+
+    def avaliar(self, valor, limite, agora=None):
+        """
+        Avalia uma nova leitura da métrica.
+
+        Parâmetros:
+        ----------
+        valor : float
+            O valor lido.
+        limite : float
+            O limite de disparo do alerta (o valor configurado na task).
+        agora : float, opcional
+            O instante da leitura, em segundos monotónicos.
+
+        Retorno:
+        -------
+        str or None
+            A mensagem a enviar ao servidor (início, resumo ou recuperação), ou None.
+        """
+
+        agora = time.monotonic() if agora is None else agora
+        limpeza = limite * self.fracao_limpeza
+
+        if self.estado == NORMAL:
+            if valor <= limite:
+                return None
+            self.estado, self.desde, self.pico, self.verificacoes = A_SUBIR, agora, valor, 0
+
+        self.verificacoes += 1
+        self.pico = max(self.pico, valor)
+
+        if self.estado == A_SUBIR:
+            if valor <= limite:
+                self.estado = NORMAL
+                return None
+            if agora - self.desde < self.espera:
+                return None
+            self.estado, self.ativo_desde, self.ultimo_envio = ATIVO, self.desde, agora
+            return f"ALERT!!!: {self.nome}: {self._formatar(valor)} (limit {self._formatar(limite)})"
+
+        if self.estado == ATIVO and valor <= limpeza:
+            self.estado, self.desde = A_DESCER, agora
+        elif self.estado == A_DESCER and valor > limpeza:
+            self.estado = ATIVO
+
+        if self.estado == A_DESCER:
+            if agora - self.desde < self.espera:
+                return None
+            self.estado = NORMAL
+            return (f"RECOVERED: {self.nome} back to {self._formatar(valor)} after {self.desde - self.ativo_desde:.0f} s "
+                    f"above {self._formatar(limite)}, peak {self._formatar(self.pico)}")
+
+        if agora - self.ultimo_envio >= self.repeticao:
+            self.ultimo_envio = agora
+            return (f"ALERT!!!: {self.nome} > {self._formatar(limite)} for {agora - self.ativo_desde:.0f} s, "
+                    f"peak {self._formatar(self.pico)} ({self.verificacoes} checks)")
+        return None
+
+    def _formatar(self, valor):
+        return f"{round(valor, 2):g}{self.unidade}"
@@ -0,0 +1,49 @@
+"""
+Compara o débito de medições do motor de sondas nativo (`probe_engine`) com o caminho antigo,
+que lança `ping` num subprocesso e interpreta o seu output.
+
+Uso: python benchmark_probes.py [destino] [medições]
+"""
+
+import sys
+import time
+
+import probe_engine
+from probe_scheduler import medir_ping
+
+DESTINO = "127.0.0.1"
+MEDICOES = 200
+
+
+def cronometrar(nome, medir, destino, medicoes, pacotes):
+    inicio = time.perf_counter()
+    try:
+        for _ in range(medicoes):
+            medicao = medir(destino, pacotes)
+    except (OSError, RuntimeError) as e:
+        print(f"{nome:<28} indisponível: {e}")
+        return
+    duracao = time.perf_counter() - inicio
+    sondas = medicoes * pacotes
+    print(f"{nome:<28} {sondas / duracao:>10.0f} sondas/s  {duracao / medicoes * 1000:>8.2f} ms/medição  "
+          f"(perda {medicao.perda():.0f}%)")
+
+
+if __name__ == "__main__":
+    destino = sys.argv[1] if len(sys.argv) > 1 else DESTINO
+    medicoes = int(sys.argv[2]) if len(sys.argv) > 2 else MEDICOES
+
+    responder = probe_engine.EchoResponder()
+    try:
+        responder.iniciar()
+    except OSError as e:
+        print(f"Respondedor de eco local não iniciado: {e}")
+
+    print(f"{medicoes} medições de 1 pacote a {destino}")
+    cronometrar("subprocesso ping", medir_ping, destino, medicoes, 1)
+    cronometrar("nativo ICMP", lambda d, n: probe_engine.medir_icmp(d, n, 0), destino, medicoes, 1)
+    cronometrar("nativo UDP eco", lambda d, n: probe_engine.medir_udp(d, n, 0), destino, medicoes, 1)
+
+    print(f"\n{medicoes // 10} medições de 10 pacotes (sem intervalo entre pacotes) a {destino}")
+    cronometrar("nativo ICMP", lambda d, n: probe_engine.medir_icmp(d, n, 0), destino, medicoes // 10, 10)
+    cronometrar("nativo UDP eco", lambda d, n: probe_engine.medir_udp(d, n, 0), destino, medicoes // 10, 10)
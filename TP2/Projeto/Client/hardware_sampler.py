@@ -0,0 +1,119 @@
+import collections
+import threading
+import time
+
+import psutil
+
+SAMPLE_INTERVAL = 1.0
+SAMPLE_HISTORY = 3600
+
+
+class HardwareSampler:
+    """
+    Amostra o CPU, a RAM e os contadores das interfaces de rede com uma cadência fixa, num job
+    próprio do `JobScheduler` do agente, independente das medições de rede das tasks.
+
+    Cada métrica tem um buffer circular com as últimas `historico` amostras `(instante, valor)`:
+    `"cpu"` e `"ram"` em percentagem, e `"pacotes/{interface}"` e `"bytes/{interface}"` em
+    pacotes e bytes por segundo, calculados a partir da diferença entre duas leituras
+    consecutivas dos contadores cumulativos.
+    """
+
+    def __init__(self, agenda, intervalo=SAMPLE_INTERVAL, historico=SAMPLE_HISTORY):
+        self.agenda = agenda
+        self.intervalo = intervalo
+        self.historico = historico
+        self.series = {}
+        self.contadores = None
+        self.lock = threading.Lock()
+
+    def iniciar(self):
+        """
+        Agenda a amostragem periódica.
+
+        Parâmetros:
+        ----------
+        None
+
+        Retorno:
+        -------
+        None
+        """
+
+        # a primeira chamada de cpu_percent só estabelece a referência para a seguinte
+        psutil.cpu_percent(interval=None)
+        self.agenda.agendar(("hardware", "amostragem"), self._amostrar, periodo=self.intervalo,
+                            atraso=self.intervalo, timeout=None)
+
+    def _amostrar(self):
+        agora = time.monotonic()
+        valores = {"cpu": psutil.cpu_percent(interval=None), "ram": psutil.virtual_memory().percent}
+
+        contadores = psutil.net_io_counters(pernic=True)
+        if self.contadores is not None:
+            anterior, instante_anterior = self.contadores
+            duracao = agora - instante_anterior
+            for interface, stats in contadores.items():
+                antes = anterior.get(interface)
+                if antes is None or duracao <= 0:
+                    continue
+                pacotes = (stats.packets_recv + stats.packets_sent) - (antes.packets_recv + antes.packets_sent)
+                octetos = (stats.bytes_recv + stats.bytes_sent) - (antes.bytes_recv + antes.bytes_sent)
+                if pacotes < 0 or octetos < 0:
+                    # contador reiniciado (ex: interface recriada): espera-se pela leitura seguinte
+                    continue
+                valores[f"pacotes/{interface}"] = pacotes / duracao
+                valores[f"bytes/{interface}"] = octetos / duracao
+        self.contadores = (contadores, agora)
+
+        with self.lock:
+            for nome, valor in valores.items():
+                serie = self.series.get(nome)
+                if serie is None:
+                    serie = self.series[nome] = collections.deque(maxlen=self.historico)
+                serie.append((agora, valor))
+
+    def amostras(self, nome, janela=None):
+        """
+        Devolve as amostras recentes de uma métrica.
+
+        Parâmetros:
+        ----------
+        nome : str
+            A métrica (ex: `"cpu"` ou `"pacotes/eth0"`).
+        janela : float, opcional
+            Devolve apenas as amostras dos últimos `janela` segundos. Por omissão, todas as guardadas.
+
+        Retorno:
+        -------
+        list
+            Os valores, da amostra mais antiga para a mais recente.
+        """
+
+        with self.lock:
+            serie = list(self.series.get(nome, ()))
+
+        if janela is not None:
+            limite = time.monotonic() - janela
+            serie = [(instante, valor) for instante, valor in serie if instante >= limite]
+        return [valor for _, valor in serie]
+
+    def media(self, nome, janela=None):
+        """
+        Devolve a média de uma métrica numa janela recente.
+
+        Parâmetros:
+        ----------
+        nome : str
+            A métrica (ex: `"cpu"` ou `"pacotes/eth0"`).
+        janela : float, opcional
+            O número de segundos da janela. Por omissão, todas as amostras guardadas.
+
+        Retorno:
+        -------
+        float or None
+            A média, ou None se não houver amostras na janela.
+        """
+
+        valores = self.amostras(nome, janela)
+        return sum(valores) / len(valores) if valores else None
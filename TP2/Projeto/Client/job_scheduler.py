@@ -0,0 +1,215 @@
+import heapq
+import itertools
+import queue
+import threading
+import time
+
+JOB_WORKERS = 4
+JOB_TIMEOUT = 60
+JOB_MAX_REPLACEMENTS = 4
+
+
+class JobScheduler:
+    """
+    Agenda todos os jobs periódicos do agente (medições, iperf e AlertFlow) numa única heap de prazos.
+
+    Uma thread de despacho espera pelo prazo mais próximo e entrega os jobs vencidos a um conjunto
+    limitado de `trabalhadores`. Cada job é identificado por uma chave `(task_id, nome)`: agendar
+    de novo a mesma chave reagenda o job existente, e `cancelar_task` remove todos os jobs de uma
+    task. Um job nunca corre em paralelo consigo próprio, nem depois de cancelado: um job cancelado
+    durante uma execução fica registado até ela terminar, e um novo agendamento da mesma chave só
+    começa a seguir. Se uma execução exceder o `timeout` do
+    job, o trabalhador que a executa é dado como perdido e substituído por um novo, para que um
+    comando bloqueado não esgote o conjunto; o trabalhador perdido termina quando o job retornar.
+    Há no máximo `substitutos` trabalhadores perdidos de cada vez: os jobs devem impor os próprios
+    prazos (por exemplo, com o `timeout` dos subprocessos), e o timeout do job é só uma salvaguarda.
+    """
+
+    def __init__(self, trabalhadores=JOB_WORKERS, substitutos=JOB_MAX_REPLACEMENTS):
+        self.trabalhadores = trabalhadores
+        self.substitutos = substitutos
+        self.perdidos = 0
+        self.heap = []
+        self.jobs = {}
+        self.em_execucao = {}
+        self.contador = itertools.count()
+        self.cond = threading.Condition()
+        self.fila = queue.Queue()
+        self.thread = None
+
+    def iniciar(self):
+        """
+        Inicia a thread de despacho e os trabalhadores.
+
+        Parâmetros:
+        ----------
+        None
+
+        Retorno:
+        -------
+        None
+        """
+
+        for _ in range(self.trabalhadores):
+            self._novo_trabalhador()
+        self.thread = threading.Thread(target=self._despachar, daemon=True)
+        self.thread.start()
+
+    def agendar(self, chave, funcao, periodo=None, atraso=0, timeout=JOB_TIMEOUT):
+        """
+        Agenda um job, ou reagenda-o se a chave já existir (a função, o período e o timeout são substituídos).
+        Se o job estiver a correr, o novo prazo só conta depois de a execução em curso terminar.
+
+        Parâmetros:
+        ----------
+        chave : tuple
+            A chave `(task_id, nome)` do job.
+        funcao : callable
+            A função a executar, sem argumentos.
+        periodo : float, opcional
+            O intervalo, em segundos, entre execuções. None executa o job uma única vez.
+        atraso : float, opcional
+            O número de segundos até à próxima execução.
+        timeout : float, opcional
+            A duração máxima, em segundos, de uma execução. None desativa o limite.
+
+        Retorno:
+        -------
+        None
+        """
+
+        with self.cond:
+            job = self.jobs.get(chave)
+            if job is None:
+                job = self.jobs[chave] = {"chave": chave, "geracao": 0, "a_correr": False,
+                                          "reagendado": False, "expirado": False, "substituido": False,
+                                          "cancelado": False}
+
+            job.update(funcao=funcao, periodo=periodo, timeout=timeout, prazo=time.monotonic() + atraso,
+                       cancelado=False)
+            job["geracao"] += 1
+
+            if job["a_correr"]:
+                job["reagendado"] = True
+            else:
+                self._empilhar(job)
+            self.cond.notify()
+
+    def cancelar(self, chave):
+        """
+        Cancela um job. Uma execução em curso não é interrompida, mas o job não volta a ser agendado;
+        até ela terminar, o job fica na tabela como cancelado, para que um novo `agendar` da mesma
+        chave espere pelo fim da execução em vez de correr em paralelo com ela.
+
+        Parâmetros:
+        ----------
+        chave : tuple
+            A chave `(task_id, nome)` do job.
+
+        Retorno:
+        -------
+        None
+        """
+
+        with self.cond:
+            job = self.jobs.get(chave)
+            if job is None:
+                return
+
+            job["geracao"] += 1
+            job["reagendado"] = False
+            if job["a_correr"]:
+                job["cancelado"] = True
+            else:
+                del self.jobs[chave]
+
+    def cancelar_task(self, task_id):
+        """
+        Cancela todos os jobs de uma task.
+
+        Parâmetros:
+        ----------
+        task_id : str
+            O identificador da task.
+
+        Retorno:
+        -------
+        None
+        """
+
+        with self.cond:
+            chaves = [chave for chave in self.jobs if chave[0] == task_id]
+        for chave in chaves:
+            self.cancelar(chave)
+
+    def _empilhar(self, job):
+        heapq.heappush(self.heap, (job["prazo"], next(self.contador), job["geracao"], job))
+
+    def _novo_trabalhador(self):
+        threading.Thread(target=self._trabalhar, daemon=True).start()
+
+    def _despachar(self):
+        while True:
+            with self.cond:
+                agora = time.monotonic()
+
+                for job, timeout, expira in list(self.em_execucao.values()):
+                    if expira is not None and expira <= agora and not job["expirado"]:
+                        job["expirado"] = True
+                        if self.perdidos < self.substitutos:
+                            self.perdidos += 1
+                            job["substituido"] = True
+                            print(f"Job {job['chave']} excedeu o timeout de {timeout}s; a substituir o trabalhador.")
+                            self._novo_trabalhador()
+                        else:
+                            print(f"Job {job['chave']} excedeu o timeout de {timeout}s; "
+                                  f"limite de {self.substitutos} trabalhadores perdidos atingido.")
+
+                while self.heap and self.heap[0][0] <= agora:
+                    _, _, geracao, job = heapq.heappop(self.heap)
+                    if geracao != job["geracao"] or self.jobs.get(job["chave"]) is not job:
+                        continue
+                    job["a_correr"] = True
+                    job["expirado"] = False
+                    job["substituido"] = False
+                    expira = agora + job["timeout"] if job["timeout"] is not None else None
+                    self.em_execucao[id(job)] = (job, job["timeout"], expira)
+                    # a função é fixada no despacho: um reagendamento só afeta as execuções seguintes
+                    self.fila.put((job, job["funcao"]))
+
+                prazos = [prazo for _, _, prazo in self.em_execucao.values() if prazo is not None and prazo > agora]
+                if self.heap:
+                    prazos.append(self.heap[0][0])
+                self.cond.wait(min(prazos) - agora if prazos else None)
+
+    def _trabalhar(self):
+        while True:
+            job, funcao = self.fila.get()
+            try:
+                funcao()
+            except Exception as e:
+                print(f"Erro no job {job['chave']}: {e}")
+
+            with self.cond:
+                del self.em_execucao[id(job)]
+                job["a_correr"] = False
+                perdido = job["substituido"]
+                if perdido:
+                    self.perdidos -= 1
+
+                if self.jobs.get(job["chave"]) is job:
+                    if job["cancelado"]:
+                        del self.jobs[job["chave"]]
+                    elif job["reagendado"]:
+                        job["reagendado"] = False
+                        self._empilhar(job)
+                    elif job["periodo"] is not None:
+                        job["prazo"] = max(job["prazo"] + job["periodo"], time.monotonic())
+                        self._empilhar(job)
+                    else:
+                        del self.jobs[job["chave"]]
+                self.cond.notify()
+
+            if perdido:
+                # já foi criado um trabalhador para substituir este
+                return
@@ -0,0 +1,300 @@
+import errno
+import os
+import select
+import socket
+import struct
+import threading
+import time
+
+from probe_scheduler import Medicao, medir_ping
+
+PROBE_INTERVAL = 1.0
+PROBE_TIMEOUT = 2.0
+PROBE_PAYLOAD = 56
+ECHO_PORT = 50007
+RESPONDER_RECHECK = 300.0
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+CABECALHO_ICMP = struct.Struct("!BBHHH")
+SONDA_UDP = struct.Struct("!QI")
+
+_icmp_disponivel = None
+_respondedores = {}
+
+
+def _checksum(dados):
+    if len(dados) % 2:
+        dados += b"\0"
+    soma = sum(struct.unpack(f"!{len(dados) // 2}H", dados))
+    soma = (soma >> 16) + (soma & 0xFFFF)
+    soma += soma >> 16
+    return ~soma & 0xFFFF
+
+
+def _resolver(destino):
+    try:
+        return socket.gethostbyname(destino)
+    except socket.gaierror as e:
+        raise RuntimeError(f"destino desconhecido {destino}: {e}")
+
+
+def _sondar(sock, pacotes, intervalo, timeout, enviar, interpretar):
+    # envia um pacote a cada `intervalo` segundos e recolhe as respostas até `timeout`
+    # segundos depois do último envio; as respostas são associadas pelo número de sequência
+    enviados = {}
+    rtts = [None] * pacotes
+    proximo_envio = time.monotonic()
+    limite = None
+
+    while True:
+        agora = time.monotonic()
+        if len(enviados) < pacotes and agora >= proximo_envio:
+            seq = len(enviados)
+            enviados[seq] = time.perf_counter()
+            enviar(seq)
+            proximo_envio = agora + intervalo
+            if len(enviados) == pacotes:
+                limite = agora + timeout
+            continue
+
+        if limite is not None and (agora >= limite or all(rtt is not None for rtt in rtts)):
+            return rtts
+
+        espera = (limite if limite is not None else proximo_envio) - agora
+        if not select.select([sock], [], [], max(0.0, espera))[0]:
+            continue
+
+        try:
+            resposta = sock.recv(2048)
+        except ConnectionRefusedError:
+            # porta UDP fechada no destino (ICMP port unreachable)
+            continue
+        recebido = time.perf_counter()
+
+        seq = interpretar(resposta)
+        if seq in enviados and rtts[seq] is None:
+            rtts[seq] = round((recebido - enviados[seq]) * 1000, 3)
+
+
+def medir_icmp(destino, pacotes, intervalo=PROBE_INTERVAL, timeout=PROBE_TIMEOUT):
+    """
+    Mede um destino com pedidos de eco ICMP enviados por um socket ICMP de datagramas
+    (sem privilégios, se o grupo do processo estiver em `net.ipv4.ping_group_range`).
+
+    Parâmetros:
+    ----------
+    destino : str
+        O endereço a medir.
+    pacotes : int
+        O número de pacotes a enviar.
+    intervalo : float, opcional
+        O intervalo, em segundos, entre pacotes.
+    timeout : float, opcional
+        O tempo, em segundos, a esperar pelas respostas depois do último pacote.
+
+    Retorno:
+    -------
+    Medicao
+        A medição, com um RTT (ou None) por pacote enviado.
+
+    Exceções:
+    --------
+    PermissionError
+        Se o sistema não permitir sockets ICMP sem privilégios.
+    RuntimeError
+        Se o destino não puder ser resolvido.
+    """
+
+    endereco = _resolver(destino)
+    # o kernel substitui o identificador pelo "porto" local do socket; o conteúdo identifica esta execução
+    marca = os.urandom(8)
+    carga = marca + bytes(PROBE_PAYLOAD - len(marca))
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP) as sock:
+        sock.connect((endereco, 0))
+
+        def enviar(seq):
+            cabecalho = CABECALHO_ICMP.pack(ICMP_ECHO_REQUEST, 0, 0, 0, seq)
+            checksum = _checksum(cabecalho + carga)
+            sock.send(CABECALHO_ICMP.pack(ICMP_ECHO_REQUEST, 0, checksum, 0, seq) + carga)
+
+        def interpretar(resposta):
+            if len(resposta) < CABECALHO_ICMP.size + len(marca):
+                return None
+            tipo, _, _, _, seq = CABECALHO_ICMP.unpack_from(resposta)
+            if tipo != ICMP_ECHO_REPLY or resposta[CABECALHO_ICMP.size:CABECALHO_ICMP.size + len(marca)] != marca:
+                return None
+            return seq
+
+        return Medicao(destino, _sondar(sock, pacotes, intervalo, timeout, enviar, interpretar))
+
+
+def medir_udp(destino, pacotes, intervalo=PROBE_INTERVAL, timeout=PROBE_TIMEOUT, porta=ECHO_PORT):
+    """
+    Mede um destino com sondas UDP devolvidas por um `EchoResponder` a correr no destino.
+
+    Parâmetros:
+    ----------
+    destino : str
+        O endereço a medir.
+    pacotes : int
+        O número de pacotes a enviar.
+    intervalo : float, opcional
+        O intervalo, em segundos, entre pacotes.
+    timeout : float, opcional
+        O tempo, em segundos, a esperar pelas respostas depois do último pacote.
+    porta : int, opcional
+        A porta do respondedor de eco.
+
+    Retorno:
+    -------
+    Medicao
+        A medição, com um RTT (ou None) por pacote enviado.
+
+    Exceções:
+    --------
+    RuntimeError
+        Se o destino não puder ser resolvido.
+    """
+
+    endereco = _resolver(destino)
+    marca = int.from_bytes(os.urandom(8), "big")
+    carga = bytes(max(0, PROBE_PAYLOAD - SONDA_UDP.size))
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.connect((endereco, porta))
+
+        def enviar(seq):
+            try:
+                sock.send(SONDA_UDP.pack(marca, seq) + carga)
+            except ConnectionRefusedError:
+                pass
+
+        def interpretar(resposta):
+            if len(resposta) < SONDA_UDP.size:
+                return None
+            marca_resposta, seq = SONDA_UDP.unpack_from(resposta)
+            return seq if marca_resposta == marca else None
+
+        return Medicao(destino, _sondar(sock, pacotes, intervalo, timeout, enviar, interpretar))
+
+
+def tem_respondedor(destino):
+    """
+    Verifica, com uma única sonda UDP, se o destino tem um `EchoResponder` a correr.
+    O resultado fica em cache durante `RESPONDER_RECHECK` segundos.
+
+    Parâmetros:
+    ----------
+    destino : str
+        O endereço a verificar.
+
+    Retorno:
+    -------
+    bool
+    """
+
+    agora = time.monotonic()
+    anterior = _respondedores.get(destino)
+    if anterior is not None and agora - anterior[1] < RESPONDER_RECHECK:
+        return anterior[0]
+
+    resposta = bool(medir_udp(destino, 1).respostas())
+    _respondedores[destino] = (resposta, agora)
+    return resposta
+
+
+def medir(destino, pacotes):
+    """
+    Mede um destino sem lançar processos sempre que possível: usa ICMP se o sistema o permitir e,
+    caso contrário, sondas UDP para os destinos com respondedor de eco e o `ping` do sistema para os
+    restantes (ex: 8.8.8.8). Compatível com `ProbeScheduler(medir=...)`.
+
+    Parâmetros:
+    ----------
+    destino : str
+        O endereço a medir.
+    pacotes : int
+        O número de pacotes a enviar.
+
+    Retorno:
+    -------
+    Medicao
+        A medição, com um RTT (ou None) por pacote enviado.
+
+    Exceções:
+    --------
+    RuntimeError ou OSError
+        Se o destino não puder ser medido (ex: sem respondedor de eco e sem `ping` instalado);
+        o `ProbeScheduler` descarta essa ronda em vez de reportar perda.
+    """
+
+    global _icmp_disponivel
+
+    if _icmp_disponivel is not False:
+        try:
+            medicao = medir_icmp(destino, pacotes)
+            _icmp_disponivel = True
+            return medicao
+        except OSError as e:
+            if e.errno not in (errno.EACCES, errno.EPERM, errno.EPROTONOSUPPORT):
+                raise
+            _icmp_disponivel = False
+            print(f"Sockets ICMP sem privilégios indisponíveis ({e}); a usar sondas UDP na porta {ECHO_PORT} "
+                  "para destinos com respondedor de eco e o ping do sistema para os restantes.")
+
+    if tem_respondedor(destino):
+        return medir_udp(destino, pacotes)
+    return medir_ping(destino, pacotes)
+
+
+class EchoResponder:
+    """
+    Respondedor de eco UDP para as sondas de `medir_udp`: devolve cada datagrama ao remetente.
+    Cada agente arranca um, para poder ser medido pelos restantes quando o ICMP não está disponível.
+    """
+
+    def __init__(self, porta=ECHO_PORT, host="0.0.0.0"):
+        self.endereco = (host, porta)
+        self.sock = None
+
+    def iniciar(self):
+        """
+        Abre o socket do respondedor e inicia a thread que devolve as sondas.
+
+        Parâmetros:
+        ----------
+        None
+
+        Retorno:
+        -------
+        None
+
+        Exceções:
+        --------
+        OSError
+            Se a porta já estiver ocupada.
+        """
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(self.endereco)
+        threading.Thread(target=self._ciclo, daemon=True).start()
+
+    def _ciclo(self):
+        while True:
+            try:
+                dados, addr = self.sock.recvfrom(2048)
+                self.sock.sendto(dados, addr)
+            except OSError:
+                continue
+
+
+if __name__ == "__main__":
+    responder = EchoResponder()
+    responder.iniciar()
+    print(f"Respondedor de eco UDP à escuta na porta {ECHO_PORT}. Ctrl+C para sair.")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
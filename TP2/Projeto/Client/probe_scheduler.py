@@ -0,0 +1,216 @@
+import functools
+import itertools
+import re
+import subprocess
+import threading
+import time
+from collections import namedtuple
+
+ALIGN_FRACTION = 0.25
+PROBE_TIMEOUT_PER_PACKET = 1.0
+PROBE_TIMEOUT_MARGIN = 5.0
+
+PADRAO_RESPOSTA = re.compile(r"icmp_seq=(\d+).*?time=(\d+(?:\.\d+)?) ms")
+
+
+class Medicao(namedtuple("Medicao", ["destino", "rtts"])):
+    """
+    Resultado de uma execução de ping: o RTT de cada pacote enviado, em ms, ou None se o pacote se perdeu.
+    """
+
+    def recorte(self, pacotes):
+        """
+        Devolve a medição restrita aos primeiros `pacotes` pacotes enviados.
+
+        Parâmetros:
+        ----------
+        pacotes : int
+            O número de pacotes pedido por um consumidor.
+
+        Retorno:
+        -------
+        Medicao
+        """
+
+        return Medicao(self.destino, self.rtts[:pacotes])
+
+    def respostas(self):
+        return [rtt for rtt in self.rtts if rtt is not None]
+
+    def latencia(self):
+        """
+        Devolve a latência média, em ms, ou None se nenhum pacote teve resposta.
+        """
+
+        respostas = self.respostas()
+        return sum(respostas) / len(respostas) if respostas else None
+
+    def jitter(self):
+        """
+        Devolve o jitter (média das diferenças entre RTTs consecutivos), em ms, ou None se houver menos de duas respostas.
+        """
+
+        respostas = self.respostas()
+        if len(respostas) < 2:
+            return None
+        return sum(abs(respostas[i + 1] - respostas[i]) for i in range(len(respostas) - 1)) / (len(respostas) - 1)
+
+    def perda(self):
+        """
+        Devolve a percentagem de pacotes perdidos.
+        """
+
+        if not self.rtts:
+            return 100.0
+        return 100.0 * (len(self.rtts) - len(self.respostas())) / len(self.rtts)
+
+
+def medir_ping(destino, pacotes):
+    """
+    Executa `ping -c {pacotes} {destino}` e recolhe o RTT de cada pacote.
+
+    Parâmetros:
+    ----------
+    destino : str
+        O endereço a medir.
+    pacotes : int
+        O número de pacotes a enviar.
+
+    Retorno:
+    -------
+    Medicao
+        A medição, com um RTT (ou None) por pacote enviado.
+
+    Exceções:
+    --------
+    RuntimeError
+        Se o ping falhar (ex: destino desconhecido).
+    """
+
+    resultado = subprocess.run(["ping", "-c", str(pacotes), destino], capture_output=True, text=True)
+    if resultado.returncode not in (0, 1):
+        # 1 significa apenas que houve pacotes sem resposta; outros códigos são erros do ping
+        raise RuntimeError(resultado.stderr.strip() or f"ping terminou com o código {resultado.returncode}")
+
+    respostas = {int(seq): float(rtt) for seq, rtt in PADRAO_RESPOSTA.findall(resultado.stdout)}
+    primeiro = 0 if 0 in respostas else 1
+    return Medicao(destino, [respostas.get(primeiro + i) for i in range(pacotes)])
+
+
+class ProbeScheduler:
+    """
+    Agenda as medições por ping de todos os consumidores do agente (latência, perda, jitter e AlertFlow).
+
+    Os pedidos são agrupados por destino: cada destino tem um único job no `JobScheduler` do
+    agente, que executa um ping com o maior número de pacotes pedido e entrega a mesma medição a
+    todos os consumidores cuja vez chegou, cada um recortado ao seu número de pacotes. Para que
+    os consumidores partilhem execuções, um consumidor pode ser servido até `ALIGN_FRACTION` do
+    seu período mais cedo.
+    """
+
+    def __init__(self, agenda, medir=medir_ping, alinhamento=ALIGN_FRACTION):
+        self.agenda = agenda
+        self.medir = medir
+        self.alinhamento = alinhamento
+        self.grupos = {}
+        self.subscricoes = {}
+        self.contador = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def subscrever(self, destino, pacotes, frequencia, callback):
+        """
+        Pede medições periódicas de um destino. A primeira é feita de imediato.
+
+        Parâmetros:
+        ----------
+        destino : str
+            O endereço a medir.
+        pacotes : int
+            O número de pacotes por medição.
+        frequencia : float
+            O intervalo, em segundos, entre medições.
+        callback : callable
+            Chamada com cada `Medicao`, num trabalhador do `JobScheduler`.
+
+        Retorno:
+        -------
+        int
+            O identificador da subscrição, para `cancelar`.
+        """
+
+        with self.lock:
+            identificador = next(self.contador)
+            subscricao = {"destino": destino, "pacotes": int(pacotes), "frequencia": float(frequencia),
+                          "callback": callback, "proximo": time.monotonic()}
+            self.subscricoes[identificador] = subscricao
+            self.grupos.setdefault(destino, {})[identificador] = subscricao
+            self._agendar(destino)
+
+        return identificador
+
+    def cancelar(self, identificador):
+        """
+        Cancela uma subscrição. Uma medição já em curso deixa de lhe ser entregue.
+
+        Parâmetros:
+        ----------
+        identificador : int
+            O identificador devolvido por `subscrever`.
+
+        Retorno:
+        -------
+        None
+        """
+
+        with self.lock:
+            subscricao = self.subscricoes.pop(identificador, None)
+            if subscricao is None:
+                return
+
+            destino = subscricao["destino"]
+            grupo = self.grupos[destino]
+            del grupo[identificador]
+            if not grupo:
+                del self.grupos[destino]
+                self.agenda.cancelar(("sondas", destino))
+
+    def _agendar(self, destino):
+        # chamada com o lock: o job do destino fica agendado para a próxima subscrição a vencer
+        grupo = self.grupos[destino]
+        proximo = min(subscricao["proximo"] for subscricao in grupo.values())
+        pacotes = max(subscricao["pacotes"] for subscricao in grupo.values())
+        self.agenda.agendar(("sondas", destino), functools.partial(self._medir_grupo, destino),
+                            atraso=max(0.0, proximo - time.monotonic()),
+                            timeout=pacotes * PROBE_TIMEOUT_PER_PACKET + PROBE_TIMEOUT_MARGIN)
+
+    def _medir_grupo(self, destino):
+        with self.lock:
+            grupo = self.grupos.get(destino)
+            if not grupo:
+                return
+
+            agora = time.monotonic()
+            devidas = [(identificador, subscricao) for identificador, subscricao in grupo.items()
+                       if subscricao["proximo"] <= agora + self.alinhamento * subscricao["frequencia"]]
+            for _, subscricao in devidas:
+                subscricao["proximo"] = agora + subscricao["frequencia"]
+            self._agendar(destino)
+
+        if not devidas:
+            return
+        pacotes = max(subscricao["pacotes"] for _, subscricao in devidas)
+
+        print(f"A medir {destino} com {pacotes} pacotes para {len(devidas)} consumidor(es)...")
+        try:
+            medicao = self.medir(destino, pacotes)
+        except Exception as e:
+            print(f"Erro ao executar o ping para {destino}: {e}")
+            return
+
+        for identificador, subscricao in devidas:
+            if identificador not in self.subscricoes:
+                continue
+            try:
+                subscricao["callback"](medicao.recorte(subscricao["pacotes"]))
+            except Exception as e:
+                print(f"Erro ao processar a medição de {destino}: {e}")
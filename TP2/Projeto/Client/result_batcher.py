@@ -0,0 +1,109 @@
+import threading
+import time
+
+import NetTask
+
+RESULT_BATCH_BYTES = NetTask.UDP_MAX_PAYLOAD
+RESULT_LINGER = 0.5
+
+
+class ResultBatcher:
+    """
+    Agrupa os resultados das threads de medição em lotes do tamanho de um datagrama.
+
+    Um lote é enviado quando o resultado seguinte já não cabe em `max_bytes`, ou quando o
+    resultado mais antigo do lote espera há `linger` segundos.
+    """
+
+    def __init__(self, enviar, max_bytes=RESULT_BATCH_BYTES, linger=RESULT_LINGER):
+        self.enviar = enviar
+        self.max_bytes = max_bytes
+        self.linger = linger
+
+        self.resultados = []
+        self.tamanho = 2
+        self.prazo = None
+        self.cond = threading.Condition()
+        self.thread = None
+
+    def iniciar(self):
+        """
+        Inicia a thread que envia os lotes cujo tempo de espera terminou.
+
+        Parâmetros:
+        ----------
+        None
+
+        Retorno:
+        -------
+        None
+        """
+
+        self.thread = threading.Thread(target=self._ciclo, daemon=True)
+        self.thread.start()
+
+    def adicionar(self, resultado):
+        """
+        Acrescenta um resultado ao lote em curso.
+
+        Parâmetros:
+        ----------
+        resultado : str
+            O resultado, no formato `"{ns}€{texto}"`.
+
+        Retorno:
+        -------
+        None
+        """
+
+        tamanho = NetTask.tamanho_no_lote(resultado)
+        lote = None
+
+        with self.cond:
+            if self.resultados and self.tamanho + tamanho > self.max_bytes:
+                lote = self._retirar_lote()
+
+            self.resultados.append(resultado)
+            self.tamanho += tamanho
+            if self.prazo is None:
+                self.prazo = time.monotonic() + self.linger
+                self.cond.notify()
+
+        if lote is not None:
+            self.enviar(lote)
+
+    def esvaziar(self):
+        """
+        Envia de imediato o lote em curso, se existir.
+
+        Parâmetros:
+        ----------
+        None
+
+        Retorno:
+        -------
+        None
+        """
+
+        with self.cond:
+            lote = self._retirar_lote() if self.resultados else None
+
+        if lote is not None:
+            self.enviar(lote)
+
+    def _retirar_lote(self):
+        lote = NetTask.criar_lote_resultados(self.resultados)
+        self.resultados = []
+        self.tamanho = 2
+        self.prazo = None
+        return lote
+
+    def _ciclo(self):
+        while True:
+            with self.cond:
+                while self.prazo is None or self.prazo > time.monotonic():
+                    espera = None if self.prazo is None else self.prazo - time.monotonic()
+                    self.cond.wait(espera)
+                lote = self._retirar_lote()
+
+            self.enviar(lote)
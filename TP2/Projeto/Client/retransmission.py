@@ -0,0 +1,179 @@
+import heapq
+import itertools
+import threading
+import time
+
+
+class RetransmissionScheduler:
+    """
+    Agenda a retransmissão dos pacotes que aguardam confirmação.
+
+    Os pacotes pendentes ficam num dicionário indexado por (peer, n_s), o que torna a
+    confirmação O(1), e os prazos num min-heap. Uma thread dedicada dorme até ao prazo
+    mais próximo, pelo que as retransmissões acontecem a horas sem depender da chegada
+    de datagramas. As entradas do heap de pacotes já confirmados são descartadas quando
+    vencem. O mesmo heap serve ainda temporizadores genéricos (ex: ACKs atrasados).
+    """
+
+    def __init__(self, enviar, retry_timeout, max_attempts, on_give_up=None):
+        self.enviar = enviar
+        self.retry_timeout = retry_timeout
+        self.max_attempts = max_attempts
+        self.on_give_up = on_give_up
+
+        self.pendentes = {}
+        self.prazos = []
+        self.contador = itertools.count()
+        self.cond = threading.Condition()
+        self.thread = None
+
+    def iniciar(self):
+        """
+        Inicia a thread de retransmissão.
+
+        Parâmetros:
+        ----------
+        None
+
+        Retorno:
+        -------
+        None
+        """
+
+        self.thread = threading.Thread(target=self._ciclo, daemon=True)
+        self.thread.start()
+
+    def agendar(self, chave, mensagem, addr):
+        """
+        Regista um pacote enviado que aguarda confirmação.
+
+        Parâmetros:
+        ----------
+        chave : tuple
+            A chave (peer, n_s) do pacote.
+        mensagem : bytes
+            O pacote a retransmitir.
+        addr : tuple
+            O endereço (ip, porta) de destino.
+
+        Retorno:
+        -------
+        None
+        """
+
+        with self.cond:
+            prazo = time.monotonic() + self.retry_timeout
+            entrada = [mensagem, addr, 0, prazo]
+            self.pendentes[chave] = entrada
+            heapq.heappush(self.prazos, (prazo, next(self.contador), chave, entrada))
+            if self.prazos[0][3] is entrada:
+                self.cond.notify()
+
+    def chamar_depois(self, atraso, funcao, *args):
+        """
+        Agenda a execução de uma função na thread de retransmissão.
+
+        Parâmetros:
+        ----------
+        atraso : float
+            O número de segundos até à execução.
+        funcao : callable
+            A função a executar.
+        *args
+            Os argumentos da função.
+
+        Retorno:
+        -------
+        None
+        """
+
+        with self.cond:
+            prazo = time.monotonic() + atraso
+            entrada = (funcao, args)
+            heapq.heappush(self.prazos, (prazo, next(self.contador), None, entrada))
+            if self.prazos[0][3] is entrada:
+                self.cond.notify()
+
+    def confirmar(self, chave):
+        """
+        Remove um pacote confirmado.
+
+        Parâmetros:
+        ----------
+        chave : tuple
+            A chave (peer, n_s) do pacote.
+
+        Retorno:
+        -------
+        list or None
+            A entrada [mensagem, addr, tentativas, prazo] removida, ou None se não estava pendente.
+        """
+
+        with self.cond:
+            return self.pendentes.pop(chave, None)
+
+    def pendente(self, chave):
+        """
+        Indica se um pacote ainda aguarda confirmação.
+
+        Parâmetros:
+        ----------
+        chave : tuple
+            A chave (peer, n_s) do pacote.
+
+        Retorno:
+        -------
+        bool
+        """
+
+        with self.cond:
+            return chave in self.pendentes
+
+    def __len__(self):
+        with self.cond:
+            return len(self.pendentes)
+
+    def _ciclo(self):
+        while True:
+            reenviar = []
+            desistir = []
+            chamadas = []
+
+            with self.cond:
+                while not self.prazos or self.prazos[0][0] > time.monotonic():
+                    espera = self.prazos[0][0] - time.monotonic() if self.prazos else None
+                    self.cond.wait(espera)
+
+                agora = time.monotonic()
+                while self.prazos and self.prazos[0][0] <= agora:
+                    _, _, chave, entrada = heapq.heappop(self.prazos)
+                    if chave is None:
+                        chamadas.append(entrada)
+                        continue
+                    if self.pendentes.get(chave) is not entrada:
+                        continue
+
+                    if entrada[2] < self.max_attempts:
+                        entrada[2] += 1
+                        entrada[3] = agora + self.retry_timeout
+                        heapq.heappush(self.prazos, (entrada[3], next(self.contador), chave, entrada))
+                        reenviar.append((chave, entrada[0], entrada[1], entrada[2]))
+                    else:
+                        del self.pendentes[chave]
+                        desistir.append((chave, entrada[0], entrada[1]))
+
+            for chave, mensagem, addr, tentativa in reenviar:
+                print(f"Reenviando pacote: n_s = {chave[1]}, tentativa {tentativa}.")
+                try:
+                    self.enviar(mensagem, addr)
+                except OSError as e:
+                    print(f"Erro ao reenviar pacote {chave[1]}: {e}")
+
+            for chave, mensagem, addr in desistir:
+                if self.on_give_up is not None:
+                    self.on_give_up(chave, mensagem, addr)
+                else:
+                    print(f"Pacote {chave[1]} não recebeu confirmação após {self.max_attempts} tentativas. Removendo.")
+
+            for funcao, args in chamadas:
+                funcao(*args)
@@ -1,67 +1,116 @@
 import subprocess
 import datetime
-import re
-from NMS_AGENT import *
-import platform
-import psutil
+import NMS_AGENT
+from alert_state import AlertState
 
-def control_hardware(FREQUENCY, M_CPU, M_RAM, INTERFACES, M_IS, M_PL, M_JI):
-    i = 0
+# segundos além da duração do teste antes de o comando ser dado como bloqueado e terminado
+SUBPROCESS_TIMEOUT_MARGIN = 10
+
+def control_hardware(tarefa):
+    """
+    Faz uma verificação dos limites de hardware e de rede de uma task e envia os alertas ao servidor.
+    É executada pelo `JobScheduler` do agente com a frequência da task; a cada 10 verificações é
+    enviado também um resumo. O CPU e o tráfego das interfaces (em pacotes por segundo) são as
+    médias das amostras do `HardwareSampler` desde a verificação anterior. Cada métrica passa por
+    um `AlertState`, que só envia o início, os resumos periódicos e a recuperação de cada alerta.
+
+    Parâmetros:
+    ----------
+    tarefa : dict
+        A task em execução: configuração atual (`config`), contador de verificações (`ciclos`), as
+        medições do ping ao servidor (`medicoes_servidor`), entregues pelo `ProbeScheduler`, e o
+        estado dos alertas (`alertas`).
+
+    Retorno:
+    -------
+    None
+    """
+
+    FREQUENCY, M_CPU, M_RAM, INTERFACES, M_IS, M_PL, M_JI = tarefa["config"][:7]
     INTERFACES = INTERFACES.split(',')
-    while True:
-        i += 1
-        message = ""
-        if int(M_CPU) != 0:
-            cpu_usage = psutil.cpu_percent()
+    tarefa["ciclos"] += 1
+    message = ""
+
+    amostrador = NMS_AGENT.amostrador
+
+    if int(M_CPU) != 0:
+        cpu_usage = amostrador.media("cpu", FREQUENCY)
+        if cpu_usage is not None:
+            cpu_usage = round(cpu_usage, 1)
             message += f"CPU usage: {cpu_usage}%\n"
-            if cpu_usage > int(M_CPU):
-                tcp_send(f"ALERT!!!: CPU usage: {cpu_usage}%")
+            avaliar_alerta(tarefa, "cpu", "CPU usage", "%", cpu_usage, int(M_CPU))
 
-        if int(M_RAM) != 0:
-            ram_usage = psutil.virtual_memory().percent
+    if int(M_RAM) != 0:
+        ram_usage = amostrador.media("ram", FREQUENCY)
+        if ram_usage is not None:
+            ram_usage = round(ram_usage, 1)
             message += f"RAM usage: {ram_usage}%\n"
-            if ram_usage > int(M_RAM):
-                tcp_send(f"ALERT!!!: RAM usage: {ram_usage}%")
+            avaliar_alerta(tarefa, "ram", "RAM usage", "%", ram_usage, int(M_RAM))
 
-        if platform.system() == "Darwin":
-            cmd = ["ping", "-c", str(FREQUENCY), tcp_host]
+    medicoes = tarefa["medicoes_servidor"]
+    if medicoes:
+        # usa-se apenas a medição mais recente do ping ao servidor
+        medicao = medicoes[-1]
+        medicoes.clear()
 
-        else:
-            cmd = ["ping", tcp_host, "-w", str(FREQUENCY)]
+        avg = medicao.latencia()
+        if avg is not None:
+            message += f"Jitter: {avg}ms\n"
+            avaliar_alerta(tarefa, "jitter", "Jitter", "ms", avg, float(M_JI))
 
-        try:
-            pings = subprocess.check_output(cmd).decode("utf-8")
-            lines = pings.splitlines()
+        # sem respostas, a perda é de 100%: o alerta de perda cobre o servidor inalcançável
+        loss = medicao.perda()
+        message += f"Packet loss: {loss:.0f}%\n"
+        avaliar_alerta(tarefa, "perda", "Packet loss", "%", loss, int(M_PL))
 
-            
-            avg = float(lines[-1].split("=")[1].split("/")[1])
-            message += f"Jitter: {avg}ms\n"
-            if avg > float(M_JI):
-                tcp_send(f"ALERT!!!: Jitter is {avg}ms")
-
-            loss = int(re.search(r'\d+(?=%)', lines[-2]).group())
-            message += f"Packet loss: {loss}%\n"
-            if loss > int(M_PL):
-                tcp_send(f"ALERT!!!: Packet loss is {loss}%")
-        except subprocess.CalledProcessError as e:
-                tcp_send(f"ERROR: Unable to execute ping. Command: {' '.join(cmd)}, Error: {str(e)}")
-
-        if int(M_IS) != 0:
-            stats = psutil.net_io_counters(pernic=True)
-            for interface in INTERFACES:
-                if interface in stats:
-                    interface_stats = stats[interface]
-                    packets = interface_stats.packets_recv + interface_stats.packets_sent
-                    message += f"Packets on {interface}: {packets}\n"
-                    if packets > int(M_IS):
-                        tcp_send(f"ALERT!!!: Packets in interface '{interface}': {packets}")
-                else:
-                    message += f"Interface '{interface}' not found.\n"
-
-        if i == 10:
-            i = 0
-            tcp_send(message)
+    if int(M_IS) != 0:
+        # M_IS é um limite de pacotes por segundo, não do contador cumulativo da interface
+        for interface in INTERFACES:
+            packets = amostrador.media(f"pacotes/{interface}", FREQUENCY)
+            if packets is not None:
+                message += f"Packets/s on {interface}: {packets:.1f}\n"
+                avaliar_alerta(tarefa, f"pacotes/{interface}", f"Packets/s in interface '{interface}'", "",
+                               packets, int(M_IS))
+            else:
+                message += f"Interface '{interface}' not found.\n"
+
+    if tarefa["ciclos"] == 10:
+        tarefa["ciclos"] = 0
+        NMS_AGENT.tcp_send(message)
+
+
+
+def avaliar_alerta(tarefa, chave, nome, unidade, valor, limite):
+    """
+    Passa uma leitura pelo `AlertState` da métrica na task e envia ao servidor a mensagem que daí resultar.
+
+    Parâmetros:
+    ----------
+    tarefa : dict
+        A task em execução.
+    chave : str
+        A chave da métrica em `tarefa["alertas"]` (ex: `"cpu"` ou `"pacotes/eth0"`).
+    nome : str
+        O nome da métrica nas mensagens.
+    unidade : str
+        A unidade da métrica nas mensagens.
+    valor : float
+        O valor lido.
+    limite : float
+        O limite configurado na task.
+
+    Retorno:
+    -------
+    None
+    """
+
+    estado = tarefa["alertas"].get(chave)
+    if estado is None:
+        estado = tarefa["alertas"][chave] = AlertState(nome, unidade)
 
+    mensagem = estado.avaliar(valor, limite)
+    if mensagem is not None:
+        NMS_AGENT.tcp_send(mensagem)
 
 
 def calc_ping(pingTo, pingAmount = 1, pingInterval = 1):
@@ -76,7 +125,8 @@ def calc_ping(pingTo, pingAmount = 1, pingInterval = 1):
     '''
 
     cmd = ["ping", pingTo, "-c", str(pingAmount), "-q", "-i", str(pingInterval)]
-    ping = subprocess.check_output(cmd).decode("utf-8").split()[-1].split("/")[4] 
+    timeout = pingAmount * pingInterval + SUBPROCESS_TIMEOUT_MARGIN
+    ping = subprocess.check_output(cmd, timeout=timeout).decode("utf-8").split()[-1].split("/")[4]
     return ping
 
 
@@ -105,7 +155,8 @@ def calc_bandwidth(ipTo, udp=False, testTime=10):
         cmd.append("-u")
     
     try:
-        result = subprocess.check_output(cmd, stderr=subprocess.STDOUT).decode("utf-8")
+        result = subprocess.check_output(cmd, stderr=subprocess.STDOUT,
+                                         timeout=testTime + SUBPROCESS_TIMEOUT_MARGIN).decode("utf-8")
         
         for line in result.splitlines():
             if "Mbits/sec" in line:
@@ -116,6 +167,8 @@ def calc_bandwidth(ipTo, udp=False, testTime=10):
     
     except subprocess.CalledProcessError as e:
         raise RuntimeError(f"Erro ao executar iperf: {e.output.decode('utf-8')}")
+    except subprocess.TimeoutExpired:
+        raise RuntimeError(f"O iperf não terminou em {testTime + SUBPROCESS_TIMEOUT_MARGIN}s.")
     except Exception as e:
         raise RuntimeError(f"Erro inesperado: {str(e)}")
 
@@ -3,18 +3,43 @@ import os
 import time
 import threading
 import json
-from datetime import datetime, timedelta
+import asyncio
+import argparse
+import selectors
+import multiprocessing
+from collections import deque
+from datetime import datetime
 import NetTask
 import struct
+from session_table import SessionTable, escrever_snapshot
+from storage_writer import StorageWriter
+import timeseries
+from log_index import LogIndex, interpretar_instante
+import log_segments
+import aggregates
 
 MAX_ATTEMPTS = 3  
 RETRY_TIMEOUT = 2
+WINDOW_SIZE = 64
+TCP_BACKLOG = 128
+TCP_RECV_SIZE = 65536
 INACTIVITY_LIMIT = 15
 CHECK_INACTIVE_INTERVAL = 10
+UDP_SERVER_MODE = "threaded"
+UDP_WORKERS = 1
+UDP_WORKER_QUEUE_SIZE = 10000
+SNAPSHOT_CONNECTIONS = True
+SNAPSHOT_INTERVAL = 10
+CONFIG_FILE = "configuration_server.json"
+CONFIG_RELOAD_INTERVAL = 2
+STORAGE_FSYNC = "interval"
+SERIES_DIR = "series"
+PAGE_SIZE = 20
+COMPRESSION = True
 
 tasks = []
-array_n_s = []
-tasks_n_s = []
+catalogo_tasks = {}
+canal = None
 
 tcp_host = '127.0.0.1'
 tcp_port = 65432
@@ -22,6 +47,145 @@ tcp_port = 65432
 udp_host = '127.0.0.1'
 udp_port = 65433
 
+sessions = SessionTable(INACTIVITY_LIMIT)
+compressor = log_segments.SegmentCompressor()
+storage = StorageWriter(fsync=STORAGE_FSYNC, ao_selar=compressor.agendar)
+series = timeseries.TimeSeriesStore(SERIES_DIR)
+agregados = aggregates.Aggregator()
+indices_ficheiros = {}
+
+# modo multi-processo: cada worker UDP entrega os resultados e o estado das suas sessões ao
+# processo principal, o único que escreve em disco
+udp_reuseport = False
+fila_ingestao = None
+worker_numero = None
+sessoes_workers = {}
+
+def ler_instante(mensagem):
+    """
+    Pede ao utilizador um instante no formato `AAAA-MM-DD HH:MM:SS`.
+
+    Parâmetros:
+    ----------
+    mensagem : str
+        O texto do pedido.
+
+    Retorno:
+    -------
+    float or None
+        O instante em segundos desde a época, ou None se o utilizador não indicar nenhum.
+    """
+
+    while True:
+        texto = input(mensagem).strip()
+        if not texto:
+            return None
+        instante = interpretar_instante(texto)
+        if instante is not None:
+            return instante
+        print("Instante inválido. Use o formato AAAA-MM-DD HH:MM:SS.")
+
+
+def paginar(itens, formatar):
+    """
+    Mostra os itens de um iterador em páginas de `PAGE_SIZE`, lendo apenas os itens mostrados.
+
+    Parâmetros:
+    ----------
+    itens : iterable
+        Os itens a mostrar.
+    formatar : callable
+        Converte um item no texto a mostrar.
+
+    Retorno:
+    -------
+    None
+    """
+
+    mostrados = 0
+    for item in itens:
+        print(formatar(item))
+        mostrados += 1
+        if mostrados % PAGE_SIZE == 0:
+            if input("\n[Enter] página seguinte, 'q' para parar: ").lower() == "q":
+                return
+
+    if mostrados == 0:
+        print("Sem resultados.")
+
+
+def acompanhar(itens, formatar):
+    """
+    Mostra os itens de um iterador infinito à medida que chegam, até o utilizador premir Ctrl+C.
+
+    Parâmetros:
+    ----------
+    itens : iterable
+        Os itens a mostrar.
+    formatar : callable
+        Converte um item no texto a mostrar.
+
+    Retorno:
+    -------
+    None
+    """
+
+    print("A acompanhar novas entradas (Ctrl+C para parar)...")
+    try:
+        for item in itens:
+            print(formatar(item))
+    except KeyboardInterrupt:
+        print("\nFim do acompanhamento.")
+
+
+def formatar_entrada(entrada):
+    """
+    Formata uma entrada de um ficheiro de resultados ou de monitorização para a paginação.
+
+    Parâmetros:
+    ----------
+    entrada : tuple
+        O tuplo (instante, texto) devolvido por `LogIndex.entradas`.
+
+    Retorno:
+    -------
+    str
+        A entrada com o instante no formato `[AAAA-MM-DD HH:MM:SS]`.
+    """
+
+    instante, texto = entrada
+    return f"[{datetime.fromtimestamp(instante).strftime('%Y-%m-%d %H:%M:%S')}] {texto}"
+
+
+def consultar_ficheiro(arquivo):
+    """
+    Consulta um ficheiro de resultados ou de monitorização por intervalo de tempo, com paginação,
+    ou acompanha as novas entradas do ficheiro.
+
+    Parâmetros:
+    ----------
+    arquivo : str
+        O caminho do ficheiro.
+
+    Retorno:
+    -------
+    None
+    """
+
+    indice = indices_ficheiros.get(arquivo)
+    if indice is None:
+        indice = indices_ficheiros[arquivo] = LogIndex(arquivo)
+
+    modo = input("1. Consultar por intervalo de tempo\n2. Acompanhar novas entradas\nEscolha (1, 2): ")
+    if modo == "2":
+        acompanhar(indice.seguir(), str)
+        return
+
+    inicio = ler_instante("Início (AAAA-MM-DD HH:MM:SS, vazio = desde o início): ")
+    fim = ler_instante("Fim (AAAA-MM-DD HH:MM:SS, vazio = até ao fim): ")
+    paginar(indice.entradas(inicio, fim), formatar_entrada)
+
+
 def listar_arquivos_monitorizacao(diretorio):
     """
     Lista os arquivos de monitorização no diretório especificado e permite visualizar o conteúdo de cada arquivo.
@@ -37,15 +201,11 @@ def listar_arquivos_monitorizacao(diretorio):
         Uma lista de strings contendo os nomes dos arquivos de monitorização no diretório especificado.
     """
 
-    arquivos_monitorizacao = []
-    
     if not os.path.isdir(diretorio):
         print("Diretório inválido.")
         return []
     
-    for arquivo in os.listdir(diretorio):
-        if arquivo.startswith("monitorizacao-"):
-            arquivos_monitorizacao.append(arquivo)
+    arquivos_monitorizacao = log_segments.listar_logs(diretorio, "monitorizacao-")
     
     print("\n--- Arquivos de Monitorização ---")
     print("-------------------------")
@@ -63,8 +223,7 @@ def listar_arquivos_monitorizacao(diretorio):
             print("\n\n\n")
             print("\n-----------------------------------------------------")
             print(f"\nConteúdo do arquivo '{arquivos_monitorizacao[int(opcao)-1]}':\n")
-            with open(arquivos_monitorizacao[int(opcao)-1], "r") as file:
-                print(file.read())
+            consultar_ficheiro(arquivos_monitorizacao[int(opcao)-1])
             print("\n-----------------------------------------------------")
             print("\n\n\n")
             opcao = input("Digite 'q' para sair ou selecione outro arquivo.")
@@ -87,15 +246,11 @@ def listar_arquivos_task(diretorio):
         Uma lista de strings contendo os nomes dos arquivos task no diretório especificado.
     """
 
-    arquivos_task = []
-    
     if not os.path.isdir(diretorio):
         print("Diretório inválido.")
         return []
     
-    for arquivo in os.listdir(diretorio):
-        if arquivo.startswith("task-"):
-            arquivos_task.append(arquivo)
+    arquivos_task = log_segments.listar_logs(diretorio, "task-")
     
     print("\n--- Arquivos Task ---")
     print("-------------------------")
@@ -113,8 +268,7 @@ def listar_arquivos_task(diretorio):
             print("\n\n\n")
             print("\n-----------------------------------------------------")
             print(f"\nConteúdo do arquivo '{arquivos_task[int(opcao)-1]}':\n")
-            with open(arquivos_task[int(opcao)-1], "r") as file:
-                print(file.read())
+            consultar_ficheiro(arquivos_task[int(opcao)-1])
             print("\n-----------------------------------------------------")
             print("\n\n\n")
             opcao = input("Digite 'q' para sair ou selecione outro arquivo.")
@@ -124,47 +278,126 @@ def listar_arquivos_task(diretorio):
 
     
 
-def resend_unacknowledged_packets(udp_socket, host, port):
+def pacote_descartado(chave, mensagem, addr):
     """
-    Reenvia pacotes não confirmados após um determinado tempo.
+    Chamada pelo agendador de retransmissões quando um pacote esgota as tentativas.
 
     Parâmetros:
     ----------
-    udp_socket : socket
-        O socket UDP.
-    host : str
-        O endereço IP do host.
-    port : int
-        A porta do host.
+    chave : tuple
+        A chave (peer, n_s) do pacote.
+    mensagem : bytes
+        O pacote descartado.
+    addr : tuple
+        O endereço (ip, porta) de destino.
 
     Retorno:
     -------
     None
     """
 
-    global array_n_s
-    current_time = time.time()
+    print(f"Pacote {chave[1]} não recebeu confirmação após {MAX_ATTEMPTS} tentativas. Removendo.")
 
-    for packet_info in array_n_s[:]: 
-        packet_n_s, message, timestamp, attempts, addr = packet_info
 
-        if current_time - timestamp > RETRY_TIMEOUT and attempts < MAX_ATTEMPTS:
-            print(f"Reenviando pacote: n_s = {packet_n_s}, tentativa {attempts + 1}.")
-            udp_socket.sendto(message, addr)
-            
-            packet_info[2] = current_time
-            packet_info[3] += 1
 
-        
-        if attempts >= MAX_ATTEMPTS:
-            print(f"Pacote {packet_n_s} não recebeu confirmação após {MAX_ATTEMPTS} tentativas. Removendo.")
-            array_n_s.remove(packet_info)
+class EstatisticasTCP:
+    """
+    Métricas da receção de alertas TCP: conexões aceites por segundo e latência de ingestão
+    (desde a receção completa do alerta até à sua escrita em disco).
+    """
 
+    def __init__(self, janela=60, amostras=10000):
+        self.janela = janela
+        self.aceites = deque()
+        self.total_aceites = 0
+        self.latencias = deque(maxlen=amostras)
+        self.lock = threading.Lock()
+
+    def registar_conexao(self):
+        """
+        Regista uma conexão aceite, descartando as que já saíram da janela.
+
+        Parâmetros:
+        ----------
+        None
+
+        Retorno:
+        -------
+        None
+        """
+
+        agora = time.monotonic()
+        with self.lock:
+            self.total_aceites += 1
+            self.aceites.append(agora)
+            while self.aceites and self.aceites[0] < agora - self.janela:
+                self.aceites.popleft()
+
+    def registar_latencia(self, segundos):
+        """
+        Regista a latência de ingestão de um alerta. São guardadas no máximo `amostras` latências.
+
+        Parâmetros:
+        ----------
+        segundos : float
+            O tempo desde a receção completa do alerta até à sua escrita em disco.
+
+        Retorno:
+        -------
+        None
+        """
+
+        with self.lock:
+            self.latencias.append(segundos)
+
+    def conexoes_por_segundo(self):
+        """
+        Calcula a média de conexões aceites por segundo na última `janela` de segundos.
+
+        Parâmetros:
+        ----------
+        None
+
+        Retorno:
+        -------
+        float
+        """
+
+        agora = time.monotonic()
+        with self.lock:
+            recentes = sum(1 for instante in self.aceites if instante >= agora - self.janela)
+        return recentes / self.janela
+
+    def percentil_latencia(self, percentil):
+        """
+        Calcula um percentil das latências de ingestão registadas.
+
+        Parâmetros:
+        ----------
+        percentil : float
+            O percentil, entre 0 e 100 (ex: 99).
+
+        Retorno:
+        -------
+        float or None
+            A latência em segundos, ou None se ainda não houver amostras.
+        """
+
+        with self.lock:
+            latencias = sorted(self.latencias)
+        if not latencias:
+            return None
+        indice = min(len(latencias) - 1, int(len(latencias) * percentil / 100))
+        return latencias[indice]
+
+
+tcp_stats = EstatisticasTCP()
 
 
 def start_tcp_server():
     """
-    Inicia o servidor TCP e aguarda por conexões de clientes.
+    Inicia o servidor TCP de alertas. Um único ciclo `selectors` aceita e lê todas as conexões
+    em simultâneo, e a escrita dos alertas em disco é entregue ao `storage`.
     
     Parâmetros:
     ----------
@@ -180,25 +413,35 @@ def start_tcp_server():
     
 
     tcp_server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    tcp_server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     tcp_server_socket.bind((tcp_host, tcp_port))
-    tcp_server_socket.listen()
+    tcp_server_socket.listen(TCP_BACKLOG)
+    tcp_server_socket.setblocking(False)
 
     print(f"Servidor TCP escutando em {tcp_host}:{tcp_port}...")
 
+    selector = selectors.DefaultSelector()
+    selector.register(tcp_server_socket, selectors.EVENT_READ, None)
+
     while True:
-        conn, addr = tcp_server_socket.accept()
-        handle_tcp_client(conn, addr)
+        for key, mask in selector.select():
+            if key.data is None:
+                accept_tcp_clients(selector, key.fileobj)
+            else:
+                handle_tcp_client(selector, key)
 
 
 
-def handle_tcp_client(conn, addr):
+def accept_tcp_clients(selector, tcp_server_socket):
     """
-    Manipula a conexão de um cliente TCP.
+    Aceita todas as conexões pendentes e regista-as no selector.
 
     Parâmetros:
     ----------
-    conn : socket
-        O socket da conexão do cliente.
+    selector : selectors.BaseSelector
+        O selector do servidor TCP.
+    tcp_server_socket : socket
+        O socket de escuta.
 
     Retorno:
     -------
@@ -206,17 +449,480 @@ def handle_tcp_client(conn, addr):
     """
 
     while True:
-        data = conn.recv(1024)
-        if not data:
-            break
-        with open (f"monitorizacao-{addr[0]}.txt", "a") as file:
-            file.write("-------------------------\n") 
-            file.write(time.strftime("%Y-%m-%d %H:%M:%S") + "\n" + data.decode() + "\n\n")
+        try:
+            conn, addr = tcp_server_socket.accept()
+        except BlockingIOError:
+            return
+
+        conn.setblocking(False)
+        selector.register(conn, selectors.EVENT_READ, {"addr": addr, "buffer": bytearray()})
+        tcp_stats.registar_conexao()
+
+
+
+def handle_tcp_client(selector, key):
+    """
+    Lê os dados disponíveis numa conexão TCP e entrega cada alerta completo ao escritor de disco.
 
+    Parâmetros:
+    ----------
+    selector : selectors.BaseSelector
+        O selector do servidor TCP.
+    key : selectors.SelectorKey
+        A chave da conexão, com o endereço e o buffer de receção.
+
+    Retorno:
+    -------
+    None
+    """
+
+    conn = key.fileobj
+    estado = key.data
+
+    try:
+        data = conn.recv(TCP_RECV_SIZE)
+    except BlockingIOError:
+        return
+    except OSError:
+        data = b''
+
+    if data:
+        estado["buffer"] += data
+        try:
+            mensagens = NetTask.extrair_mensagens_tcp(estado["buffer"])
+        except ValueError as e:
+            print(f"Conexão TCP de {estado['addr'][0]} encerrada: {e}")
+            mensagens = None
+
+        if mensagens is not None:
+            recebido_em = time.perf_counter()
+            for mensagem in mensagens:
+                # um alerta com bytes inválidos é guardado na mesma, sem parar o ciclo do selector
+                guardar_alerta(estado["addr"][0], mensagem.decode('utf-8', errors='replace'), recebido_em)
+            return
+
+    selector.unregister(conn)
     conn.close()
 
 
 
+def guardar_alerta(ip, mensagem, recebido_em):
+    """
+    Coloca na fila do `storage` a escrita de um alerta no ficheiro `monitorizacao-{ip}.txt`.
+    A latência de ingestão é registada quando o lote da escrita é despejado.
+
+    Parâmetros:
+    ----------
+    ip : str
+        O endereço IP do agente.
+    mensagem : str
+        O alerta recebido.
+    recebido_em : float
+        O instante (`time.perf_counter`) em que o alerta ficou completo.
+
+    Retorno:
+    -------
+    None
+    """
+
+    storage.escrever(
+        f"monitorizacao-{ip}.txt",
+        "-------------------------\n" + time.strftime("%Y-%m-%d %H:%M:%S") + "\n" + mensagem + "\n\n",
+        lambda: tcp_stats.registar_latencia(time.perf_counter() - recebido_em),
+    )
+
+
+
+def carregar_tasks(json_file_path):
+    """
+    Lê as tarefas do ficheiro de configuração e compila o catálogo de mensagens de task por dispositivo.
+
+    Parâmetros:
+    ----------
+    json_file_path : str
+        O caminho do ficheiro de configuração.
+
+    Retorno:
+    -------
+    None
+    """
+
+    global tasks, catalogo_tasks
+
+    tasks = NetTask.preparar_tasks(json_file_path)
+    catalogo_tasks = NetTask.compilar_catalogo(tasks)
+
+
+def recarregar_tasks(json_file_path):
+    """
+    Volta a ler o ficheiro de configuração e envia aos agentes ligados apenas as tarefas
+    novas ou alteradas (opcode 2) e as removidas (opcode 3).
+
+    Parâmetros:
+    ----------
+    json_file_path : str
+        O caminho do ficheiro de configuração.
+
+    Retorno:
+    -------
+    None
+    """
+
+    global tasks, catalogo_tasks
+
+    try:
+        novas = NetTask.preparar_tasks(json_file_path)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"Configuração inválida em {json_file_path}: {e}. Mantidas as tasks atuais.")
+        return
+
+    alteradas, removidas = NetTask.comparar_tasks(tasks, novas)
+    tasks = novas
+    catalogo_tasks = NetTask.compilar_catalogo(novas)
+
+    if not alteradas and not removidas:
+        return
+
+    print(f"Configuração recarregada: {len(alteradas)} task(s) nova(s) ou alterada(s), {len(removidas)} removida(s).")
+
+    if canal is None:
+        return
+
+    agentes = {}
+    for ip, port, _ in sessions.listar():
+        agentes.setdefault(ip, []).append((ip, port))
+
+    templates = {(device_id, task_id): (template, comprimido)
+                 for device_id, entradas in catalogo_tasks.items()
+                 for task_id, template, comprimido in entradas}
+    for device_id, task_id, config in alteradas:
+        if device_id not in agentes:
+            continue
+        template, comprimido = templates[(device_id, task_id)]
+        for addr in agentes[device_id]:
+            task_n_s = canal.enviar_template(addr, template, comprimido)
+            sessions.associar_task(addr, task_n_s, task_id)
+
+    for device_id, task_id in removidas:
+        for addr in agentes.get(device_id, ()):
+            canal.enviar_mensagem(addr, NetTask.OP_REMOVER_TASK, task_id)
+
+
+def watch_configuration(json_file_path):
+    """
+    Verifica periodicamente se o ficheiro de configuração mudou (data de modificação e tamanho)
+    e, nesse caso, recarrega as tasks com `recarregar_tasks`.
+
+    Parâmetros:
+    ----------
+    json_file_path : str
+        O caminho do ficheiro de configuração.
+
+    Retorno:
+    -------
+    None
+    """
+
+    def assinatura():
+        try:
+            stat = os.stat(json_file_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    ultima = assinatura()
+
+    while True:
+        time.sleep(CONFIG_RELOAD_INTERVAL)
+
+        atual = assinatura()
+        if atual is not None and atual != ultima:
+            ultima = atual
+            recarregar_tasks(json_file_path)
+
+
+def guardar_resultado(task_id, data):
+    """
+    Coloca na fila do `storage` a escrita do resultado de uma task no ficheiro `{task_id}.txt`.
+
+    Parâmetros:
+    ----------
+    task_id : str
+        O identificador da task.
+    data : str
+        O resultado recebido do agente.
+
+    Retorno:
+    -------
+    None
+    """
+
+    storage.escrever(
+        f"{task_id}.txt",
+        "-----------------------------------------------------\n" + time.strftime("%Y-%m-%d %H:%M:%S") + "\n" + data + "\n",
+    )
+
+
+def guardar_metricas(device, task_id, data):
+    """
+    Coloca na fila do `storage` a extração dos valores medidos de um resultado, para que as
+    séries temporais (que escrevem em disco) não corram na thread de receção.
+
+    Parâmetros:
+    ----------
+    device : str
+        O IP do agente.
+    task_id : str
+        O identificador da task.
+    data : str
+        O resultado recebido do agente.
+
+    Retorno:
+    -------
+    None
+    """
+
+    storage.executar(acrescentar_metricas, time.time(), device, task_id, data)
+
+
+def acrescentar_metricas(agora, device, task_id, data):
+    """
+    Extrai os valores medidos de um resultado e acrescenta-os ao armazenamento de séries temporais
+    e aos agregados em memória. Corre na thread do `storage`.
+
+    Parâmetros:
+    ----------
+    agora : float
+        O instante da receção, em segundos desde a época.
+    device : str
+        O IP do agente.
+    task_id : str
+        O identificador da task.
+    data : str
+        O resultado recebido do agente.
+
+    Retorno:
+    -------
+    None
+    """
+
+    for metrica, valor in timeseries.interpretar_resultado(data):
+        series.acrescentar(agora, device, task_id, metrica, valor)
+        agregados.acrescentar(agora, device, task_id, metrica, valor)
+
+
+def tratar_registo(n_s, dados, addr):
+    """
+    Trata o registo de um agente (opcode 0) e envia-lhe as tasks que lhe correspondem.
+    Se o agente anunciou capacidades, responde com as que foram aceites (também no opcode 0) e,
+    se a compressão foi aceite, as mensagens seguintes para esse agente já seguem comprimidas.
+
+    Parâmetros:
+    ----------
+    n_s : int
+        O número de sequência da mensagem.
+    dados : bytes
+        Os dados da mensagem.
+    addr : tuple
+        O endereço (ip, porta) do agente.
+
+    Retorno:
+    -------
+    None
+    """
+
+    sessions.registar(addr)
+
+    capacidades = NetTask.interpretar_capacidades(dados)
+    if capacidades:
+        aceites = capacidades & NetTask.CAPACIDADES if COMPRESSION else 0
+        canal.enviar_mensagem(addr, NetTask.OP_REGISTO, aceites)
+        if aceites & NetTask.CAP_ZLIB:
+            canal.ativar_compressao(addr)
+
+    for task_id, template, comprimido in catalogo_tasks.get(addr[0], ()):
+        task_n_s = canal.enviar_template(addr, template, comprimido)
+        sessions.associar_task(addr, task_n_s, task_id)
+
+
+def tratar_keep_alive(n_s, dados, addr):
+    """
+    Trata um keep-alive (opcode 5), atualizando o horário da conexão do agente.
+
+    Parâmetros:
+    ----------
+    n_s : int
+        O número de sequência da mensagem.
+    dados : bytes
+        Os dados da mensagem.
+    addr : tuple
+        O endereço (ip, porta) do agente.
+
+    Retorno:
+    -------
+    None
+    """
+
+    sessions.atualizar(addr)
+
+
+def tratar_ack(n_s, dados, addr):
+    """
+    Trata um ACK (opcode 4) cumulativo e seletivo, avançando a janela de envio do agente.
+
+    Parâmetros:
+    ----------
+    n_s : int
+        O número de sequência da mensagem.
+    dados : bytes
+        Os dados da mensagem.
+    addr : tuple
+        O endereço (ip, porta) do agente.
+
+    Retorno:
+    -------
+    None
+    """
+
+    canal.processar_ack(addr, n_s, dados)
+
+
+def tratar_resultado(n_s, dados, addr):
+    """
+    Trata um lote de resultados de tasks (opcode 1) e guarda cada resultado no ficheiro da sua task.
+    Num worker UDP, o lote é entregue ao processo principal pela `fila_ingestao`.
+
+    Parâmetros:
+    ----------
+    n_s : int
+        O número de sequência da mensagem.
+    dados : bytes
+        Os dados da mensagem.
+    addr : tuple
+        O endereço (ip, porta) do agente.
+
+    Retorno:
+    -------
+    None
+    """
+
+    entregas = []
+    for resultado in NetTask.interpretar_lote_resultados(dados):
+        ns, separador, data = resultado.partition("€")
+        if not separador or not ns.isdigit():
+            print(f"Resultado inválido de {addr[0]}: {resultado}")
+            continue
+
+        task_id = sessions.task_de(addr, int(ns))
+        if task_id is not None:
+            entregas.append((task_id, data))
+        else:
+            print("task_id não encontrado.")
+
+    if fila_ingestao is not None:
+        if entregas:
+            fila_ingestao.put(("resultados", addr[0], entregas))
+        return
+
+    for task_id, data in entregas:
+        guardar_resultado(task_id, data)
+        guardar_metricas(addr[0], task_id, data)
+
+
+def tratar_fim_conexao(n_s, dados, addr):
+    """
+    Trata o encerramento da conexão de um agente (opcode 7).
+
+    Parâmetros:
+    ----------
+    n_s : int
+        O número de sequência da mensagem.
+    dados : bytes
+        Os dados da mensagem.
+    addr : tuple
+        O endereço (ip, porta) do agente.
+
+    Retorno:
+    -------
+    None
+    """
+
+    sessions.remover(addr)
+    canal.reiniciar_peer(addr)
+
+
+def tratar_salto(n_s, dados, addr):
+    """
+    Trata um salto (opcode 8): o agente desistiu das mensagens abaixo de `n_s` ainda não recebidas.
+
+    Parâmetros:
+    ----------
+    n_s : int
+        O menor número de sequência que o agente ainda tem por confirmar.
+    dados : bytes
+        Os dados da mensagem.
+    addr : tuple
+        O endereço (ip, porta) do agente.
+
+    Retorno:
+    -------
+    None
+    """
+
+    canal.processar_salto(addr, n_s)
+
+
+HANDLERS_UDP = {
+    NetTask.OP_REGISTO: tratar_registo,
+    NetTask.OP_RESULTADO: tratar_resultado,
+    NetTask.OP_ACK: tratar_ack,
+    NetTask.OP_KEEP_ALIVE: tratar_keep_alive,
+    NetTask.OP_FIM: tratar_fim_conexao,
+    NetTask.OP_SALTAR: tratar_salto,
+}
+
+
+def processar_datagrama(data, addr):
+    """
+    Interpreta um datagrama recebido e despacha-o para o handler do seu opcode.
+    Os fragmentos são remontados pelo canal fiável e a mensagem só é tratada quando estiver completa.
+    As mensagens de dados passam primeiro pelo canal fiável, que as confirma e descarta os duplicados.
+
+    Parâmetros:
+    ----------
+    data : bytes ou memoryview
+        O datagrama recebido.
+    addr : tuple
+        O endereço (ip, porta) do agente.
+
+    Retorno:
+    -------
+    None
+    """
+
+    try:
+        n_s, opcao, dados = NetTask.interpretar_protocolo_udp(data)
+        if opcao == NetTask.OP_FRAGMENTO:
+            data = canal.remontar(addr, data)
+            if data is None:
+                return
+            n_s, opcao, dados = NetTask.interpretar_protocolo_udp(data)
+
+        handler = HANDLERS_UDP.get(opcao)
+        if handler is None:
+            return
+
+        if opcao != NetTask.OP_ACK and opcao != NetTask.OP_SALTAR:
+            if opcao == NetTask.OP_REGISTO:
+                canal.reiniciar_peer(addr)
+            if not canal.receber(addr, n_s, opcao):
+                return
+
+        handler(n_s, dados, addr)
+    except ValueError as e:
+        print(f"Mensagem inválida de {addr[0]}: {e}")
+
+
 def start_udp_server():
     """
     Inicia o servidor UDP e aguarda por mensagens de clientes.
@@ -232,136 +938,125 @@ def start_udp_server():
 
     global udp_host
     global udp_port
-    global tasks
+    global canal
 
     udp_server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if udp_reuseport:
+        udp_server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
     udp_server_socket.bind((udp_host, udp_port))
 
     print(f"Servidor UDP escutando em {udp_host}:{udp_port}...")
-    tasks = NetTask.preparar_tasks("configuration_server.json")
+    carregar_tasks(CONFIG_FILE)
 
-    while True:
-        global array_n_s
-        global tasks_n_s
+    canal = NetTask.CanalFiavel(udp_server_socket.sendto, RETRY_TIMEOUT, MAX_ATTEMPTS, pacote_descartado, WINDOW_SIZE)
+    canal.iniciar()
 
-        resend_unacknowledged_packets(udp_server_socket, udp_host, udp_port)
+    buffers = NetTask.BufferPool(NetTask.tamanho_rececao(udp_host))
 
-        data = b''
-        while True:
-            chunk, addr = udp_server_socket.recvfrom(1024)
-            data += chunk
+    while True:
+        buffer = buffers.obter()
+        try:
+            data, addr = NetTask.receber_datagrama(udp_server_socket, buffer)
+            if data is not None:
+                processar_datagrama(data, addr)
+        except Exception as e:
+            # um datagrama com erro é descartado sem parar o servidor
+            print(f"Erro ao processar datagrama: {e}")
+        finally:
+            # os handlers não guardam a memoryview: o buffer pode ser reutilizado
+            buffers.devolver(buffer)
+
+
+class ServidorUDPProtocol(asyncio.DatagramProtocol):
+    """
+    Protocolo asyncio do servidor UDP. Cada datagrama é despachado para o handler do seu opcode
+    no event loop; as escritas em disco são entregues à thread do `storage`.
+    """
 
-            if b'\0' in data:
-                break
+    def connection_made(self, transport):
+        global canal
 
-        n_s, opcao, dados = NetTask.interpretar_protocolo_udp(data)
+        self.transport = transport
+        self.loop = asyncio.get_running_loop()
 
-        if opcao == 0:
-            with open("connections.txt", "a") as file:
-                connection_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                file.write(f"{addr[0]}|{addr[1]}|{connection_time}\n")
+        canal = NetTask.CanalFiavel(self.enviar_threadsafe, RETRY_TIMEOUT, MAX_ATTEMPTS, pacote_descartado, WINDOW_SIZE)
+        canal.iniciar()
 
-            response = NetTask.criar_protocolo_udp(n_s, "100", "Ok")
-            udp_server_socket.sendto(response, addr)
+    def datagram_received(self, data, addr):
+        try:
+            processar_datagrama(data, addr)
+        except Exception as e:
+            print(f"Erro ao processar datagrama de {addr[0]}: {e}")
 
-            
-            for task in tasks:
-                ip, task_id, dados = task.split(";")
-                if ip == addr[0]:
-                    tasks_n_s.append((n_s, task_id))
-                    response = NetTask.criar_protocolo_udp(n_s, "010", dados)
-                    udp_server_socket.sendto(response, addr)
-                    array_n_s.append([n_s, response, time.time(), 0, addr])
-
-        elif opcao == 5:
-            update_connection_time(addr[0], addr[1])
-            response = NetTask.criar_protocolo_udp(n_s, "100", "Keep Alive OK")
-            udp_server_socket.sendto(response, addr)
-
-        elif opcao == 4:
-            for packet_info in array_n_s:
-                if packet_info[0] == int(n_s):
-                    array_n_s.remove(packet_info)
-                    break
-            
-        elif opcao == 1:
-            resposta = NetTask.criar_protocolo_udp(n_s, "100", "")
-            udp_server_socket.sendto(resposta, addr)
-            task_id = None
-            ns, data = dados.decode().split("€")
+    def error_received(self, exc):
+        print(f"Erro no servidor UDP: {exc}")
 
-            
-            for task in tasks_n_s:
-                if task[0] == int(ns):
-                    task_id = task[1]
-                    break
-            
-            if task_id is not None:
-                filename = f"{task_id}.txt" 
+    def enviar_threadsafe(self, mensagem, addr):
+        """
+        Envia um datagrama a partir de qualquer thread (ex: a thread de retransmissão do canal fiável).
 
-                with open(filename, 'a') as file:
-                    file.write("-----------------------------------------------------\n")
-                    file.write(time.strftime("%Y-%m-%d %H:%M:%S") + "\n" + data + "\n")
+        Parâmetros:
+        ----------
+        mensagem : bytes
+            O datagrama a enviar.
+        addr : tuple
+            O endereço (ip, porta) de destino.
 
+        Retorno:
+        -------
+        None
+        """
 
-            else:
-                print("task_id não encontrado.")
+        self.loop.call_soon_threadsafe(self.transport.sendto, mensagem, addr)
 
-        elif opcao == 7:
-            with open("connections.txt", "r") as file:
-                lines = file.readlines()
 
-            with open("connections.txt", "w") as file:
-                for line in lines:
-                    conn_ip, conn_port, _ = line.strip().split("|")
-                    if conn_ip != addr[0] or conn_port != str(addr[1]):
-                        file.write(line)
+async def servir_udp_async():
+    """
+    Cria o endpoint UDP asyncio e mantém-no ativo.
 
-            response = NetTask.criar_protocolo_udp(n_s, "100", "Conexão encerrada.")
-            udp_server_socket.sendto(response, addr)            
-            
-        if len(array_n_s) > 10:
-            array_n_s.pop(0)
-       
+    Parâmetros:
+    ----------
+    None
+
+    Retorno:
+    -------
+    None
+    """
 
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(ServidorUDPProtocol, local_addr=(udp_host, udp_port),
+                                                              reuse_port=udp_reuseport)
 
+    try:
+        await asyncio.Event().wait()
+    finally:
+        transport.close()
 
 
-def update_connection_time(ip, port):
+def start_udp_server_async():
     """
-    Atualiza o horário da última conexão ativa de um cliente.
+    Inicia o servidor UDP no modo asyncio, em alternativa ao ciclo bloqueante de `start_udp_server`.
 
     Parâmetros:
     ----------
-    ip : str
-        O endereço IP do cliente.
-    port : int
-        A porta do cliente.
+    None
 
     Retorno:
     -------
     None
     """
 
-    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    updated = False
+    print(f"Servidor UDP (asyncio) escutando em {udp_host}:{udp_port}...")
+    carregar_tasks(CONFIG_FILE)
 
-    with open("connections.txt", "r") as file:
-        lines = file.readlines()
+    asyncio.run(servir_udp_async())
 
-    with open("connections.txt", "w") as file:
-        for line in lines:
-            conn_ip, conn_port, _ = line.strip().split("|")
-            if conn_ip == ip and conn_port == str(port):
-                file.write(f"{ip}|{port}|{current_time}\n")
-                updated = True
-            else:
-                file.write(line)
 
 
 def remove_inactive_connections():
     """
-    Remove conexões inativas por mais de 15 segundos.
+    Remove as sessões inativas há mais de `INACTIVITY_LIMIT` segundos e, se ativado,
+    grava periodicamente um snapshot das sessões em `connections.txt`.
 
     Parâmetros:
     ----------
@@ -372,20 +1067,139 @@ def remove_inactive_connections():
     None
     """
 
+    last_snapshot = 0
+
     while True:
-        time.sleep(CHECK_INACTIVE_INTERVAL)
+        proximo_prazo = sessions.proximo_prazo()
+        espera = CHECK_INACTIVE_INTERVAL
+        if proximo_prazo is not None:
+            espera = min(espera, max(0, proximo_prazo - time.time()))
+        time.sleep(espera)
+
+        for addr in sessions.expirar():
+            if canal is not None:
+                canal.reiniciar_peer(addr)
+
+        if SNAPSHOT_CONNECTIONS and time.time() - last_snapshot >= SNAPSHOT_INTERVAL:
+            if fila_ingestao is not None:
+                # num worker, as sessões são reportadas ao processo principal, que grava o snapshot conjunto
+                fila_ingestao.put(("sessoes", worker_numero, sessions.listar()))
+            else:
+                escrever_snapshot("connections.txt", listar_sessoes())
+                series.sincronizar()
+            last_snapshot = time.time()
+
+
+def listar_sessoes():
+    """
+    Devolve as sessões ativas: as deste processo ou, no modo multi-processo, as reportadas pelos workers UDP.
+
+    Parâmetros:
+    ----------
+    None
+
+    Retorno:
+    -------
+    list
+        Uma lista de tuplos (ip, porta, last_seen).
+    """
+
+    if not sessoes_workers:
+        return sessions.listar()
+    return [sessao for numero in sorted(sessoes_workers) for sessao in sessoes_workers[numero]]
+
+
+def executar_worker_udp(numero, fila, modo):
+    """
+    Ponto de entrada de um processo worker UDP (modo multi-processo).
+
+    Todos os workers escutam em `udp_port` com SO_REUSEPORT e o kernel distribui os agentes
+    pelos workers segundo o hash do fluxo (ip e porta de origem), pelo que cada agente é sempre
+    tratado pelo mesmo worker. O estado de cada agente (sessão, canal fiável e rotas dos
+    resultados) fica assim particionado entre os workers; o catálogo de tasks é carregado e
+    recarregado por cada worker.
+
+    Parâmetros:
+    ----------
+    numero : int
+        O número do worker.
+    fila : multiprocessing.Queue
+        A fila para o processo principal, que guarda os resultados e junta as sessões.
+    modo : str
+        O modo do servidor UDP (`"threaded"` ou `"asyncio"`).
+
+    Retorno:
+    -------
+    None
+    """
+
+    global udp_reuseport, fila_ingestao, worker_numero
+
+    udp_reuseport = True
+    fila_ingestao = fila
+    worker_numero = numero
+
+    threading.Thread(target=remove_inactive_connections, daemon=True).start()
+    threading.Thread(target=watch_configuration, args=(CONFIG_FILE,), daemon=True).start()
+
+    if modo == "asyncio":
+        start_udp_server_async()
+    else:
+        start_udp_server()
+
+
+def iniciar_workers_udp(quantidade, modo):
+    """
+    Lança `quantidade` processos worker UDP e a thread que guarda o que eles entregam.
+
+    Parâmetros:
+    ----------
+    quantidade : int
+        O número de workers.
+    modo : str
+        O modo do servidor UDP de cada worker (`"threaded"` ou `"asyncio"`).
 
-        current_time = datetime.now()
-        with open("connections.txt", "r") as file:
-            lines = file.readlines()
+    Retorno:
+    -------
+    list
+        Os processos lançados.
+    """
+
+    contexto = multiprocessing.get_context("spawn")
+    fila = contexto.Queue(UDP_WORKER_QUEUE_SIZE)
+
+    processos = []
+    for numero in range(quantidade):
+        processo = contexto.Process(target=executar_worker_udp, args=(numero, fila, modo), daemon=True)
+        processo.start()
+        processos.append(processo)
+
+    threading.Thread(target=consumir_ingestao, args=(fila,), daemon=True).start()
+    return processos
 
-        with open("connections.txt", "w") as file:
-            for line in lines:
-                ip, port, connection_time_str = line.strip().split("|")
-                connection_time = datetime.strptime(connection_time_str, "%Y-%m-%d %H:%M:%S")
 
-                if current_time - connection_time <= timedelta(seconds=INACTIVITY_LIMIT):
-                    file.write(line)
+def consumir_ingestao(fila):
+    """
+    Guarda os resultados entregues pelos workers UDP e regista as sessões que eles reportam.
+
+    Parâmetros:
+    ----------
+    fila : multiprocessing.Queue
+        A fila partilhada com os workers.
+
+    Retorno:
+    -------
+    None
+    """
+
+    while True:
+        tipo, origem, dados = fila.get()
+        if tipo == "resultados":
+            for task_id, data in dados:
+                guardar_resultado(task_id, data)
+                guardar_metricas(origem, task_id, data)
+        elif tipo == "sessoes":
+            sessoes_workers[origem] = dados
 
 
 
@@ -404,19 +1218,147 @@ def view_connections():
 
     print("\n--- Lista de Conexões ---")
 
-    if os.path.exists("connections.txt"):
-        with open("connections.txt", "r") as file:
-            i = 1
+    conexoes = listar_sessoes()
+    if conexoes:
+        i = 1
+        print("-------------------------------------------------------")
+        print(f"| Número ||    IP     || Porta ||   Hora de Conexão   |")
+        print("-------------------------------------------------------")
+        for ip, port, last_seen in conexoes:
+            connection_time = datetime.fromtimestamp(last_seen).strftime("%Y-%m-%d %H:%M:%S")
+            print(f"|   {i}    || {ip} || {port} || {connection_time} |")
             print("-------------------------------------------------------")
-            print(f"| Número ||    IP     || Porta ||   Hora de Conexão   |")
-            print("-------------------------------------------------------")
-            for line in file:
-                ip, port, connection_time = line.strip().split("|")
-                print(f"|   {i}    || {ip} || {port} || {connection_time} |")
-                print("-------------------------------------------------------")
-                i += 1
+            i += 1
     else:
-        print("O arquivo 'connections.txt' não existe.")
+        print("Não existem conexões ativas.")
+
+
+
+def view_statistics():
+    """
+    Exibe as métricas da receção de alertas TCP.
+
+    Parâmetros:
+    ----------
+    None
+
+    Retorno:
+    -------
+    None
+    """
+
+    print("\n--- Estatísticas do Servidor ---")
+    print(f"Conexões TCP aceites: {tcp_stats.total_aceites}")
+    print(f"Conexões TCP por segundo (último minuto): {tcp_stats.conexoes_por_segundo():.2f}")
+
+    for percentil in (50, 99):
+        latencia = tcp_stats.percentil_latencia(percentil)
+        if latencia is None:
+            print(f"Latência p{percentil} dos alertas: sem dados")
+        else:
+            print(f"Latência p{percentil} dos alertas: {latencia * 1000:.3f} ms")
+
+
+
+def formatar_registo(registo):
+    """
+    Formata um registo das séries temporais para a paginação e o acompanhamento de métricas.
+
+    Parâmetros:
+    ----------
+    registo : tuple
+        O tuplo (timestamp, device, task_id, metrica, valor) devolvido por `TimeSeriesStore.consultar`.
+
+    Retorno:
+    -------
+    str
+        O registo numa linha `data | device | task_id | metrica = valor`.
+    """
+
+    timestamp, device, task_id, metrica, valor = registo
+    return f"{datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')} | {device} | {task_id} | {metrica} = {valor:.2f}"
+
+
+def view_metrics():
+    """
+    Consulta as medições guardadas no armazenamento de séries temporais, filtradas por
+    dispositivo, task, métrica e intervalo de tempo, ou acompanha as novas medições.
+
+    Parâmetros:
+    ----------
+    None
+
+    Retorno:
+    -------
+    None
+    """
+
+    print("\n--- Consultar Métricas ---")
+    device = input("Dispositivo (vazio = todos): ").strip() or None
+    task_id = input("Task (vazio = todas): ").strip() or None
+    metrica = input("Métrica, ex: latency/8.8.8.8 (vazio = todas): ").strip() or None
+
+    modo = input("1. Consultar por intervalo de tempo\n2. Acompanhar novas medições\nEscolha (1, 2): ")
+    if modo == "2":
+        acompanhar(series.seguir(device=device, task_id=task_id, metrica=metrica), formatar_registo)
+        return
+
+    inicio = ler_instante("Início (AAAA-MM-DD HH:MM:SS, vazio = desde o início): ")
+    fim = ler_instante("Fim (AAAA-MM-DD HH:MM:SS, vazio = até ao fim): ")
+    paginar(series.consultar(device, task_id, metrica, inicio, fim), formatar_registo)
+
+def formatar_agregado(janela, resumo):
+    """
+    Formata os agregados de uma janela de uma série numa linha do menu de agregados.
+
+    Parâmetros:
+    ----------
+    janela : str
+        O nome da janela (ex: `"1m"`).
+    resumo : dict or None
+        O resumo devolvido por `RollingWindow.resumo`, ou None se a janela não tiver medições.
+
+    Retorno:
+    -------
+    str
+        A linha formatada.
+    """
+
+    if resumo is None:
+        return f"    {janela:>3}: sem medições"
+    return (f"    {janela:>3}: n={resumo['contagem']} min={resumo['minimo']:.2f} max={resumo['maximo']:.2f} "
+            f"média={resumo['media']:.2f} ewma={resumo['ewma']:.2f} "
+            f"p50={resumo['p50']:.2f} p95={resumo['p95']:.2f} p99={resumo['p99']:.2f}")
+
+
+def view_aggregates():
+    """
+    Mostra os agregados das janelas deslizantes (1 minuto, 5 minutos e 1 hora) de cada métrica,
+    calculados em memória à medida que os resultados chegam.
+
+    Parâmetros:
+    ----------
+    None
+
+    Retorno:
+    -------
+    None
+    """
+
+    print("\n--- Agregados das Métricas ---")
+    device = input("Dispositivo (vazio = todos): ").strip() or None
+    task_id = input("Task (vazio = todas): ").strip() or None
+    metrica = input("Métrica, ex: latency/8.8.8.8 (vazio = todas): ").strip() or None
+
+    resultado = agregados.consultar(device, task_id, metrica)
+    if not resultado:
+        print("Nenhuma métrica encontrada.")
+        return
+
+    for (device, task_id, metrica), janelas in resultado:
+        print(f"\n{device} | {task_id} | {metrica}")
+        for janela, resumo in janelas:
+            print(formatar_agregado(janela, resumo))
 
 
 
@@ -454,10 +1396,13 @@ def main():
             1. Ver Lista de Conexões
             2. Ver Tasks recebidas
             3. Ver Monitoramento de Hardware
-            4. Sair
+            4. Ver Estatísticas do Servidor
+            5. Consultar Métricas
+            6. Ver Agregados das Métricas
+            7. Sair
         """)
         
-        choice = input("Escolha uma opção (1, 2, 3, 4): ")
+        choice = input("Escolha uma opção (1, 2, 3, 4, 5, 6, 7): ")
         
         if choice == '1':
             view_connections()
@@ -466,7 +1411,15 @@ def main():
         elif choice == '3':
             listar_arquivos_monitorizacao(os.getcwd())
         elif choice == '4':
+            view_statistics()
+        elif choice == '5':
+            view_metrics()
+        elif choice == '6':
+            view_aggregates()
+        elif choice == '7':
             print("Saindo...")
+            storage.fechar()
+            series.fechar()
             break
         else:
             print("Opção inválida! Tente novamente.")
@@ -485,13 +1438,38 @@ if __name__ == "__main__":
     None
     """
 
+    parser = argparse.ArgumentParser(description="Servidor NMS")
+    parser.add_argument("--udp-mode", choices=["threaded", "asyncio"], default=UDP_SERVER_MODE,
+                        help="Modo do servidor UDP: ciclo bloqueante numa thread ou event loop asyncio.")
+    parser.add_argument("--udp-workers", type=int, default=UDP_WORKERS,
+                        help="Número de processos UDP a partilhar a porta com SO_REUSEPORT (1 = sem workers).")
+    args = parser.parse_args()
+
+    if args.udp_workers > 1 and not hasattr(socket, "SO_REUSEPORT"):
+        parser.error("--udp-workers requer SO_REUSEPORT, que este sistema não suporta.")
+
+    compressor.iniciar()
+    storage.iniciar()
+    series.abrir()
+
     tcp_thread = threading.Thread(target=start_tcp_server, daemon=True)
     tcp_thread.start()
 
-    udp_thread = threading.Thread(target=start_udp_server, daemon=True)
-    udp_thread.start()
-
     cleanup_thread = threading.Thread(target=remove_inactive_connections, daemon=True)
     cleanup_thread.start()
 
+    if args.udp_workers > 1:
+        iniciar_workers_udp(args.udp_workers, args.udp_mode)
+    else:
+        if args.udp_mode == "asyncio":
+            udp_target = start_udp_server_async
+        else:
+            udp_target = start_udp_server
+
+        udp_thread = threading.Thread(target=udp_target, daemon=True)
+        udp_thread.start()
+
+        config_thread = threading.Thread(target=watch_configuration, args=(CONFIG_FILE,), daemon=True)
+        config_thread.start()
+
     main()
@@ -0,0 +1,284 @@
+import bisect
+import math
+import threading
+import time
+
+AGG_WINDOWS = (("1m", 60), ("5m", 300), ("1h", 3600))
+AGG_SLICES = 12
+SKETCH_ACCURACY = 0.02
+SKETCH_MAX_BINS = 512
+QUANTIS = (0.5, 0.95, 0.99)
+
+
+class QuantileSketch:
+    """
+    Esboço de quantis com erro relativo limitado (ao estilo do DDSketch), que pode ser fundido com outros.
+
+    Cada valor positivo é contado no contentor `ceil(log(valor) / log(gama))`, com
+    `gama = (1 + precisao) / (1 - precisao)`, pelo que qualquer quantil é estimado com um erro
+    relativo de no máximo `precisao`. Dois esboços com a mesma precisão fundem-se somando as
+    contagens dos contentores. O número de contentores está limitado a `max_contentores`: acima
+    disso, os contentores dos valores mais baixos são juntados, sacrificando a precisão dos
+    quantis mais baixos em favor de p95/p99.
+    """
+
+    def __init__(self, precisao=SKETCH_ACCURACY, max_contentores=SKETCH_MAX_BINS):
+        self.precisao = precisao
+        self.max_contentores = max_contentores
+        self.log_gama = math.log((1 + precisao) / (1 - precisao))
+        self.contentores = {}
+        self.zeros = 0
+        self.contagem = 0
+
+    def acrescentar(self, valor, vezes=1):
+        """
+        Conta um valor no esboço. Valores nulos ou negativos contam como zero.
+
+        Parâmetros:
+        ----------
+        valor : float
+            O valor a contar.
+        vezes : int, opcional
+            O número de ocorrências do valor.
+
+        Retorno:
+        -------
+        None
+        """
+
+        self.contagem += vezes
+        if valor <= 0:
+            self.zeros += vezes
+            return
+
+        indice = math.ceil(math.log(valor) / self.log_gama)
+        self.contentores[indice] = self.contentores.get(indice, 0) + vezes
+        if len(self.contentores) > self.max_contentores:
+            self._compactar()
+
+    def juntar(self, outro):
+        """
+        Funde outro esboço, com a mesma precisão, neste.
+
+        Parâmetros:
+        ----------
+        outro : QuantileSketch
+            O esboço a fundir.
+
+        Retorno:
+        -------
+        None
+        """
+
+        self.contagem += outro.contagem
+        self.zeros += outro.zeros
+        for indice, contagem in outro.contentores.items():
+            self.contentores[indice] = self.contentores.get(indice, 0) + contagem
+        if len(self.contentores) > self.max_contentores:
+            self._compactar()
+
+    def quantil(self, q):
+        """
+        Estima um quantil dos valores contados.
+
+        Parâmetros:
+        ----------
+        q : float
+            O quantil, entre 0 e 1 (ex: 0.95).
+
+        Retorno:
+        -------
+        float or None
+            A estimativa, ou None se o esboço estiver vazio.
+        """
+
+        if self.contagem == 0:
+            return None
+
+        posicao = q * (self.contagem - 1)
+        if posicao < self.zeros:
+            return 0.0
+
+        acumulado = self.zeros
+        for indice in sorted(self.contentores):
+            acumulado += self.contentores[indice]
+            if acumulado > posicao:
+                # o ponto do contentor com erro relativo mínimo para os dois extremos
+                return 2 * math.exp(indice * self.log_gama) / (1 + math.exp(self.log_gama))
+        return 2 * math.exp(max(self.contentores) * self.log_gama) / (1 + math.exp(self.log_gama))
+
+    def _compactar(self):
+        indices = sorted(self.contentores)
+        excesso = len(indices) - self.max_contentores
+        destino = indices[excesso]
+        for indice in indices[:excesso]:
+            self.contentores[destino] += self.contentores.pop(indice)
+
+
+class RollingWindow:
+    """
+    Janela deslizante de uma métrica, com atualização em O(1).
+
+    A janela de `duracao` segundos é dividida em `fatias` fatias, guardadas num buffer circular;
+    cada fatia acumula a contagem, o mínimo, o máximo, a soma e um `QuantileSketch` das suas
+    amostras. Uma consulta funde as fatias ainda dentro da janela, pelo que a janela avança
+    em passos de `duracao / fatias` segundos. A média móvel exponencial (EWMA) é mantida à
+    parte, com uma constante de tempo igual à duração da janela.
+    """
+
+    def __init__(self, duracao, fatias=AGG_SLICES):
+        self.duracao = duracao
+        self.fatias = fatias
+        self.passo = duracao / fatias
+        self.buffer = [None] * fatias
+        self.ewma = None
+        self.ultimo_instante = None
+
+    def acrescentar(self, instante, valor):
+        """
+        Acrescenta uma amostra à janela.
+
+        Parâmetros:
+        ----------
+        instante : float
+            O instante da amostra, em segundos desde a época.
+        valor : float
+            O valor da amostra.
+
+        Retorno:
+        -------
+        None
+        """
+
+        numero = int(instante // self.passo)
+        fatia = self.buffer[numero % self.fatias]
+        if fatia is None or fatia["numero"] != numero:
+            fatia = self.buffer[numero % self.fatias] = {"numero": numero, "contagem": 0, "minimo": valor,
+                                                         "maximo": valor, "soma": 0.0, "esboco": QuantileSketch()}
+
+        fatia["contagem"] += 1
+        fatia["minimo"] = min(fatia["minimo"], valor)
+        fatia["maximo"] = max(fatia["maximo"], valor)
+        fatia["soma"] += valor
+        fatia["esboco"].acrescentar(valor)
+
+        if self.ewma is None:
+            self.ewma = valor
+        else:
+            intervalo = max(0.0, instante - self.ultimo_instante)
+            self.ewma += (1 - math.exp(-intervalo / self.duracao)) * (valor - self.ewma)
+        self.ultimo_instante = instante
+
+    def resumo(self, agora=None):
+        """
+        Calcula os agregados das amostras dentro da janela.
+
+        Parâmetros:
+        ----------
+        agora : float, opcional
+            O instante da consulta, em segundos desde a época.
+
+        Retorno:
+        -------
+        dict or None
+            As chaves `contagem`, `minimo`, `maximo`, `media`, `ewma`, `p50`, `p95` e `p99`,
+            ou None se a janela não tiver amostras.
+        """
+
+        agora = time.time() if agora is None else agora
+        atual = int(agora // self.passo)
+        fatias = [fatia for fatia in self.buffer if fatia is not None and atual - self.fatias < fatia["numero"] <= atual]
+        if not fatias:
+            return None
+
+        esboco = QuantileSketch()
+        for fatia in fatias:
+            esboco.juntar(fatia["esboco"])
+
+        contagem = sum(fatia["contagem"] for fatia in fatias)
+        resumo = {"contagem": contagem,
+                  "minimo": min(fatia["minimo"] for fatia in fatias),
+                  "maximo": max(fatia["maximo"] for fatia in fatias),
+                  "media": sum(fatia["soma"] for fatia in fatias) / contagem,
+                  "ewma": self.ewma}
+        for q in QUANTIS:
+            resumo[f"p{round(q * 100)}"] = esboco.quantil(q)
+        return resumo
+
+
+class Aggregator:
+    """
+    Agregados em memória das medições recebidas, por (dispositivo, task, métrica).
+
+    Cada série tem uma `RollingWindow` por janela de `janelas` (por omissão 1 minuto, 5 minutos e
+    1 hora). A memória de cada série é limitada: um número fixo de fatias por janela, cada uma
+    com no máximo `SKETCH_MAX_BINS` contentores no esboço de quantis.
+    """
+
+    def __init__(self, janelas=AGG_WINDOWS):
+        self.janelas = janelas
+        self.series = {}
+        self.chaves = []
+        self.lock = threading.Lock()
+
+    def acrescentar(self, instante, device, task_id, metrica, valor):
+        """
+        Acrescenta uma medição às janelas da sua série.
+
+        Parâmetros:
+        ----------
+        instante : float
+            O instante da medição, em segundos desde a época.
+        device : str
+            O IP do agente.
+        task_id : str
+            O identificador da task.
+        metrica : str
+            A métrica (ex: `"latency/8.8.8.8"`).
+        valor : float
+            O valor medido.
+
+        Retorno:
+        -------
+        None
+        """
+
+        chave = (device, task_id, metrica)
+        with self.lock:
+            janelas = self.series.get(chave)
+            if janelas is None:
+                janelas = self.series[chave] = [(nome, RollingWindow(duracao)) for nome, duracao in self.janelas]
+                bisect.insort(self.chaves, chave)
+            for _, janela in janelas:
+                janela.acrescentar(instante, valor)
+
+    def consultar(self, device=None, task_id=None, metrica=None, agora=None):
+        """
+        Devolve os agregados atuais das séries que correspondem aos filtros, sem aceder ao disco.
+
+        Parâmetros:
+        ----------
+        device : str, opcional
+            Filtra pelo IP do agente.
+        task_id : str, opcional
+            Filtra pela task.
+        metrica : str, opcional
+            Filtra pela métrica.
+        agora : float, opcional
+            O instante da consulta, em segundos desde a época.
+
+        Retorno:
+        -------
+        list
+            Tuplos ((device, task_id, metrica), [(janela, resumo)]), ordenados pela chave. O resumo
+            é o de `RollingWindow.resumo` (None para janelas sem amostras).
+        """
+
+        filtros = (device, task_id, metrica)
+        resultado = []
+        with self.lock:
+            for chave in self.chaves:
+                if any(filtro is not None and filtro != valor for filtro, valor in zip(filtros, chave)):
+                    continue
+                resultado.append((chave, [(nome, janela.resumo(agora)) for nome, janela in self.series[chave]]))
+        return resultado
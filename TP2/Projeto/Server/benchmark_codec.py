@@ -0,0 +1,233 @@
+import struct
+import sys
+import timeit
+
+import NetTask
+
+
+def criar_protocolo_udp_legado(n_s, opcao, dados):
+    """
+    Implementação anterior de `NetTask.criar_protocolo_udp` (opcodes em string e concatenação
+    de bytes), mantida apenas como referência para o benchmark.
+    """
+
+    if (opcao == "000" or opcao == "101" or opcao == "100" or opcao == "111"):
+        opcao_inteiro = int(opcao, 2)
+        protocolo = struct.pack('!IB', n_s, opcao_inteiro)
+        protocolo += b'\0'
+
+    elif opcao == "010":
+        opcao_inteiro = int(opcao, 2)
+
+        FREQUENCY, M_CPU, M_RAM, INTERFACES, M_IS, M_PL, M_JI, tasks = dados.split("-")
+        latency, bandwidth, jitter, packet_loss = tasks.split("?")
+
+        FREQUENCY = int(FREQUENCY)
+        M_CPU = float(M_CPU)
+        M_RAM = float(M_RAM)
+        M_IS = int(M_IS)
+        M_PL = float(M_PL)
+        M_JI = float(M_JI)
+
+        INTERFACES = INTERFACES.strip("[]").replace("'", "").replace(" ", "")
+        interfaces_len = len(INTERFACES)
+
+        protocolo = struct.pack("!IBI", n_s, opcao_inteiro, FREQUENCY)
+        protocolo += struct.pack("!f", M_CPU)
+        protocolo += struct.pack("!f", M_RAM)
+        protocolo += struct.pack("!I", interfaces_len)
+        protocolo += INTERFACES.encode('utf-8')
+        protocolo += struct.pack("!I", M_IS)
+        protocolo += struct.pack("!f", M_PL)
+        protocolo += struct.pack("!f", M_JI)
+        protocolo += struct.pack("!I", len(latency))
+        protocolo += latency.encode('utf-8')
+        protocolo += struct.pack("!I", len(bandwidth))
+        protocolo += bandwidth.encode('utf-8')
+        protocolo += struct.pack("!I", len(jitter))
+        protocolo += jitter.encode('utf-8')
+        protocolo += struct.pack("!I", len(packet_loss))
+        protocolo += packet_loss.encode('utf-8')
+        protocolo += b'\0'
+
+    elif opcao == "001":
+        opcao_inteiro = int(opcao, 2)
+        protocolo = struct.pack('!IB', n_s, opcao_inteiro)
+        protocolo += dados.encode('utf-8')
+        protocolo += b'\0'
+
+    return protocolo
+
+
+def interpretar_protocolo_udp_legado(mensagem):
+    """
+    Implementação anterior de `NetTask.interpretar_protocolo_udp`.
+    """
+
+    n_s, = struct.unpack("!I", mensagem[:4])
+    opcao, = struct.unpack("!B", mensagem[4:5])
+    dados = mensagem[5:]
+    return n_s, opcao, dados
+
+
+def descodificar_task_legado(task):
+    """
+    Descodificação anterior dos dados de task, com os deslocamentos calculados à mão em `set_limits`.
+    """
+
+    FREQUENCY, = struct.unpack("!I", task[:4])
+    M_CPU, = struct.unpack("!f", task[4:8])
+    M_RAM, = struct.unpack("!f", task[8:12])
+    INTERFACES_LEN, = struct.unpack("!I", task[12:16])
+    INTERFACES = task[16:16+INTERFACES_LEN].decode('utf-8')
+    M_IS, = struct.unpack("!I", task[16+INTERFACES_LEN:20+INTERFACES_LEN])
+    M_PL, = struct.unpack("!f", task[20+INTERFACES_LEN:24+INTERFACES_LEN])
+    M_JI, = struct.unpack("!f", task[24+INTERFACES_LEN:28+INTERFACES_LEN])
+    LEN_LATENCY, = struct.unpack("!I", task[28+INTERFACES_LEN:32+INTERFACES_LEN])
+    latency = task[32+INTERFACES_LEN:32+INTERFACES_LEN+LEN_LATENCY].decode('utf-8')
+    LEN_BANDWIDTH, = struct.unpack("!I", task[32+INTERFACES_LEN+LEN_LATENCY:36+INTERFACES_LEN+LEN_LATENCY])
+    bandwidth = task[36+INTERFACES_LEN+LEN_LATENCY:36+INTERFACES_LEN+LEN_LATENCY+LEN_BANDWIDTH].decode('utf-8')
+    LEN_JITTER, = struct.unpack("!I", task[36+INTERFACES_LEN+LEN_LATENCY+LEN_BANDWIDTH:40+INTERFACES_LEN+LEN_LATENCY+LEN_BANDWIDTH])
+    jitter = task[40+INTERFACES_LEN+LEN_LATENCY+LEN_BANDWIDTH:40+INTERFACES_LEN+LEN_LATENCY+LEN_BANDWIDTH+LEN_JITTER].decode('utf-8')
+    LEN_PACKET_LOSS, = struct.unpack("!I", task[40+INTERFACES_LEN+LEN_LATENCY+LEN_BANDWIDTH+LEN_JITTER:44+INTERFACES_LEN+LEN_LATENCY+LEN_BANDWIDTH+LEN_JITTER])
+    packet_loss = task[44+INTERFACES_LEN+LEN_LATENCY+LEN_BANDWIDTH+LEN_JITTER:44+INTERFACES_LEN+LEN_LATENCY+LEN_BANDWIDTH+LEN_JITTER+LEN_PACKET_LOSS].decode('utf-8')
+
+    return FREQUENCY, M_CPU, M_RAM, INTERFACES, M_IS, M_PL, M_JI, latency, bandwidth, jitter, packet_loss
+
+
+CONFIG = NetTask.ConfigTask(
+    frequency=5, m_cpu=2.0, m_ram=90.0, interfaces="eth0,eth1,eth2", m_is=2000, m_pl=5.0, m_ji=100.0,
+    latency="8.8.8.8:5:30", bandwidth="client:192.168.1.1:10:TCP:30",
+    jitter="8.8.4.4:10:15", packet_loss="8.8.4.4:10:20", task_id="task-202-1",
+)
+
+CONFIG_LEGADO = ("5-2-90-['eth0', 'eth1', 'eth2']-2000-5-100-"
+                 "8.8.8.8:5:30?client:192.168.1.1:10:TCP:30?8.8.4.4:10:15?8.8.4.4:10:20")
+
+RESULTADO = "1€Latência média para 8.8.8.8: 12.34 ms\n"
+
+
+def preencher_template(template, n_s):
+    """
+    Mesma operação que `NetTask.CanalFiavel.enviar_template` faz a uma mensagem do catálogo.
+    """
+
+    mensagem = bytearray(template)
+    NetTask.NUMERO_SEQUENCIA.pack_into(mensagem, 0, n_s)
+    return mensagem
+
+
+def lote_resultados(quantidade):
+    """
+    Cria um lote com `quantidade` resultados de latência, jitter e perda com valores variados.
+    """
+
+    resultados = []
+    for i in range(quantidade):
+        resultados.append((f"{i + 1}€Latência média para 8.8.8.8: {10 + i * 0.37:.2f} ms\n",
+                           f"{i + 2}€Jitter para 8.8.4.4: {i * 0.11:.2f} ms\n",
+                           f"{i + 3}€Perda de pacotes para 8.8.4.4: {i % 3 * 10}%\n")[i % 3])
+    return NetTask.criar_lote_resultados(resultados)
+
+
+def benchmark_compressao(repeticoes=20000):
+    """
+    Mede os bytes por resultado e o custo de CPU de `criar_protocolo_udp` e `interpretar_protocolo_udp`
+    com e sem compressão, para lotes de vários tamanhos.
+
+    Parâmetros:
+    ----------
+    repeticoes : int, opcional
+        O número de operações por medição.
+
+    Retorno:
+    -------
+    None
+    """
+
+    print(f"{'mensagem':<24} {'bytes':>7} {'comprimida':>11} {'B/resultado':>16} {'criar':>18} {'interpretar':>20}")
+    casos = [(f"task ({len(NetTask.codificar_task(0, CONFIG))} B)", NetTask.OP_TASK, CONFIG, None)]
+    casos += [(f"lote de {n} resultado(s)", NetTask.OP_RESULTADO, lote_resultados(n), n) for n in (1, 2, 5, 10, 30)]
+
+    for descricao, opcao, dados, quantidade in casos:
+        simples = NetTask.criar_protocolo_udp(8, opcao, dados)
+        comprimida = NetTask.criar_protocolo_udp(8, opcao, dados, comprimir=True)
+
+        tempos = []
+        for funcao in (lambda: NetTask.criar_protocolo_udp(8, opcao, dados),
+                       lambda: NetTask.criar_protocolo_udp(8, opcao, dados, comprimir=True),
+                       lambda: NetTask.interpretar_protocolo_udp(simples),
+                       lambda: NetTask.interpretar_protocolo_udp(comprimida)):
+            tempos.append(min(timeit.repeat(funcao, number=repeticoes, repeat=3)) / repeticoes * 1e6)
+
+        por_resultado = f"{len(simples) / quantidade:.1f} -> {len(comprimida) / quantidade:.1f}" if quantidade else ""
+        print(f"{descricao:<24} {len(simples):>7} {len(comprimida):>11} {por_resultado:>16} "
+              f"{tempos[0]:>6.2f} -> {tempos[1]:>6.2f} us {tempos[2]:>8.2f} -> {tempos[3]:>6.2f} us")
+
+
+def medir(descricao, funcao, repeticoes):
+    segundos = min(timeit.repeat(funcao, number=repeticoes, repeat=5))
+    print(f"{descricao:<52} {repeticoes / segundos:>12,.0f} ops/s")
+    return segundos
+
+
+def benchmark(repeticoes=100000):
+    """
+    Compara o débito do codec atual com o da implementação anterior.
+
+    Parâmetros:
+    ----------
+    repeticoes : int, opcional
+        O número de operações por medição.
+
+    Retorno:
+    -------
+    None
+    """
+
+    mensagem_task = NetTask.criar_protocolo_udp(7, NetTask.OP_TASK, CONFIG)
+    dados_task = bytes(NetTask.interpretar_protocolo_udp(mensagem_task)[2])
+    dados_task_legado = interpretar_protocolo_udp_legado(mensagem_task)[2]
+
+    mensagem_lote = NetTask.criar_protocolo_udp(
+        10, NetTask.OP_RESULTADO, NetTask.criar_lote_resultados([RESULTADO] * 30))
+
+    template = NetTask.codificar_task(0, CONFIG)
+    comprimido = NetTask.comprimir_mensagem(template)
+
+    casos = [
+        ("codificar task",
+         lambda: criar_protocolo_udp_legado(7, "010", CONFIG_LEGADO),
+         lambda: NetTask.criar_protocolo_udp(7, NetTask.OP_TASK, CONFIG)),
+        ("task pré-codificada do catálogo",
+         lambda: NetTask.criar_protocolo_udp(7, NetTask.OP_TASK, CONFIG),
+         lambda: preencher_template(template, 7)),
+        ("task comprimida pré-codificada do catálogo",
+         lambda: NetTask.criar_protocolo_udp(7, NetTask.OP_TASK, CONFIG, comprimir=True),
+         lambda: preencher_template(comprimido, 7)),
+        ("codificar resultado",
+         lambda: criar_protocolo_udp_legado(8, "001", RESULTADO),
+         lambda: NetTask.criar_protocolo_udp(8, NetTask.OP_RESULTADO, RESULTADO)),
+        ("codificar keep-alive",
+         lambda: criar_protocolo_udp_legado(9, "101", ""),
+         lambda: NetTask.criar_protocolo_udp(9, NetTask.OP_KEEP_ALIVE, "")),
+        ("interpretar cabeçalho",
+         lambda: interpretar_protocolo_udp_legado(mensagem_task),
+         lambda: NetTask.interpretar_protocolo_udp(mensagem_task)),
+        ("interpretar lote de resultados (1.3 KB)",
+         lambda: interpretar_protocolo_udp_legado(mensagem_lote),
+         lambda: NetTask.interpretar_protocolo_udp(mensagem_lote)),
+        ("descodificar task",
+         lambda: descodificar_task_legado(dados_task_legado),
+         lambda: NetTask.descodificar_task(dados_task)),
+    ]
+
+    for descricao, legado, atual in casos:
+        antes = medir(f"{descricao} (anterior)", legado, repeticoes)
+        depois = medir(f"{descricao} (codec)", atual, repeticoes)
+        print(f"{'':<52} {antes / depois:>11.2f}x\n")
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
+    benchmark_compressao()
@@ -0,0 +1,196 @@
+"""
+Mede o débito de ingestão de resultados (opcode 1) do servidor UDP com 1, 2 e 4 workers
+SO_REUSEPORT, em localhost.
+
+Vários processos geradores simulam agentes: cada agente regista-se, confirma as tasks que
+recebe e envia lotes de resultados com uma janela de `JANELA` mensagens por confirmar
+(retransmitindo a partir do ACK cumulativo quando este não avança). O débito é medido de ponta
+a ponta: o processo principal corre o `consumir_ingestao` real (ficheiros de resultados, séries
+temporais e agregados, numa diretoria temporária) e um resultado só conta depois de as suas
+métricas terem sido acrescentadas pela thread do `storage`. O número de resultados retirados da
+fila de ingestão por segundo é mostrado à parte, para separar o limite dos workers do limite do
+processo principal.
+
+Com menos de 2 CPUs disponíveis os workers não podem correr em paralelo e a comparação não mede
+escalabilidade, por isso o benchmark recusa-se a correr.
+
+Uso: python benchmark_udp_workers.py [duração] [geradores] [agentes por gerador]
+"""
+
+import multiprocessing
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import NetTask
+import NMS_SERVER
+
+PORTA_BASE = 47000
+DURACAO = 10
+GERADORES = 4
+AGENTES = 16
+JANELA = 32
+RESULTADOS_POR_LOTE = 10
+WORKERS = (1, 2, 4)
+
+
+def worker(numero, fila, porta):
+    NMS_SERVER.udp_port = porta
+    NMS_SERVER.executar_worker_udp(numero, fila, "threaded")
+
+
+def registar(sock):
+    sock.send(NetTask.criar_protocolo_udp(0, NetTask.OP_REGISTO, ""))
+    task_ns = None
+    prazo = time.monotonic() + 2
+
+    while time.monotonic() < prazo:
+        try:
+            mensagem = sock.recv(NetTask.UDP_MAX_DATAGRAM)
+        except socket.timeout:
+            continue
+        n_s, opcao, _ = NetTask.interpretar_protocolo_udp(mensagem)
+        if opcao == NetTask.OP_TASK:
+            task_ns = n_s
+            sock.send(NetTask.criar_ack(n_s, 0))
+            return task_ns
+    return None
+
+
+def gerar_carga(porta, agentes, duracao, pronto, inicio):
+    sockets = []
+    for _ in range(agentes):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.connect(("127.0.0.1", porta))
+        sock.settimeout(0.2)
+        task_ns = registar(sock)
+        if task_ns is None:
+            print("Agente sem task: a configuração tem o dispositivo 127.0.0.1?")
+            continue
+        lote = NetTask.criar_lote_resultados(
+            [f"{task_ns}€Latência média para 8.8.8.8: 1.{i:02d} ms\n" for i in range(RESULTADOS_POR_LOTE)])
+        sock.setblocking(False)
+        sockets.append({"sock": sock, "lote": lote, "proximo": 1, "confirmado": 0, "progresso": time.monotonic()})
+
+    pronto.set()
+    inicio.wait()
+    fim = time.monotonic() + duracao
+
+    while time.monotonic() < fim:
+        for agente in sockets:
+            sock = agente["sock"]
+            while True:
+                try:
+                    mensagem = sock.recv(64)
+                except (BlockingIOError, ConnectionRefusedError):
+                    break
+                n_s, opcao, _ = NetTask.interpretar_protocolo_udp(mensagem)
+                if opcao == NetTask.OP_ACK and n_s > agente["confirmado"]:
+                    agente["confirmado"] = n_s
+                    agente["progresso"] = time.monotonic()
+
+            if time.monotonic() - agente["progresso"] > 0.5:
+                # sem progresso: retransmite a partir do ACK cumulativo
+                agente["proximo"] = agente["confirmado"] + 1
+                agente["progresso"] = time.monotonic()
+
+            while agente["proximo"] <= agente["confirmado"] + JANELA:
+                try:
+                    sock.send(NetTask.criar_protocolo_udp(agente["proximo"], NetTask.OP_RESULTADO, agente["lote"]))
+                except (BlockingIOError, ConnectionRefusedError):
+                    break
+                agente["proximo"] += 1
+
+    for agente in sockets:
+        agente["sock"].send(NetTask.criar_protocolo_udp(agente["proximo"], NetTask.OP_FIM, ""))
+        agente["sock"].close()
+
+
+class Contador:
+    """
+    Conta as chamadas a uma função do NMS_SERVER, sem alterar o seu comportamento.
+    """
+
+    def __init__(self, funcao):
+        self.funcao = funcao
+        self.total = 0
+        self.__name__ = funcao.__name__
+
+    def __call__(self, *argumentos):
+        self.total += 1
+        return self.funcao(*argumentos)
+
+
+def medir(contexto, workers, porta, duracao, geradores, agentes, entregues, concluidos):
+    fila = contexto.Queue(NMS_SERVER.UDP_WORKER_QUEUE_SIZE)
+    servidores = [contexto.Process(target=worker, args=(numero, fila, porta), daemon=True) for numero in range(workers)]
+    for processo in servidores:
+        processo.start()
+    time.sleep(1.5)
+
+    inicio = contexto.Event()
+    prontos = [contexto.Event() for _ in range(geradores)]
+    cargas = [contexto.Process(target=gerar_carga, args=(porta, agentes, duracao, pronto, inicio), daemon=True)
+              for pronto in prontos]
+    for processo in cargas:
+        processo.start()
+    for pronto in prontos:
+        pronto.wait()
+
+    threading.Thread(target=NMS_SERVER.consumir_ingestao, args=(fila,), daemon=True).start()
+    inicio.set()
+    entregues_antes, concluidos_antes = entregues.total, concluidos.total
+    t0 = time.monotonic()
+    time.sleep(duracao)
+    decorrido = time.monotonic() - t0
+    debito_fila = (entregues.total - entregues_antes) / decorrido
+    debito = (concluidos.total - concluidos_antes) / decorrido
+
+    for processo in cargas + servidores:
+        processo.terminate()
+        processo.join()
+
+    # o que ficou na fila não pode contaminar a medição seguinte
+    while not fila.empty():
+        time.sleep(0.1)
+    NMS_SERVER.storage.esvaziar()
+    return debito, debito_fila
+
+
+if __name__ == "__main__":
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    if (cpus or 1) < 2:
+        sys.exit(f"{cpus or 1} CPU disponível: o benchmark de escalabilidade precisa de pelo menos 2.")
+
+    diretoria = tempfile.mkdtemp(prefix="benchmark_udp_workers-")
+    shutil.copy(os.path.join(os.path.dirname(os.path.abspath(__file__)), NMS_SERVER.CONFIG_FILE), diretoria)
+    os.chdir(diretoria)
+    duracao = float(sys.argv[1]) if len(sys.argv) > 1 else DURACAO
+    geradores = int(sys.argv[2]) if len(sys.argv) > 2 else GERADORES
+    agentes = int(sys.argv[3]) if len(sys.argv) > 3 else AGENTES
+
+    contexto = multiprocessing.get_context("spawn")
+    print(f"{cpus} CPU(s), {geradores} gerador(es) x {agentes} agentes, {duracao:.0f} s por medição")
+
+    NMS_SERVER.storage.iniciar()
+    NMS_SERVER.series.abrir()
+    entregues = NMS_SERVER.guardar_resultado = Contador(NMS_SERVER.guardar_resultado)
+    concluidos = NMS_SERVER.acrescentar_metricas = Contador(NMS_SERVER.acrescentar_metricas)
+
+    try:
+        referencia = None
+        for indice, workers in enumerate(WORKERS):
+            debito, debito_fila = medir(contexto, workers, PORTA_BASE + indice, duracao, geradores, agentes,
+                                        entregues, concluidos)
+            referencia = referencia or debito
+            print(f"{workers} worker(s): {debito:>10.0f} resultados/s de ponta a ponta ({debito / referencia:.2f}x), "
+                  f"{debito_fila:>10.0f} resultados/s retirados da fila de ingestão")
+    finally:
+        NMS_SERVER.storage.fechar()
+        NMS_SERVER.series.fechar()
+        os.chdir("/")
+        shutil.rmtree(diretoria, ignore_errors=True)
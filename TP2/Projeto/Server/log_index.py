@@ -0,0 +1,263 @@
+import bisect
+import os
+import re
+import time
+
+import log_segments
+
+INDEX_STRIDE = 64 * 1024
+FOLLOW_INTERVAL = 1.0
+FORMATO_INSTANTE = "%Y-%m-%d %H:%M:%S"
+
+SEPARADOR = re.compile(rb"^-{5,}\r?\n$")
+
+
+def interpretar_instante(texto):
+    """
+    Converte um instante no formato dos ficheiros de texto (`"%Y-%m-%d %H:%M:%S"`, hora local).
+
+    Parâmetros:
+    ----------
+    texto : str
+        O instante em texto.
+
+    Retorno:
+    -------
+    float or None
+        O instante em segundos desde a época, ou None se o texto não estiver no formato.
+    """
+
+    try:
+        return time.mktime(time.strptime(texto.strip(), FORMATO_INSTANTE))
+    except ValueError:
+        return None
+
+
+class LogIndex:
+    """
+    Índice esparso de instantes de um ficheiro de resultados ou de monitorização.
+
+    Os ficheiros são sequências de entradas `separador / instante / texto`, escritas por ordem
+    de chegada. O índice guarda o par (instante, posição) de uma entrada a cada `passo` bytes,
+    pelo que uma consulta por intervalo de tempo salta diretamente para perto da primeira
+    entrada relevante e lê o ficheiro em streaming a partir daí. O índice é atualizado de forma
+    incremental: cada atualização só lê os bytes acrescentados desde a anterior.
+
+    Os segmentos selados do log (ver `log_segments`) são lidos antes do ficheiro ativo e
+    descomprimidos de forma transparente. De cada segmento guarda-se apenas o primeiro e o
+    último instante, para ignorar os segmentos fora do intervalo consultado.
+    """
+
+    def __init__(self, path, passo=INDEX_STRIDE):
+        self.path = path
+        self.passo = passo
+        self.resumos = {}
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self.inode = None
+        self.instantes = []
+        self.posicoes = []
+        self.indexado = 0
+        self.separador_pendente = None
+
+    def atualizar(self):
+        """
+        Indexa os bytes acrescentados ao ficheiro desde a última atualização.
+
+        Parâmetros:
+        ----------
+        None
+
+        Retorno:
+        -------
+        None
+        """
+
+        try:
+            file = open(self.path, 'rb')
+        except OSError:
+            return
+
+        with file:
+            stat = os.fstat(file.fileno())
+            if stat.st_ino != self.inode or stat.st_size < self.indexado:
+                self._reiniciar()
+                self.inode = stat.st_ino
+
+            file.seek(self.indexado)
+            posicao = self.indexado
+
+            for linha in file:
+                if not linha.endswith(b"\n"):
+                    break
+
+                if self.separador_pendente is not None:
+                    instante = interpretar_instante(linha.decode('utf-8', 'replace'))
+                    if instante is not None and (not self.posicoes or self.separador_pendente - self.posicoes[-1] >= self.passo):
+                        self.instantes.append(instante)
+                        self.posicoes.append(self.separador_pendente)
+                    self.separador_pendente = None
+
+                if SEPARADOR.match(linha):
+                    self.separador_pendente = posicao
+
+                posicao += len(linha)
+                self.indexado = posicao
+
+    def procurar(self, inicio):
+        """
+        Devolve a posição a partir da qual ler para encontrar a primeira entrada com instante >= `inicio`.
+
+        Parâmetros:
+        ----------
+        inicio : float or None
+            O instante inicial. None significa o início do ficheiro.
+
+        Retorno:
+        -------
+        int
+            A posição, em bytes.
+        """
+
+        if inicio is None:
+            return 0
+        indice = bisect.bisect_left(self.instantes, inicio) - 1
+        return self.posicoes[indice] if indice >= 0 else 0
+
+    def entradas(self, inicio=None, fim=None):
+        """
+        Percorre as entradas do ficheiro dentro de um intervalo de tempo, sem carregar o ficheiro em memória.
+
+        Parâmetros:
+        ----------
+        inicio : float, opcional
+            O instante inicial (inclusive).
+        fim : float, opcional
+            O instante final (inclusive).
+
+        Retorno:
+        -------
+        generator
+            Tuplos (instante, texto) por ordem do ficheiro.
+        """
+
+        for numero, segmento in log_segments.segmentos(self.path):
+            resumo = self._resumo(numero, segmento)
+            if resumo is None:
+                continue
+            if inicio is not None and resumo[1] < inicio:
+                continue
+            if fim is not None and resumo[0] > fim:
+                return
+
+            try:
+                file = log_segments.abrir(segmento)
+            except OSError:
+                continue
+
+            with file:
+                for instante, texto in _ler_entradas(file):
+                    if inicio is not None and instante < inicio:
+                        continue
+                    if fim is not None and instante > fim:
+                        return
+                    yield instante, texto
+
+        self.atualizar()
+
+        try:
+            file = open(self.path, 'rb')
+        except OSError:
+            return
+
+        with file:
+            if os.fstat(file.fileno()).st_ino != self.inode:
+                # o ficheiro foi selado entre a atualização e a abertura
+                return
+            file.seek(self.procurar(inicio))
+            for instante, texto in _ler_entradas(file):
+                if inicio is not None and instante < inicio:
+                    continue
+                if fim is not None and instante > fim:
+                    return
+                yield instante, texto
+
+    def seguir(self, intervalo=FOLLOW_INTERVAL):
+        """
+        Acompanha o ficheiro (como `tail -f`): devolve as linhas acrescentadas a partir de agora.
+
+        Parâmetros:
+        ----------
+        intervalo : float, opcional
+            O número de segundos entre verificações do ficheiro.
+
+        Retorno:
+        -------
+        generator
+            As linhas novas, à medida que são escritas.
+        """
+
+        try:
+            stat = os.stat(self.path)
+            inode, posicao = stat.st_ino, stat.st_size
+        except OSError:
+            inode, posicao = None, 0
+
+        while True:
+            try:
+                with open(self.path, 'rb') as file:
+                    stat = os.fstat(file.fileno())
+                    if stat.st_ino != inode or stat.st_size < posicao:
+                        inode, posicao = stat.st_ino, 0
+                    file.seek(posicao)
+                    for linha in file:
+                        if not linha.endswith(b"\n"):
+                            break
+                        posicao += len(linha)
+                        yield linha.decode('utf-8', 'replace').rstrip("\n")
+            except OSError:
+                pass
+            time.sleep(intervalo)
+
+
+    def _resumo(self, numero, segmento):
+        # os segmentos selados não mudam: o primeiro e o último instante são calculados uma única vez
+        if numero not in self.resumos:
+            primeiro = ultimo = None
+            try:
+                with log_segments.abrir(segmento) as file:
+                    for instante, _ in _ler_entradas(file):
+                        if primeiro is None:
+                            primeiro = instante
+                        ultimo = instante
+            except OSError:
+                return None
+            self.resumos[numero] = (primeiro, ultimo) if primeiro is not None else None
+        return self.resumos[numero]
+
+
+def _ler_entradas(file):
+    instante = None
+    linhas = []
+    separador = False
+
+    for linha in file:
+        if SEPARADOR.match(linha):
+            if instante is not None:
+                yield instante, "".join(linhas).strip("\n")
+            instante = None
+            linhas = []
+            separador = True
+            continue
+
+        if separador:
+            separador = False
+            instante = interpretar_instante(linha.decode('utf-8', 'replace'))
+            continue
+
+        if instante is not None:
+            linhas.append(linha.decode('utf-8', 'replace'))
+
+    if instante is not None:
+        yield instante, "".join(linhas).strip("\n")
@@ -0,0 +1,224 @@
+import gzip
+import lzma
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+
+LOG_COMPRESSION = "zlib"
+LOG_RETENTION_SEGMENTS = 50
+LOG_RETENTION_DAYS = 30
+
+EXTENSOES = {"zlib": ".gz", "lzma": ".xz"}
+ABRIR_COMPRIMIDO = {".gz": gzip.open, ".xz": lzma.open}
+
+
+def _padrao(path):
+    return re.compile(rf"^{re.escape(os.path.basename(path))}\.(\d+)(\.gz|\.xz)?$")
+
+
+def segmentos(path):
+    """
+    Devolve os segmentos selados de um ficheiro de log, do mais antigo para o mais recente.
+
+    Parâmetros:
+    ----------
+    path : str
+        O caminho do ficheiro ativo (ex: `task-202-1.txt`).
+
+    Retorno:
+    -------
+    list
+        Uma lista de tuplos (número, caminho). O caminho pode ter a extensão `.gz` ou `.xz`.
+    """
+
+    diretorio = os.path.dirname(path) or "."
+    padrao = _padrao(path)
+    encontrados = {}
+
+    for nome in os.listdir(diretorio):
+        match = padrao.match(nome)
+        if match:
+            numero = int(match.group(1))
+            # se a compressão ainda está a decorrer, ficam as duas versões: prefere-se a comprimida
+            if numero not in encontrados or match.group(2):
+                encontrados[numero] = os.path.join(os.path.dirname(path), nome)
+
+    return sorted(encontrados.items())
+
+
+def listar_logs(diretorio, prefixo):
+    """
+    Lista os ficheiros de log de um diretório, incluindo os que só têm segmentos selados.
+
+    Parâmetros:
+    ----------
+    diretorio : str
+        O diretório dos ficheiros.
+    prefixo : str
+        O prefixo dos nomes (ex: `"task-"` ou `"monitorizacao-"`).
+
+    Retorno:
+    -------
+    list
+        Os nomes dos ficheiros ativos (ex: `task-202-1.txt`), ordenados.
+    """
+
+    nomes = set()
+    for nome in os.listdir(diretorio):
+        if not nome.startswith(prefixo) or ".txt" not in nome:
+            continue
+        nomes.add(nome[:nome.index(".txt") + len(".txt")])
+    return sorted(nomes)
+
+
+def selar(path):
+    """
+    Sela o ficheiro ativo de um log, renomeando-o para o segmento numerado seguinte.
+
+    Parâmetros:
+    ----------
+    path : str
+        O caminho do ficheiro ativo, já fechado.
+
+    Retorno:
+    -------
+    str or None
+        O caminho do segmento selado, ou None se o ficheiro não existir.
+    """
+
+    existentes = segmentos(path)
+    numero = existentes[-1][0] + 1 if existentes else 1
+    selado = f"{path}.{numero:06d}"
+
+    try:
+        os.rename(path, selado)
+    except FileNotFoundError:
+        return None
+    return selado
+
+
+def abrir(path):
+    """
+    Abre um segmento (ou o ficheiro ativo) para leitura binária, descomprimindo-o se necessário.
+    Se o segmento tiver sido comprimido entretanto, abre a versão comprimida.
+
+    Parâmetros:
+    ----------
+    path : str
+        O caminho do segmento.
+
+    Retorno:
+    -------
+    file
+        Um ficheiro binário aberto para leitura.
+    """
+
+    for candidato in (path,) + tuple(path + extensao for extensao in ABRIR_COMPRIMIDO):
+        extensao = os.path.splitext(candidato)[1]
+        try:
+            if extensao in ABRIR_COMPRIMIDO:
+                return ABRIR_COMPRIMIDO[extensao](candidato, 'rb')
+            return open(candidato, 'rb')
+        except FileNotFoundError:
+            continue
+    raise FileNotFoundError(path)
+
+
+class SegmentCompressor:
+    """
+    Comprime os segmentos selados e aplica a política de retenção, numa thread própria.
+
+    Cada segmento é comprimido (zlib, no formato gzip, ou lzma) para um ficheiro temporário,
+    que substitui o original de forma atómica. A seguir são apagados os segmentos mais antigos
+    do mesmo log que excedam `max_segmentos` ou tenham mais de `max_dias` dias.
+    """
+
+    def __init__(self, compressao=LOG_COMPRESSION, max_segmentos=LOG_RETENTION_SEGMENTS,
+                 max_dias=LOG_RETENTION_DAYS):
+        if compressao is not None and compressao not in EXTENSOES:
+            raise ValueError(f"Compressão inválida: {compressao}")
+
+        self.compressao = compressao
+        self.max_segmentos = max_segmentos
+        self.max_dias = max_dias
+        self.fila = queue.Queue()
+        self.thread = None
+
+    def iniciar(self, diretorio="."):
+        """
+        Inicia a thread de compressão e agenda os segmentos por comprimir de execuções anteriores.
+
+        Parâmetros:
+        ----------
+        diretorio : str, opcional
+            O diretório dos ficheiros de log.
+
+        Retorno:
+        -------
+        None
+        """
+
+        self.thread = threading.Thread(target=self._ciclo, daemon=True)
+        self.thread.start()
+
+        for nome in os.listdir(diretorio):
+            if re.search(r"\.txt\.\d+$", nome):
+                self.agendar(os.path.join(diretorio, nome))
+
+    def agendar(self, selado):
+        """
+        Agenda a compressão de um segmento selado.
+
+        Parâmetros:
+        ----------
+        selado : str
+            O caminho do segmento.
+
+        Retorno:
+        -------
+        None
+        """
+
+        self.fila.put(selado)
+
+    def _comprimir(self, selado):
+        extensao = EXTENSOES[self.compressao]
+        abrir_destino = ABRIR_COMPRIMIDO[extensao]
+        temporario = f"{selado}{extensao}.tmp"
+
+        with open(selado, 'rb') as origem, abrir_destino(temporario, 'wb') as destino:
+            shutil.copyfileobj(origem, destino)
+        os.replace(temporario, selado + extensao)
+        os.remove(selado)
+
+    def _aplicar_retencao(self, path):
+        existentes = segmentos(path)
+        apagar = existentes[:max(0, len(existentes) - self.max_segmentos)] if self.max_segmentos else []
+
+        if self.max_dias:
+            limite = time.time() - self.max_dias * 86400
+            for numero, segmento in existentes[len(apagar):]:
+                try:
+                    if os.path.getmtime(segmento) < limite:
+                        apagar.append((numero, segmento))
+                except OSError:
+                    pass
+
+        for _, segmento in apagar:
+            try:
+                os.remove(segmento)
+            except OSError as e:
+                print(f"Erro ao apagar o segmento {segmento}: {e}")
+
+    def _ciclo(self):
+        while True:
+            selado = self.fila.get()
+            try:
+                if self.compressao is not None and os.path.exists(selado):
+                    self._comprimir(selado)
+                self._aplicar_retencao(re.sub(r"\.\d+$", "", selado))
+            except OSError as e:
+                print(f"Erro ao comprimir o segmento {selado}: {e}")
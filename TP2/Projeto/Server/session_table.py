@@ -0,0 +1,263 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from datetime import datetime
+
+
+class SessionTable:
+    """
+    Tabela em memória das sessões ativas dos agentes, indexada por (ip, porta).
+
+    Cada keep-alive apenas atualiza o instante da última atividade da sessão. A expiração
+    usa um heap de prazos com uma única entrada por sessão: quando uma entrada vence, o prazo
+    real é recalculado a partir da última atividade e a entrada é reinserida se a sessão
+    continuar ativa. Cada sessão tem uma geração; as entradas de sessões removidas (ou de uma
+    sessão anterior no mesmo endereço) são descartadas quando vencem.
+
+    Cada sessão guarda ainda as rotas dos resultados do agente, n_s da mensagem de task ->
+    task_id, que desaparecem com a sessão. Por task ficam apenas as rotas das duas últimas
+    mensagens enviadas, para que resultados ainda em trânsito após uma atualização sejam entregues.
+    """
+
+    def __init__(self, inactivity_limit):
+        self.inactivity_limit = inactivity_limit
+        self.sessoes = {}
+        self.prazos = []
+        self.geracoes = itertools.count()
+        self.lock = threading.Lock()
+
+    def registar(self, addr):
+        """
+        Regista (ou renova) a sessão de um agente.
+
+        Parâmetros:
+        ----------
+        addr : tuple
+            O endereço (ip, porta) do agente.
+
+        Retorno:
+        -------
+        None
+        """
+
+        agora = time.time()
+        with self.lock:
+            anterior = self.sessoes.get(addr)
+            geracao = next(self.geracoes) if anterior is None else anterior["geracao"]
+            self.sessoes[addr] = {"connected_at": agora, "last_seen": agora, "rotas": {}, "ultimas_rotas": {},
+                                  "geracao": geracao}
+            if anterior is None:
+                heapq.heappush(self.prazos, (agora + self.inactivity_limit, geracao, addr))
+
+    def atualizar(self, addr):
+        """
+        Atualiza o instante da última atividade de uma sessão.
+
+        Parâmetros:
+        ----------
+        addr : tuple
+            O endereço (ip, porta) do agente.
+
+        Retorno:
+        -------
+        bool
+            True se a sessão existia, False caso contrário.
+        """
+
+        with self.lock:
+            sessao = self.sessoes.get(addr)
+            if sessao is None:
+                return False
+            sessao["last_seen"] = time.time()
+            return True
+
+    def associar_task(self, addr, n_s, task_id):
+        """
+        Regista a rota dos resultados de uma task enviada a um agente.
+
+        Parâmetros:
+        ----------
+        addr : tuple
+            O endereço (ip, porta) do agente.
+        n_s : int
+            O número de sequência da mensagem de task, usado pelo agente nos seus resultados.
+        task_id : str
+            O identificador da task.
+
+        Retorno:
+        -------
+        None
+        """
+
+        with self.lock:
+            sessao = self.sessoes.get(addr)
+            if sessao is None:
+                return
+
+            rotas = sessao["rotas"]
+            atual, anterior = sessao["ultimas_rotas"].get(task_id, (None, None))
+            if anterior is not None:
+                rotas.pop(anterior, None)
+            rotas[n_s] = task_id
+            sessao["ultimas_rotas"][task_id] = (n_s, atual)
+
+    def task_de(self, addr, n_s):
+        """
+        Devolve a task a que pertence um resultado de um agente.
+
+        Parâmetros:
+        ----------
+        addr : tuple
+            O endereço (ip, porta) do agente.
+        n_s : int
+            O número de sequência indicado no resultado.
+
+        Retorno:
+        -------
+        str or None
+            O task_id, ou None se a sessão ou a rota não existirem.
+        """
+
+        with self.lock:
+            sessao = self.sessoes.get(addr)
+            if sessao is None:
+                return None
+            return sessao["rotas"].get(n_s)
+
+    def remover(self, addr):
+        """
+        Remove a sessão de um agente. A sua entrada no heap é descartada quando vencer.
+
+        Parâmetros:
+        ----------
+        addr : tuple
+            O endereço (ip, porta) do agente.
+
+        Retorno:
+        -------
+        bool
+            True se a sessão existia, False caso contrário.
+        """
+
+        with self.lock:
+            return self.sessoes.pop(addr, None) is not None
+
+    def expirar(self, agora=None):
+        """
+        Remove as sessões inativas há mais de `inactivity_limit` segundos.
+
+        Parâmetros:
+        ----------
+        agora : float, opcional
+            O instante de referência. Por omissão, `time.time()`.
+
+        Retorno:
+        -------
+        list
+            Os endereços das sessões removidas.
+        """
+
+        if agora is None:
+            agora = time.time()
+
+        removidas = []
+        with self.lock:
+            while self.prazos and self.prazos[0][0] <= agora:
+                _, geracao, addr = heapq.heappop(self.prazos)
+                sessao = self.sessoes.get(addr)
+                if sessao is None or sessao["geracao"] != geracao:
+                    continue
+
+                prazo = sessao["last_seen"] + self.inactivity_limit
+                if prazo > agora:
+                    heapq.heappush(self.prazos, (prazo, geracao, addr))
+                else:
+                    del self.sessoes[addr]
+                    removidas.append(addr)
+
+        return removidas
+
+    def proximo_prazo(self):
+        """
+        Devolve o prazo mais próximo do heap de expiração.
+
+        Parâmetros:
+        ----------
+        None
+
+        Retorno:
+        -------
+        float or None
+            O instante do próximo prazo, ou None se não houver sessões.
+        """
+
+        with self.lock:
+            if not self.prazos:
+                return None
+            return self.prazos[0][0]
+
+    def listar(self):
+        """
+        Devolve as sessões ativas ordenadas pelo instante de conexão.
+
+        Parâmetros:
+        ----------
+        None
+
+        Retorno:
+        -------
+        list
+            Uma lista de tuplos (ip, porta, last_seen).
+        """
+
+        with self.lock:
+            sessoes = sorted(self.sessoes.items(), key=lambda item: item[1]["connected_at"])
+            return [(addr[0], addr[1], sessao["last_seen"]) for addr, sessao in sessoes]
+
+    def guardar_snapshot(self, path):
+        """
+        Escreve um snapshot das sessões no formato `ip|porta|hora` de `connections.txt`.
+        O ficheiro é substituído de forma atómica.
+
+        Parâmetros:
+        ----------
+        path : str
+            O caminho do ficheiro de snapshot.
+
+        Retorno:
+        -------
+        None
+        """
+
+        escrever_snapshot(path, self.listar())
+
+    def __len__(self):
+        with self.lock:
+            return len(self.sessoes)
+
+
+def escrever_snapshot(path, conexoes):
+    """
+    Escreve uma lista de sessões no formato `ip|porta|hora` de `connections.txt`.
+    O ficheiro é substituído de forma atómica.
+
+    Parâmetros:
+    ----------
+    path : str
+        O caminho do ficheiro de snapshot.
+    conexoes : list
+        Tuplos (ip, porta, last_seen), como os de `SessionTable.listar`.
+
+    Retorno:
+    -------
+    None
+    """
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        for ip, port, last_seen in conexoes:
+            connection_time = datetime.fromtimestamp(last_seen).strftime("%Y-%m-%d %H:%M:%S")
+            file.write(f"{ip}|{port}|{connection_time}\n")
+    os.replace(tmp_path, path)
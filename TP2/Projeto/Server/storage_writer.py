@@ -0,0 +1,278 @@
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+import log_segments
+
+STORAGE_QUEUE_SIZE = 10000
+STORAGE_BATCH_SIZE = 512
+STORAGE_OPEN_FILES = 64
+STORAGE_FSYNC_INTERVAL = 1.0
+LOG_ROTATE_BYTES = 64 * 1024 * 1024
+LOG_ROTATE_SECONDS = 24 * 3600
+
+FSYNC_NUNCA = "never"
+FSYNC_LOTE = "batch"
+FSYNC_INTERVALO = "interval"
+
+
+class StorageWriter:
+    """
+    Escritor dedicado dos ficheiros de resultados e de monitorização.
+
+    As escritas são colocadas numa fila limitada e gravadas por uma única thread, em lotes
+    (group commit): cada lote é escrito de seguida e cada ficheiro tocado é despejado uma só
+    vez no fim do lote. Os ficheiros ficam abertos numa cache LRU, pelo que uma escrita não
+    custa um open/close. A política `fsync` decide quando os dados são forçados para o disco:
+    `"never"`, `"batch"` (no fim de cada lote) ou `"interval"` (no máximo a cada `fsync_interval`
+    segundos).
+
+    Depois de cada lote, os ficheiros que ultrapassem `rotacao_bytes`, ou cujo segmento ativo
+    tenha mais de `rotacao_segundos`, são selados num segmento numerado (ver `log_segments`)
+    e entregues a `ao_selar` (ex: para compressão). Um valor None desativa o critério.
+
+    Outras escritas que não devem correr na thread de receção (ex: as séries temporais) podem
+    ser entregues à mesma thread com `executar`.
+    """
+
+    def __init__(self, max_fila=STORAGE_QUEUE_SIZE, max_lote=STORAGE_BATCH_SIZE,
+                 max_ficheiros=STORAGE_OPEN_FILES, fsync=FSYNC_INTERVALO,
+                 fsync_interval=STORAGE_FSYNC_INTERVAL, rotacao_bytes=LOG_ROTATE_BYTES,
+                 rotacao_segundos=LOG_ROTATE_SECONDS, ao_selar=None):
+        if fsync not in (FSYNC_NUNCA, FSYNC_LOTE, FSYNC_INTERVALO):
+            raise ValueError(f"Política de fsync inválida: {fsync}")
+
+        self.max_lote = max_lote
+        self.max_ficheiros = max_ficheiros
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.rotacao_bytes = rotacao_bytes
+        self.rotacao_segundos = rotacao_segundos
+        self.ao_selar = ao_selar
+
+        self.inicio_segmentos = {}
+        self.fila = queue.Queue(maxsize=max_fila)
+        self.ficheiros = OrderedDict()
+        self.por_sincronizar = set()
+        self.ultimo_fsync = time.monotonic()
+        self.thread = None
+
+    def iniciar(self):
+        """
+        Inicia a thread de escrita.
+
+        Parâmetros:
+        ----------
+        None
+
+        Retorno:
+        -------
+        None
+        """
+
+        self.thread = threading.Thread(target=self._ciclo, daemon=True)
+        self.thread.start()
+
+    def escrever(self, path, texto, ao_concluir=None):
+        """
+        Coloca uma escrita em fila. Só bloqueia se a fila estiver cheia.
+
+        Parâmetros:
+        ----------
+        path : str
+            O ficheiro onde o texto é acrescentado.
+        texto : str
+            O texto a acrescentar.
+        ao_concluir : callable, opcional
+            Função chamada, sem argumentos, depois de o lote da escrita ser despejado.
+
+        Retorno:
+        -------
+        None
+        """
+
+        self.fila.put((path, texto, ao_concluir))
+
+    def executar(self, funcao, *argumentos):
+        """
+        Coloca em fila uma função, executada pela thread de escrita pela ordem das escritas.
+        Só bloqueia se a fila estiver cheia.
+
+        Parâmetros:
+        ----------
+        funcao : callable
+            A função a executar.
+        *argumentos
+            Os argumentos da função.
+
+        Retorno:
+        -------
+        None
+        """
+
+        self.fila.put((None, (funcao, argumentos), None))
+
+    def esvaziar(self):
+        """
+        Aguarda até que todas as escritas em fila tenham sido gravadas e despejadas.
+
+        Parâmetros:
+        ----------
+        None
+
+        Retorno:
+        -------
+        None
+        """
+
+        self.fila.join()
+
+    def fechar(self):
+        """
+        Grava as escritas pendentes e fecha todos os ficheiros abertos.
+
+        Parâmetros:
+        ----------
+        None
+
+        Retorno:
+        -------
+        None
+        """
+
+        fim = threading.Event()
+        self.fila.put((None, None, fim.set))
+        fim.wait()
+
+    def _abrir(self, path):
+        file = self.ficheiros.get(path)
+        if file is not None:
+            self.ficheiros.move_to_end(path)
+            return file
+
+        if len(self.ficheiros) >= self.max_ficheiros:
+            antigo, ficheiro_antigo = self.ficheiros.popitem(last=False)
+            self._fechar_ficheiro(antigo, ficheiro_antigo)
+
+        file = open(path, 'a')
+        self.ficheiros[path] = file
+        self.inicio_segmentos.setdefault(path, time.time())
+        return file
+
+    def _fechar_ficheiro(self, path, file):
+        try:
+            file.flush()
+            if path in self.por_sincronizar:
+                os.fsync(file.fileno())
+            file.close()
+        except OSError as e:
+            print(f"Erro ao fechar {path}: {e}")
+        self.por_sincronizar.discard(path)
+
+    def _fechar_todos(self):
+        while self.ficheiros:
+            path, file = self.ficheiros.popitem(last=False)
+            self._fechar_ficheiro(path, file)
+
+    def _recolher_lote(self):
+        if self.por_sincronizar:
+            espera = max(0, self.ultimo_fsync + self.fsync_interval - time.monotonic())
+            try:
+                lote = [self.fila.get(timeout=espera)]
+            except queue.Empty:
+                return []
+        else:
+            lote = [self.fila.get()]
+
+        while len(lote) < self.max_lote:
+            try:
+                lote.append(self.fila.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _gravar(self, lote):
+        tocados = {}
+        for path, texto, _ in lote:
+            if path is None:
+                continue
+            try:
+                file = self._abrir(path)
+                file.write(texto)
+                tocados[path] = file
+            except OSError as e:
+                print(f"Erro ao escrever em {path}: {e}")
+
+        for path, file in tocados.items():
+            if file.closed:
+                continue
+            try:
+                file.flush()
+                if self.fsync == FSYNC_LOTE:
+                    os.fsync(file.fileno())
+                elif self.fsync == FSYNC_INTERVALO:
+                    self.por_sincronizar.add(path)
+            except OSError as e:
+                print(f"Erro ao despejar {path}: {e}")
+
+        if self.por_sincronizar and time.monotonic() - self.ultimo_fsync >= self.fsync_interval:
+            self._sincronizar()
+
+        for path, file in tocados.items():
+            if not file.closed and self._deve_rodar(path, file):
+                self._rodar(path)
+
+    def _deve_rodar(self, path, file):
+        if self.rotacao_bytes is not None and os.fstat(file.fileno()).st_size >= self.rotacao_bytes:
+            return True
+        if self.rotacao_segundos is not None:
+            return time.time() - self.inicio_segmentos.get(path, time.time()) >= self.rotacao_segundos
+        return False
+
+    def _rodar(self, path):
+        self._fechar_ficheiro(path, self.ficheiros.pop(path))
+        self.inicio_segmentos.pop(path, None)
+
+        try:
+            selado = log_segments.selar(path)
+        except OSError as e:
+            print(f"Erro ao selar {path}: {e}")
+            return
+
+        if selado is not None and self.ao_selar is not None:
+            self.ao_selar(selado)
+
+    def _sincronizar(self):
+        for path in self.por_sincronizar:
+            file = self.ficheiros.get(path)
+            if file is not None:
+                try:
+                    os.fsync(file.fileno())
+                except OSError as e:
+                    print(f"Erro ao sincronizar {path}: {e}")
+        self.por_sincronizar.clear()
+        self.ultimo_fsync = time.monotonic()
+
+    def _ciclo(self):
+        while True:
+            lote = self._recolher_lote()
+            if not lote:
+                self._sincronizar()
+                continue
+
+            self._gravar(lote)
+
+            for path, texto, ao_concluir in lote:
+                if path is None and texto is None:
+                    self._fechar_todos()
+                elif path is None:
+                    funcao, argumentos = texto
+                    try:
+                        funcao(*argumentos)
+                    except Exception as e:
+                        print(f"Erro ao executar {funcao.__name__}: {e}")
+                if ao_concluir is not None:
+                    ao_concluir()
+                self.fila.task_done()
@@ -0,0 +1,204 @@
+"""
+Testes de ida e volta do codec NetTask: cada mensagem codificada é descodificada de novo, com e
+sem compressão, e as mensagens truncadas ou inválidas são rejeitadas com ValueError.
+
+Uso: python -m unittest test_nettask (ou python -m pytest), a partir de TP2/Projeto/Server.
+"""
+
+import struct
+import unittest
+import zlib
+
+import NetTask
+import benchmark_codec
+
+CONFIG = NetTask.ConfigTask(
+    frequency=5, m_cpu=2.0, m_ram=90.0, interfaces="eth0,eth1,eth2", m_is=2000, m_pl=5.0, m_ji=100.0,
+    latency="8.8.8.8:5:30", bandwidth="client:192.168.1.1:10:TCP:30",
+    jitter="8.8.4.4:10:15", packet_loss="8.8.4.4:10:20", task_id="task-202-1",
+)
+
+RESULTADOS = [
+    "1€Latência média para 8.8.8.8: 12.34 ms\n",
+    "2€Jitter para 8.8.4.4: 0.20 ms\n",
+    "3€Perda de pacotes para 8.8.4.4: 0%\n",
+    "",
+]
+
+
+def ida_e_volta(n_s, opcao, dados, comprimir=False):
+    n_s, opcao, dados = NetTask.interpretar_protocolo_udp(
+        NetTask.criar_protocolo_udp(n_s, opcao, dados, comprimir=comprimir))
+    return n_s, opcao, bytes(dados)
+
+
+class TestOpcodes(unittest.TestCase):
+
+    def test_registo_sem_capacidades(self):
+        for comprimir in (False, True):
+            n_s, opcao, dados = ida_e_volta(1, NetTask.OP_REGISTO, "", comprimir)
+            self.assertEqual((n_s, opcao, NetTask.interpretar_capacidades(dados)), (1, NetTask.OP_REGISTO, 0))
+
+    def test_registo_com_capacidades(self):
+        for comprimir in (False, True):
+            n_s, opcao, dados = ida_e_volta(2, NetTask.OP_REGISTO, NetTask.CAPACIDADES, comprimir)
+            self.assertEqual((n_s, opcao), (2, NetTask.OP_REGISTO))
+            self.assertEqual(NetTask.interpretar_capacidades(dados), NetTask.CAPACIDADES)
+
+    def test_resultado(self):
+        lote = NetTask.criar_lote_resultados(RESULTADOS * 10)
+        for comprimir in (False, True):
+            n_s, opcao, dados = ida_e_volta(3, NetTask.OP_RESULTADO, lote, comprimir)
+            self.assertEqual((n_s, opcao), (3, NetTask.OP_RESULTADO))
+            self.assertEqual(NetTask.interpretar_lote_resultados(dados), RESULTADOS * 10)
+
+    def test_resultado_em_texto(self):
+        for comprimir in (False, True):
+            self.assertEqual(ida_e_volta(4, NetTask.OP_RESULTADO, RESULTADOS[0], comprimir),
+                             (4, NetTask.OP_RESULTADO, RESULTADOS[0].encode('utf-8')))
+
+    def test_task(self):
+        for comprimir in (False, True):
+            n_s, opcao, dados = ida_e_volta(5, NetTask.OP_TASK, CONFIG, comprimir)
+            self.assertEqual((n_s, opcao), (5, NetTask.OP_TASK))
+            self.assertEqual(NetTask.descodificar_task(dados), CONFIG)
+
+    def test_remover_task(self):
+        for task_id in ("t", "task-" + "x" * 200):
+            for comprimir in (False, True):
+                self.assertEqual(ida_e_volta(6, NetTask.OP_REMOVER_TASK, task_id, comprimir),
+                                 (6, NetTask.OP_REMOVER_TASK, task_id.encode('utf-8')))
+
+    def test_ack(self):
+        for sack in (0, 1, 0b1011, (1 << NetTask.SACK_BITS) - 1):
+            n_s, opcao, dados = NetTask.interpretar_protocolo_udp(NetTask.criar_ack(41, sack))
+            self.assertEqual((n_s, opcao, NetTask.interpretar_ack(dados)), (41, NetTask.OP_ACK, sack))
+
+    def test_ack_sem_sack(self):
+        self.assertEqual(NetTask.interpretar_ack(b""), 0)
+
+    def test_sem_dados(self):
+        for opcao in (NetTask.OP_KEEP_ALIVE, NetTask.OP_FIM):
+            for comprimir in (False, True):
+                self.assertEqual(ida_e_volta(7, opcao, "", comprimir), (7, opcao, b""))
+
+    def test_salto(self):
+        n_s, opcao, dados = NetTask.interpretar_protocolo_udp(NetTask.criar_salto(99))
+        self.assertEqual((n_s, opcao, bytes(dados)), (99, NetTask.OP_SALTAR, b""))
+
+    def test_fragmentos(self):
+        lote = NetTask.criar_lote_resultados([f"{i}€Latência média para 10.0.{i}.1: {i}.5 ms\n" for i in range(200)])
+        mensagem = NetTask.criar_protocolo_udp(8, NetTask.OP_RESULTADO, lote)
+        fragmentos = []
+        NetTask.Fragmentador(lambda fragmento, addr: fragmentos.append(bytes(fragmento)))(mensagem, ("a", 1))
+        self.assertGreater(len(fragmentos), 1)
+
+        remontagem = NetTask.FragmentReassembler()
+        remontada = None
+        for fragmento in reversed(fragmentos):
+            self.assertEqual(NetTask.interpretar_protocolo_udp(fragmento)[1], NetTask.OP_FRAGMENTO)
+            remontada = remontagem.receber(("a", 1), fragmento)
+        self.assertEqual(remontada, mensagem)
+
+
+class TestCompressao(unittest.TestCase):
+
+    def test_comprime_acima_do_limiar(self):
+        mensagem = NetTask.criar_protocolo_udp(1, NetTask.OP_RESULTADO, NetTask.criar_lote_resultados(RESULTADOS * 5),
+                                               comprimir=True)
+        self.assertEqual(mensagem[4], NetTask.OP_RESULTADO | NetTask.FLAG_COMPRIMIDO)
+
+    def test_nao_comprime_abaixo_do_limiar(self):
+        mensagem = NetTask.criar_protocolo_udp(1, NetTask.OP_REMOVER_TASK, "t", comprimir=True)
+        self.assertEqual(mensagem, NetTask.criar_protocolo_udp(1, NetTask.OP_REMOVER_TASK, "t"))
+
+    def test_nao_comprime_opcodes_de_controlo(self):
+        for opcao in (NetTask.OP_REGISTO, NetTask.OP_KEEP_ALIVE, NetTask.OP_FIM):
+            mensagem = NetTask.criar_protocolo_udp(1, opcao, "")
+            self.assertIs(NetTask.comprimir_mensagem(mensagem), mensagem)
+
+    def test_template_comprimido_do_catalogo(self):
+        _, template, comprimido = NetTask.compilar_catalogo([("10.0.0.1", "t", CONFIG)])["10.0.0.1"][0]
+        mensagem = bytearray(comprimido)
+        NetTask.NUMERO_SEQUENCIA.pack_into(mensagem, 0, 7)
+        self.assertEqual(bytes(mensagem), NetTask.criar_protocolo_udp(7, NetTask.OP_TASK, CONFIG, comprimir=True))
+        self.assertEqual(NetTask.descodificar_task(NetTask.interpretar_protocolo_udp(mensagem)[2]), CONFIG)
+
+
+class TestTask(unittest.TestCase):
+
+    def test_simetria(self):
+        config = CONFIG._replace(interfaces="", latency="ñ:1:1", task_id="tarefa-ção")
+        dados = NetTask.codificar_task(0, config)[NetTask.CABECALHO.size:-1]
+        self.assertEqual(NetTask.descodificar_task(dados), config)
+
+    def test_task_truncada(self):
+        dados = NetTask.codificar_task(0, CONFIG)[NetTask.CABECALHO.size:-1]
+        for corte in (0, 3, 20, len(dados) - 1):
+            with self.assertRaises(ValueError):
+                NetTask.descodificar_task(dados[:corte])
+
+
+class TestLote(unittest.TestCase):
+
+    def test_lote_vazio(self):
+        self.assertEqual(NetTask.interpretar_lote_resultados(NetTask.criar_lote_resultados([])), [])
+
+    def test_lote_truncado(self):
+        lote = NetTask.criar_lote_resultados(RESULTADOS)
+        for corte in (0, 1, 3, len(lote) - 1):
+            with self.assertRaises(ValueError):
+                NetTask.interpretar_lote_resultados(lote[:corte])
+
+    def test_lote_utf8_invalido(self):
+        with self.assertRaises(ValueError):
+            NetTask.interpretar_lote_resultados(struct.pack("!HH", 1, 2) + b"\xff\xfe")
+
+
+class TestFormatoAnterior(unittest.TestCase):
+
+    def test_task(self):
+        mensagem = NetTask.criar_protocolo_udp(7, NetTask.OP_TASK, CONFIG)
+        legado = benchmark_codec.criar_protocolo_udp_legado(7, "010", benchmark_codec.CONFIG_LEGADO)
+        self.assertEqual(mensagem[:len(legado) - 1], legado[:-1])
+        dados = bytes(NetTask.interpretar_protocolo_udp(mensagem)[2])
+        self.assertEqual(tuple(NetTask.descodificar_task(dados))[:-1], benchmark_codec.descodificar_task_legado(dados))
+
+    def test_resultado(self):
+        self.assertEqual(NetTask.criar_protocolo_udp(8, NetTask.OP_RESULTADO, RESULTADOS[0]),
+                         benchmark_codec.criar_protocolo_udp_legado(8, "001", RESULTADOS[0]))
+
+    def test_sem_dados(self):
+        for opcao, legado in ((NetTask.OP_REGISTO, "000"), (NetTask.OP_KEEP_ALIVE, "101"), (NetTask.OP_FIM, "111")):
+            self.assertEqual(NetTask.criar_protocolo_udp(9, opcao, ""),
+                             benchmark_codec.criar_protocolo_udp_legado(9, legado, ""))
+
+
+class TestMensagensInvalidas(unittest.TestCase):
+
+    def test_mais_curta_do_que_o_cabecalho(self):
+        for mensagem in (b"", b"\x00", b"\x00\x01\x02\x03"):
+            with self.assertRaises(ValueError):
+                NetTask.interpretar_protocolo_udp(mensagem)
+
+    def test_compressao_invalida(self):
+        with self.assertRaises(ValueError):
+            NetTask.interpretar_protocolo_udp(struct.pack("!IB", 1, NetTask.OP_RESULTADO | NetTask.FLAG_COMPRIMIDO)
+                                              + b"lixo\x00")
+
+    def test_compressao_incompleta(self):
+        mensagem = NetTask.criar_protocolo_udp(1, NetTask.OP_RESULTADO, NetTask.criar_lote_resultados(RESULTADOS * 5),
+                                               comprimir=True)
+        with self.assertRaises(ValueError):
+            NetTask.interpretar_protocolo_udp(mensagem[:-5] + b"\x00")
+
+    def test_bomba_de_descompressao(self):
+        compressor = zlib.compressobj(9, zlib.DEFLATED, NetTask.COMPRESSION_WBITS, zdict=NetTask.dicionario_compressao())
+        dados = compressor.compress(bytes(NetTask.REASSEMBLY_MAX_BYTES + 1)) + compressor.flush()
+        mensagem = struct.pack("!IB", 1, NetTask.OP_RESULTADO | NetTask.FLAG_COMPRIMIDO) + dados + b"\x00"
+        with self.assertRaises(ValueError):
+            NetTask.interpretar_protocolo_udp(mensagem)
+
+
+if __name__ == "__main__":
+    unittest.main()
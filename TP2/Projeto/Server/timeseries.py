@@ -0,0 +1,428 @@
+import bisect
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+
+SEGMENT_RECORDS = 65536
+INDEX_STRIDE = 512
+FOLLOW_INTERVAL = 1.0
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".tsd"
+SYMBOLS_FILE = "symbols.txt"
+
+# timestamp, device, task_id, métrica, valor (símbolos da tabela de símbolos), alinhado a 32 bytes
+REGISTO = struct.Struct("<dIII4xd")
+
+UNIDADES_DEBITO = {"": 1, "K": 1e3, "M": 1e6, "G": 1e9}
+
+# symbols.txt guarda um símbolo por linha: as quebras de linha dos textos são substituídas por espaços
+QUEBRAS_DE_LINHA = str.maketrans("\r\n", "  ")
+
+PADROES_RESULTADO = [
+    (re.compile(r"Latência média para (\S+): (\d+(?:\.\d+)?) ms"), "latency", 1),
+    (re.compile(r"Perda de pacotes para (\S+): (\d+(?:\.\d+)?)%"), "packet_loss", 1),
+    (re.compile(r"Jitter para (\S+): (\d+(?:\.\d+)?) ms"), "jitter", 1),
+    (re.compile(r"Throughput de \S+ para (\S+): (\d+(?:\.\d+)?) ([KMG]?)bits/sec"), "bandwidth", None),
+]
+
+
+def interpretar_resultado(texto):
+    """
+    Extrai as métricas de um resultado de task em texto (ex: `"Jitter para 8.8.4.4: 0.20 ms"`).
+
+    Parâmetros:
+    ----------
+    texto : str
+        O resultado enviado pelo agente, sem o prefixo `"{ns}€"`.
+
+    Retorno:
+    -------
+    list
+        Uma lista de tuplos (métrica, valor), com a métrica no formato `"{tipo}/{destino}"`.
+        Vazia se o texto não tiver valores (ex: falhas de medição).
+    """
+
+    metricas = []
+    for padrao, tipo, escala in PADROES_RESULTADO:
+        for match in padrao.finditer(texto):
+            valor = float(match.group(2))
+            if escala is None:
+                valor *= UNIDADES_DEBITO[match.group(3)]
+            metricas.append((f"{tipo}/{match.group(1)}", valor))
+    return metricas
+
+
+class TimeSeriesStore:
+    """
+    Armazenamento binário, só de acréscimo, das medições das tasks.
+
+    Cada medição é um registo de tamanho fixo (`REGISTO`) com o instante, o dispositivo, a task,
+    a métrica e o valor. Os textos repetidos (dispositivo, task e métrica) são guardados uma única
+    vez numa tabela de símbolos (`symbols.txt`) e os registos guardam apenas o seu índice.
+
+    Os registos são escritos em segmentos de `SEGMENT_RECORDS` registos, pré-alocados e mapeados em
+    memória; um registo com instante 0 marca o fim dos dados de um segmento. As leituras devolvem
+    vistas sobre os mapas, sem cópias.
+
+    Os instantes são não decrescentes, e cada segmento tem um índice esparso com o instante de
+    um registo em cada `passo_indice`: uma consulta por intervalo de tempo ignora os segmentos
+    fora do intervalo e, nos restantes, começa a ler perto do primeiro registo relevante.
+    """
+
+    def __init__(self, diretorio, registos_por_segmento=SEGMENT_RECORDS, passo_indice=INDEX_STRIDE):
+        self.diretorio = diretorio
+        self.registos_por_segmento = registos_por_segmento
+        self.tamanho_segmento = registos_por_segmento * REGISTO.size
+        self.passo_indice = passo_indice
+
+        self.simbolos = []
+        self.por_texto = {}
+        self.ficheiro_simbolos = None
+        self.segmentos = []
+        self.indices = []
+        self.proximo_numero = 0
+        self.atual = None
+        self.ocupados = 0
+        self.ultimo_instante = 0.0
+        self.lock = threading.Lock()
+
+    def abrir(self):
+        """
+        Abre (ou cria) o armazenamento: carrega a tabela de símbolos, mapeia os segmentos
+        existentes e posiciona a escrita no fim do último.
+
+        Parâmetros:
+        ----------
+        None
+
+        Retorno:
+        -------
+        None
+        """
+
+        os.makedirs(self.diretorio, exist_ok=True)
+
+        path_simbolos = os.path.join(self.diretorio, SYMBOLS_FILE)
+        if os.path.exists(path_simbolos):
+            with open(path_simbolos, 'r', encoding='utf-8') as file:
+                for linha in file:
+                    self.por_texto[linha.rstrip("\n")] = len(self.simbolos)
+                    self.simbolos.append(linha.rstrip("\n"))
+        self.ficheiro_simbolos = open(path_simbolos, 'a', encoding='utf-8')
+
+        numeros = sorted(
+            int(nome[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+            for nome in os.listdir(self.diretorio)
+            if nome.startswith(SEGMENT_PREFIX) and nome.endswith(SEGMENT_SUFFIX)
+        )
+        for numero in numeros:
+            segmento = self._mapear(numero)
+            self.segmentos.append(segmento)
+            self.indices.append(self._indexar(segmento, self._contar_registos(segmento)))
+            self.proximo_numero = numero + 1
+
+        if self.segmentos:
+            self.atual = self.segmentos[-1]
+            self.ocupados = self._contar_registos(self.atual)
+            if self.ocupados:
+                self.ultimo_instante = REGISTO.unpack_from(self.atual, (self.ocupados - 1) * REGISTO.size)[0]
+        else:
+            self._novo_segmento()
+
+    def fechar(self):
+        """
+        Grava os segmentos em disco e liberta os mapas.
+
+        Parâmetros:
+        ----------
+        None
+
+        Retorno:
+        -------
+        None
+        """
+
+        with self.lock:
+            for segmento in self.segmentos:
+                segmento.flush()
+                try:
+                    segmento.close()
+                except BufferError:
+                    # ainda há leitores com vistas sobre o segmento: o mapa é libertado com elas
+                    pass
+            self.segmentos = []
+            self.indices = []
+            self.atual = None
+            if self.ficheiro_simbolos is not None:
+                self.ficheiro_simbolos.close()
+                self.ficheiro_simbolos = None
+
+    def sincronizar(self):
+        """
+        Força a escrita em disco do segmento em curso.
+
+        Parâmetros:
+        ----------
+        None
+
+        Retorno:
+        -------
+        None
+        """
+
+        with self.lock:
+            if self.atual is not None:
+                self.atual.flush()
+
+    def acrescentar(self, timestamp, device, task_id, metrica, valor):
+        """
+        Acrescenta uma medição ao armazenamento.
+
+        Parâmetros:
+        ----------
+        timestamp : float
+            O instante da medição (segundos desde a época). Um instante anterior ao último
+            registo é substituído por este, para manter os instantes não decrescentes.
+        device : str
+            O IP do agente.
+        task_id : str
+            O identificador da task.
+        metrica : str
+            O nome da métrica (ex: `"latency/8.8.8.8"`).
+        valor : float
+            O valor medido.
+
+        Retorno:
+        -------
+        None
+        """
+
+        with self.lock:
+            timestamp = max(timestamp, self.ultimo_instante)
+            registo = (timestamp, self._simbolo(device), self._simbolo(task_id), self._simbolo(metrica), valor)
+            if self.ocupados == self.registos_por_segmento:
+                self._novo_segmento()
+            REGISTO.pack_into(self.atual, self.ocupados * REGISTO.size, *registo)
+            if self.ocupados % self.passo_indice == 0:
+                self.indices[-1].append(timestamp)
+            self.ocupados += 1
+            self.ultimo_instante = timestamp
+
+    def nome(self, simbolo):
+        """
+        Devolve o texto de um símbolo.
+
+        Parâmetros:
+        ----------
+        simbolo : int
+            O índice na tabela de símbolos.
+
+        Retorno:
+        -------
+        str
+        """
+
+        return self.simbolos[simbolo]
+
+    def simbolo(self, texto):
+        """
+        Devolve o índice de um texto na tabela de símbolos, sem o acrescentar.
+
+        Parâmetros:
+        ----------
+        texto : str
+            O texto a procurar.
+
+        Retorno:
+        -------
+        int or None
+            O índice, ou None se o texto nunca foi guardado.
+        """
+
+        return self.por_texto.get(texto.translate(QUEBRAS_DE_LINHA))
+
+    def consultar(self, device=None, task_id=None, metrica=None, inicio=None, fim=None):
+        """
+        Percorre os registos que satisfazem os filtros, por ordem temporal.
+
+        Parâmetros:
+        ----------
+        device : str, opcional
+            O IP do agente.
+        task_id : str, opcional
+            O identificador da task.
+        metrica : str, opcional
+            O nome da métrica (ex: `"latency/8.8.8.8"`).
+        inicio : float, opcional
+            O instante inicial (inclusive).
+        fim : float, opcional
+            O instante final (inclusive).
+
+        Retorno:
+        -------
+        generator
+            Tuplos (timestamp, device, task_id, métrica, valor).
+        """
+
+        filtros = self._filtros(device, task_id, metrica)
+        if filtros is None:
+            return
+
+        with self.lock:
+            indices = [list(indice) for indice in self.indices]
+
+        simbolos = self.simbolos
+        for vista, indice in zip(self.vistas(), indices):
+            if not indice or (fim is not None and indice[0] > fim):
+                break
+
+            primeiro = 0
+            if inicio is not None:
+                primeiro = max(0, bisect.bisect_left(indice, inicio) - 1) * self.passo_indice
+                if primeiro * REGISTO.size >= len(vista):
+                    continue
+
+            for registo in REGISTO.iter_unpack(vista[primeiro * REGISTO.size:]):
+                if inicio is not None and registo[0] < inicio:
+                    continue
+                if fim is not None and registo[0] > fim:
+                    return
+                if all(registo[posicao] == simbolo for posicao, simbolo in filtros):
+                    yield registo[0], simbolos[registo[1]], simbolos[registo[2]], simbolos[registo[3]], registo[4]
+
+    def seguir(self, intervalo=FOLLOW_INTERVAL, **filtros):
+        """
+        Acompanha o armazenamento: devolve os registos acrescentados a partir de agora.
+
+        Parâmetros:
+        ----------
+        intervalo : float, opcional
+            O número de segundos entre verificações.
+        **filtros
+            Os filtros `device`, `task_id` e `metrica` de `consultar`.
+
+        Retorno:
+        -------
+        generator
+            Tuplos (timestamp, device, task_id, métrica, valor).
+        """
+
+        vistos = sum(len(vista) for vista in self.vistas()) // REGISTO.size
+
+        while True:
+            condicoes = self._filtros(**filtros)
+            restantes = vistos
+
+            for vista in self.vistas():
+                registos = len(vista) // REGISTO.size
+                if restantes >= registos:
+                    restantes -= registos
+                    continue
+
+                for registo in REGISTO.iter_unpack(vista[restantes * REGISTO.size:]):
+                    vistos += 1
+                    if condicoes is not None and all(registo[posicao] == simbolo for posicao, simbolo in condicoes):
+                        yield (registo[0], self.simbolos[registo[1]], self.simbolos[registo[2]],
+                               self.simbolos[registo[3]], registo[4])
+                restantes = 0
+
+            time.sleep(intervalo)
+
+    def vistas(self):
+        """
+        Devolve vistas, sem cópia, sobre os registos escritos de cada segmento.
+
+        Parâmetros:
+        ----------
+        None
+
+        Retorno:
+        -------
+        list
+            Uma `memoryview` por segmento, com um múltiplo de `REGISTO.size` bytes.
+        """
+
+        with self.lock:
+            vistas = [memoryview(segmento) for segmento in self.segmentos[:-1]]
+            vistas = [vista[:self._contar_registos(vista) * REGISTO.size] for vista in vistas]
+            vistas.append(memoryview(self.atual)[:self.ocupados * REGISTO.size])
+        return vistas
+
+    def registos(self):
+        """
+        Percorre todos os registos, por ordem de escrita, com os símbolos já resolvidos.
+
+        Parâmetros:
+        ----------
+        None
+
+        Retorno:
+        -------
+        generator
+            Tuplos (timestamp, device, task_id, métrica, valor).
+        """
+
+        simbolos = self.simbolos
+        for vista in self.vistas():
+            for timestamp, device, task_id, metrica, valor in REGISTO.iter_unpack(vista):
+                yield timestamp, simbolos[device], simbolos[task_id], simbolos[metrica], valor
+
+    def _filtros(self, device=None, task_id=None, metrica=None):
+        # (posição no registo, símbolo) de cada filtro; None se algum texto nunca foi guardado
+        filtros = []
+        for posicao, texto in ((1, device), (2, task_id), (3, metrica)):
+            if texto is not None:
+                simbolo = self.simbolo(texto)
+                if simbolo is None:
+                    return None
+                filtros.append((posicao, simbolo))
+        return filtros
+
+    def _simbolo(self, texto):
+        # normalizado antes da procura, para que a tabela em memória coincida com a que é lida do disco
+        texto = texto.translate(QUEBRAS_DE_LINHA)
+        indice = self.por_texto.get(texto)
+        if indice is None:
+            indice = len(self.simbolos)
+            self.ficheiro_simbolos.write(texto + "\n")
+            self.ficheiro_simbolos.flush()
+            self.simbolos.append(texto)
+            self.por_texto[texto] = indice
+        return indice
+
+    def _path_segmento(self, numero):
+        return os.path.join(self.diretorio, f"{SEGMENT_PREFIX}{numero:06d}{SEGMENT_SUFFIX}")
+
+    def _mapear(self, numero):
+        with open(self._path_segmento(numero), 'r+b') as file:
+            if os.fstat(file.fileno()).st_size < self.tamanho_segmento:
+                file.truncate(self.tamanho_segmento)
+            return mmap.mmap(file.fileno(), self.tamanho_segmento)
+
+    def _novo_segmento(self):
+        numero = self.proximo_numero
+        self.proximo_numero += 1
+        with open(self._path_segmento(numero), 'wb') as file:
+            file.truncate(self.tamanho_segmento)
+        self.atual = self._mapear(numero)
+        self.segmentos.append(self.atual)
+        self.indices.append([])
+        self.ocupados = 0
+
+    def _indexar(self, segmento, ocupados):
+        return [REGISTO.unpack_from(segmento, posicao * REGISTO.size)[0]
+                for posicao in range(0, ocupados, self.passo_indice)]
+
+    def _contar_registos(self, segmento):
+        # os registos ocupam o início do segmento: procura binária do primeiro com instante 0
+        inicio, fim = 0, len(segmento) // REGISTO.size
+        while inicio < fim:
+            meio = (inicio + fim) // 2
+            if REGISTO.unpack_from(segmento, meio * REGISTO.size)[0] == 0:
+                fim = meio
+            else:
+                inicio = meio + 1
+        return inicio